@@ -46,6 +46,91 @@ backup_config() {
     log "Configuration backed up to $BACKUP_FILE"
 }
 
+# Pick the bandwidth accounting backend: PROXY_ACCT_BACKEND=nft|iptables, or auto-detect
+accounting_backend() {
+    case "${PROXY_ACCT_BACKEND:-auto}" in
+        nft|iptables)
+            echo "$PROXY_ACCT_BACKEND"
+            ;;
+        *)
+            if command -v nft &>/dev/null && nft list tables &>/dev/null; then
+                echo "nft"
+            else
+                echo "iptables"
+            fi
+            ;;
+    esac
+}
+
+# Backend already counting this user, if any. Re-runs (e.g. a password change) keep it,
+# since switching would restart their byte counters at zero and orphan the old rules.
+existing_accounting_backend() {
+    local username="$1"
+    if iptables -t mangle -nL "PROXY_USER_${username}_OUT" &>/dev/null || \
+        iptables -nL "PROXY_USER_${username}" &>/dev/null; then
+        echo "iptables"
+    elif command -v nft &>/dev/null && nft list counter inet proxy_acct "proxy_${username}_out" &>/dev/null; then
+        echo "nft"
+    fi
+}
+
+# nftables accounting: one uid->counter map lookup per packet regardless of user count
+setup_nft_accounting() {
+    local username="$1"
+    local uid="$2"
+
+    if ! nft list table inet proxy_acct &>/dev/null; then
+        nft -f - <<'NFT' || return 1
+table inet proxy_acct {
+    map uid_mark { type uid : mark; }
+    map user_out { type uid : counter; }
+    map user_in { type mark : counter; }
+    chain output {
+        type filter hook output priority mangle; policy accept;
+        ct mark set meta skuid map @uid_mark
+        counter name meta skuid map @user_out
+    }
+    chain input {
+        type filter hook input priority mangle; policy accept;
+        counter name ct mark map @user_in
+    }
+}
+NFT
+    fi
+
+    nft add counter inet proxy_acct "proxy_${username}_out" 2>/dev/null || true
+    nft add counter inet proxy_acct "proxy_${username}_in" 2>/dev/null || true
+    nft add element inet proxy_acct uid_mark "{ $uid : $uid }" 2>/dev/null || true
+    nft add element inet proxy_acct user_out "{ $uid : \"proxy_${username}_out\" }" 2>/dev/null || true
+    nft add element inet proxy_acct user_in "{ $uid : \"proxy_${username}_in\" }" 2>/dev/null || true
+}
+
+# iptables accounting: per-user chains in the mangle table (plus the legacy filter chain)
+setup_iptables_accounting() {
+    local USERNAME="$1"
+    local USER_UID="$2"
+
+    iptables -N "PROXY_USER_${USERNAME}" 2>/dev/null || true
+    iptables -C OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}" 2>/dev/null || \
+        iptables -A OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}" 2>/dev/null || true
+
+    iptables -t mangle -N "PROXY_USER_${USERNAME}_OUT" 2>/dev/null || true
+    iptables -t mangle -N "PROXY_USER_${USERNAME}_IN" 2>/dev/null || true
+
+    iptables -t mangle -C OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}_OUT" 2>/dev/null || \
+        iptables -t mangle -A OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}_OUT" 2>/dev/null || true
+    iptables -t mangle -C INPUT -m connmark --mark "$USER_UID" -j "PROXY_USER_${USERNAME}_IN" 2>/dev/null || \
+        iptables -t mangle -A INPUT -m connmark --mark "$USER_UID" -j "PROXY_USER_${USERNAME}_IN" 2>/dev/null || true
+
+    iptables -t mangle -C "PROXY_USER_${USERNAME}_OUT" -m owner --uid-owner "$USERNAME" -j CONNMARK --set-mark "$USER_UID" 2>/dev/null || \
+        iptables -t mangle -A "PROXY_USER_${USERNAME}_OUT" -m owner --uid-owner "$USERNAME" -j CONNMARK --set-mark "$USER_UID" 2>/dev/null || true
+    iptables -t mangle -C "PROXY_USER_${USERNAME}_OUT" -j RETURN 2>/dev/null || \
+        iptables -t mangle -A "PROXY_USER_${USERNAME}_OUT" -j RETURN 2>/dev/null || true
+
+    iptables -t mangle -C "PROXY_USER_${USERNAME}_IN" -m connmark --mark "$USER_UID" -j RETURN 2>/dev/null || \
+        iptables -t mangle -A "PROXY_USER_${USERNAME}_IN" -m connmark --mark "$USER_UID" -j RETURN 2>/dev/null || true
+}
+
 # Main script
 main() {
     log "=== SSH SOCKS Proxy - Add User v$SCRIPT_VERSION ==="
@@ -147,29 +232,17 @@ EOF
         exit 1
     fi
 
-    # Add iptables accounting for bandwidth tracking (legacy chain)
-    iptables -N "PROXY_USER_${USERNAME}" 2>/dev/null || true
-    iptables -C OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}" 2>/dev/null || \
-        iptables -A OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}" 2>/dev/null || true
-
-    # Per-user upload/download accounting via connmark (mangle table)
+    # Per-user bandwidth accounting: nftables maps when available, iptables chains otherwise
     USER_UID="$(id -u "$USERNAME" 2>/dev/null || true)"
     if [ -n "$USER_UID" ]; then
-        iptables -t mangle -N "PROXY_USER_${USERNAME}_OUT" 2>/dev/null || true
-        iptables -t mangle -N "PROXY_USER_${USERNAME}_IN" 2>/dev/null || true
-
-        iptables -t mangle -C OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}_OUT" 2>/dev/null || \
-            iptables -t mangle -A OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}_OUT" 2>/dev/null || true
-        iptables -t mangle -C INPUT -m connmark --mark "$USER_UID" -j "PROXY_USER_${USERNAME}_IN" 2>/dev/null || \
-            iptables -t mangle -A INPUT -m connmark --mark "$USER_UID" -j "PROXY_USER_${USERNAME}_IN" 2>/dev/null || true
-
-        iptables -t mangle -C "PROXY_USER_${USERNAME}_OUT" -m owner --uid-owner "$USERNAME" -j CONNMARK --set-mark "$USER_UID" 2>/dev/null || \
-            iptables -t mangle -A "PROXY_USER_${USERNAME}_OUT" -m owner --uid-owner "$USERNAME" -j CONNMARK --set-mark "$USER_UID" 2>/dev/null || true
-        iptables -t mangle -C "PROXY_USER_${USERNAME}_OUT" -j RETURN 2>/dev/null || \
-            iptables -t mangle -A "PROXY_USER_${USERNAME}_OUT" -j RETURN 2>/dev/null || true
-
-        iptables -t mangle -C "PROXY_USER_${USERNAME}_IN" -m connmark --mark "$USER_UID" -j RETURN 2>/dev/null || \
-            iptables -t mangle -A "PROXY_USER_${USERNAME}_IN" -m connmark --mark "$USER_UID" -j RETURN 2>/dev/null || true
+        ACCT_BACKEND="$(existing_accounting_backend "$USERNAME")"
+        [ -n "$ACCT_BACKEND" ] || ACCT_BACKEND="$(accounting_backend)"
+        if [ "$ACCT_BACKEND" = "nft" ] && setup_nft_accounting "$USERNAME" "$USER_UID"; then
+            log "Bandwidth accounting for $USERNAME: nftables"
+        else
+            setup_iptables_accounting "$USERNAME" "$USER_UID"
+            log "Bandwidth accounting for $USERNAME: iptables"
+        fi
     fi
 
     log "User $USERNAME added successfully"
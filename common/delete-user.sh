@@ -67,6 +67,9 @@ main() {
     pkill -9 -u "$USERNAME" || true
     sleep 1
 
+    # Resolve the UID now; it is needed for accounting cleanup after the account is gone
+    USER_UID="$(id -u "$USERNAME" 2>/dev/null || true)"
+
     echo "Removing user account..."
     userdel -r "$USERNAME" 2>/dev/null || deluser --remove-home "$USERNAME" 2>/dev/null || {
         log "WARN: Could not remove system user $USERNAME, continuing with config cleanup"
@@ -102,7 +105,6 @@ main() {
     iptables -X "PROXY_USER_${USERNAME}" 2>/dev/null || true
 
     # Remove per-user connmark rules (mangle table)
-    USER_UID="$(id -u "$USERNAME" 2>/dev/null || true)"
     if [ -n "$USER_UID" ]; then
         iptables -t mangle -D OUTPUT -m owner --uid-owner "$USERNAME" -j "PROXY_USER_${USERNAME}_OUT" 2>/dev/null || true
         iptables -t mangle -D INPUT -m connmark --mark "$USER_UID" -j "PROXY_USER_${USERNAME}_IN" 2>/dev/null || true
@@ -112,6 +114,17 @@ main() {
     iptables -t mangle -F "PROXY_USER_${USERNAME}_IN" 2>/dev/null || true
     iptables -t mangle -X "PROXY_USER_${USERNAME}_IN" 2>/dev/null || true
 
+    # Remove nftables accounting map entries and counters
+    if command -v nft &>/dev/null && nft list table inet proxy_acct &>/dev/null; then
+        if [ -n "$USER_UID" ]; then
+            nft delete element inet proxy_acct user_out "{ $USER_UID }" 2>/dev/null || true
+            nft delete element inet proxy_acct user_in "{ $USER_UID }" 2>/dev/null || true
+            nft delete element inet proxy_acct uid_mark "{ $USER_UID }" 2>/dev/null || true
+        fi
+        nft delete counter inet proxy_acct "proxy_${USERNAME}_out" 2>/dev/null || true
+        nft delete counter inet proxy_acct "proxy_${USERNAME}_in" 2>/dev/null || true
+    fi
+
     # Remove user info file
     rm -f "/root/proxy-users/$USERNAME.txt"
 
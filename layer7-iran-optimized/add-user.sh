@@ -64,13 +64,16 @@ else
       "$CONFIG" > /tmp/xray.json
     mv /tmp/xray.json "$CONFIG"
 
-    systemctl restart xray
-
-    sleep 2
-    if ! systemctl is-active --quiet xray; then
-        log "ERROR: Xray failed to restart after adding user"
-        echo "Error: Xray failed to restart"
-        exit 1
+    # The panel adds the client to the running xray through the API instead
+    if [ -z "$XRAY_NO_RESTART" ]; then
+        systemctl restart xray
+
+        sleep 2
+        if ! systemctl is-active --quiet xray; then
+            log "ERROR: Xray failed to restart after adding user"
+            echo "Error: Xray failed to restart"
+            exit 1
+        fi
     fi
 
     EXISTING=false
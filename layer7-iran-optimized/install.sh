@@ -223,7 +223,7 @@ HOOK
   "stats": {},
   "api": {
     "tag": "api",
-    "services": ["StatsService"]
+    "services": ["StatsService", "HandlerService"]
   },
   "policy": {
     "levels": {
@@ -234,7 +234,8 @@ HOOK
         "downlinkOnly": 5,
         "bufferSize": 16,
         "statsUserUplink": true,
-        "statsUserDownlink": true
+        "statsUserDownlink": true,
+        "statsUserOnline": true
       }
     },
     "system": {
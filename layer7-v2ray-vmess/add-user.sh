@@ -63,17 +63,20 @@ else
 
     mv /tmp/xray.json "$CONFIG"
 
-    # Restart Xray
-    systemctl restart xray
-
-    # Verify Xray is running
-    sleep 2
-    if ! systemctl is-active --quiet xray; then
-        log "ERROR: Xray failed to restart after adding user"
-        echo "Error: Xray failed to restart"
-        echo "Restoring previous config..."
-        # Note: Should have backup, but for now just notify
-        exit 1
+    # The panel adds the client to the running xray through the API instead
+    if [ -z "$XRAY_NO_RESTART" ]; then
+        # Restart Xray
+        systemctl restart xray
+
+        # Verify Xray is running
+        sleep 2
+        if ! systemctl is-active --quiet xray; then
+            log "ERROR: Xray failed to restart after adding user"
+            echo "Error: Xray failed to restart"
+            echo "Restoring previous config..."
+            # Note: Should have backup, but for now just notify
+            exit 1
+        fi
     fi
 
     EXISTING=false
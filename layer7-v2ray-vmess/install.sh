@@ -153,7 +153,7 @@ cat > /usr/local/etc/xray/config.json <<EOF
   "stats": {},
   "api": {
     "tag": "api",
-    "services": ["StatsService"]
+    "services": ["StatsService", "HandlerService"]
   },
   "policy": {
     "levels": {
@@ -164,7 +164,8 @@ cat > /usr/local/etc/xray/config.json <<EOF
         "downlinkOnly": 5,
         "bufferSize": 16,
         "statsUserUplink": true,
-        "statsUserDownlink": true
+        "statsUserDownlink": true,
+        "statsUserOnline": true
       }
     },
     "system": {
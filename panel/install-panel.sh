@@ -202,7 +202,9 @@ fi
 
 if [ ! -f "$PANEL_DIR/certs/panel.pem" ]; then
     log_msg "Generating self-signed TLS certificate..."
+    # P-256 key: ECDSA handshakes cost far less CPU than RSA on small VPSes
     openssl req -new -x509 -nodes -days 3650 \
+        -newkey ec -pkeyopt ec_paramgen_curve:prime256v1 \
         -keyout "$PANEL_DIR/certs/panel.key" \
         -out "$PANEL_DIR/certs/panel.pem" \
         -subj "/CN=proxy-panel/O=Proxy/C=US" \
@@ -280,13 +282,14 @@ if [[ "$LAYER" == layer7-* ]]; then
                 "stats": {},
                 "api": {
                     "tag": "api",
-                    "services": ["StatsService"]
+                    "services": ["StatsService", "HandlerService"]
                 },
                 "policy": {
                     "levels": {
                         "0": {
                             "statsUserUplink": true,
-                            "statsUserDownlink": true
+                            "statsUserDownlink": true,
+                            "statsUserOnline": true
                         }
                     },
                     "system": {
@@ -4,11 +4,17 @@ Proxy Management Panel - Web-based CRM for proxy user management.
 Zero external dependencies - uses only Python3 standard library.
 """
 
+import asyncio
+import gzip
+import http.client
 import http.server
+import io
 import socketserver
+import socket
 import ssl
 import json
 import os
+import sqlite3
 import sys
 import subprocess
 import time
@@ -16,15 +22,19 @@ import hmac
 import hashlib
 import base64
 import threading
+import queue
 import re
 import crypt
+import pwd
 import struct
+import fcntl
 import ctypes
 import ctypes.util
 from urllib.parse import urlparse, parse_qs, unquote
 from pathlib import Path
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # ─── Configuration ────────────────────────────────────────────────────────────
 
@@ -100,6 +110,148 @@ def log(message, level="INFO"):
         pass
     print(line)
 
+# ─── Metrics ──────────────────────────────────────────────────────────────────
+
+class Histogram:
+    """Thread-safe latency histogram keyed by one label, in Prometheus bucket layout."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets or self.BUCKETS
+        self._lock = threading.Lock()
+        self._series = {}  # label -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, label, seconds):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def snapshot(self):
+        """{label: (cumulative bucket counts incl. +Inf, count, sum)}."""
+        with self._lock:
+            series = {label: list(values) for label, values in self._series.items()}
+        result = {}
+        for label, values in series.items():
+            cumulative, running = [], 0
+            for count in values[:-1]:
+                running += count
+                cumulative.append(running)
+            result[label] = (cumulative, running, values[-1])
+        return result
+
+    def quantile(self, q, buckets, count):
+        """Estimate the q-quantile from one snapshot series by linear interpolation in its bucket."""
+        if not count:
+            return 0.0
+        rank = q * count
+        lower, below = 0.0, 0
+        for bound, cumulative in zip(self.buckets, buckets):
+            if cumulative >= rank:
+                in_bucket = cumulative - below
+                return lower + (bound - lower) * ((rank - below) / in_bucket if in_bucket else 1)
+            lower, below = bound, cumulative
+        # Beyond the last bucket: all we know is that it is above it
+        return self.buckets[-1]
+
+SUBPROCESS_LATENCY = Histogram()
+COLLECTOR_DURATION = Histogram()
+JSON_GZIP_CPU = Histogram((0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+JSON_BYTES = Counter()  # "raw" / "sent" bytes of JSON API responses
+_json_bytes_lock = threading.Lock()
+
+# Set by the asyncio engine; commands then run on its event loop
+_subprocess_runner = None
+
+def run_command(args, **kwargs):
+    """subprocess.run that records its wall time in SUBPROCESS_LATENCY."""
+    name = os.path.basename(args[0])
+    if name in ("bash", "sh") and len(args) > 1:
+        name = os.path.basename(args[1])
+    started = time.monotonic()
+    try:
+        if _subprocess_runner and _subprocess_runner.accepts(kwargs):
+            return _subprocess_runner.run(args, **kwargs)
+        return subprocess.run(args, **kwargs)
+    finally:
+        SUBPROCESS_LATENCY.observe(name, time.monotonic() - started)
+
+# ─── Response Cache ───────────────────────────────────────────────────────────
+
+class ResponseCache:
+    """TTL cache for computed API payloads with single-flight computation.
+
+    Callers asking for a key that is missing or stale while it is already
+    being computed wait for that computation instead of starting their own.
+    Keys are a name or a (name, ...) tuple; the name selects the TTL.
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, ttls):
+        self.ttls = ttls
+        self.stats = Counter()  # hits / misses / coalesced
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> (expires, value)
+        self._inflight = {}  # key -> {"done": Event, "value", "error"}
+
+    def get(self, key, compute):
+        name = key[0] if isinstance(key, tuple) else key
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.stats["hits"] += 1
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                self.stats["misses"] += 1
+                flight = self._inflight[key] = {"done": threading.Event(), "value": None, "error": None}
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            try:
+                flight["value"] = compute()
+            except Exception as e:
+                flight["error"] = e
+            finally:
+                with self._lock:
+                    # Invalidated meanwhile: hand the result to waiters, don't cache it
+                    if self._inflight.get(key) is flight:
+                        del self._inflight[key]
+                        if flight["error"] is None:
+                            self._entries[key] = (time.monotonic() + self.ttls[name], flight["value"])
+                flight["done"].set()
+        else:
+            flight["done"].wait()
+
+        if flight["error"] is not None:
+            raise flight["error"]
+        return flight["value"]
+
+    def invalidate(self, *names):
+        """Drop cached and in-flight entries for the given names, or everything."""
+        with self._lock:
+            for store in (self._entries, self._inflight):
+                for key in list(store):
+                    if not names or (key[0] if isinstance(key, tuple) else key) in names:
+                        del store[key]
+
+RESPONSE_CACHE = ResponseCache({
+    "users": 5,
+    "system_info": 5,
+    "system_bandwidth": 10,
+    "connections": 2,
+})
+
 # ─── Config Management ───────────────────────────────────────────────────────
 
 class Config:
@@ -112,6 +264,27 @@ class Config:
         self.user_management = "ssh"
         self.xray_stats_port = 10085
         self.scripts_dir = "/opt/proxy-panel/scripts"
+        self.bandwidth_interval = 300
+        self.bandwidth_active_interval = 15
+        self.throughput_interval = 5
+        self.throughput_samples = 60
+        self.system_sample_interval = 5
+        self.system_samples = 720
+        self.egress_interface = ""
+        self.vnstat_import = True
+        self.metrics_token = ""
+        self.metrics_port = 0
+        self.metrics_bind = "127.0.0.1"
+        self.server_mode = "pool"
+        self.max_event_streams = 256
+        self.http_workers = 32
+        self.http_queue = 128
+        self.http_idle_timeout = 15
+        self.http_keepalive_timeout = 5
+        self.subprocess_limit = 8
+        self.tls_ticket_rotation = 43200
+        self.json_gzip_level = 6
+        self.json_gzip_min_size = 1024
 
     @classmethod
     def load(cls):
@@ -137,6 +310,27 @@ class Config:
             "user_management": self.user_management,
             "xray_stats_port": self.xray_stats_port,
             "scripts_dir": self.scripts_dir,
+            "bandwidth_interval": self.bandwidth_interval,
+            "bandwidth_active_interval": self.bandwidth_active_interval,
+            "throughput_interval": self.throughput_interval,
+            "throughput_samples": self.throughput_samples,
+            "system_sample_interval": self.system_sample_interval,
+            "system_samples": self.system_samples,
+            "egress_interface": self.egress_interface,
+            "vnstat_import": self.vnstat_import,
+            "metrics_token": self.metrics_token,
+            "metrics_port": self.metrics_port,
+            "metrics_bind": self.metrics_bind,
+            "server_mode": self.server_mode,
+            "max_event_streams": self.max_event_streams,
+            "http_workers": self.http_workers,
+            "http_queue": self.http_queue,
+            "http_idle_timeout": self.http_idle_timeout,
+            "http_keepalive_timeout": self.http_keepalive_timeout,
+            "subprocess_limit": self.subprocess_limit,
+            "tls_ticket_rotation": self.tls_ticket_rotation,
+            "json_gzip_level": self.json_gzip_level,
+            "json_gzip_min_size": self.json_gzip_min_size,
         }
         CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
         with open(CONFIG_FILE, "w") as f:
@@ -191,7 +385,7 @@ class Authenticator:
         if username == "root":
             return True
         try:
-            result = subprocess.run(
+            result = run_command(
                 ["id", "-Gn", username],
                 capture_output=True, text=True, timeout=5
             )
@@ -225,7 +419,7 @@ class Authenticator:
 
         # Fallback: use su command
         try:
-            proc = subprocess.run(
+            proc = run_command(
                 ["su", "-c", "true", username],
                 input=password + "\n",
                 capture_output=True, text=True, timeout=10
@@ -269,12 +463,721 @@ class SessionManager:
         except Exception:
             return None
 
+# ─── Xray gRPC API Client ─────────────────────────────────────────────────────
+
+# HPACK (RFC 7541) static table, indices 1..61
+HPACK_STATIC_TABLE = [
+    (":authority", ""), (":method", "GET"), (":method", "POST"), (":path", "/"),
+    (":path", "/index.html"), (":scheme", "http"), (":scheme", "https"),
+    (":status", "200"), (":status", "204"), (":status", "206"), (":status", "304"),
+    (":status", "400"), (":status", "404"), (":status", "500"),
+    ("accept-charset", ""), ("accept-encoding", "gzip, deflate"),
+    ("accept-language", ""), ("accept-ranges", ""), ("accept", ""),
+    ("access-control-allow-origin", ""), ("age", ""), ("allow", ""),
+    ("authorization", ""), ("cache-control", ""), ("content-disposition", ""),
+    ("content-encoding", ""), ("content-language", ""), ("content-length", ""),
+    ("content-location", ""), ("content-range", ""), ("content-type", ""),
+    ("cookie", ""), ("date", ""), ("etag", ""), ("expect", ""), ("expires", ""),
+    ("from", ""), ("host", ""), ("if-match", ""), ("if-modified-since", ""),
+    ("if-none-match", ""), ("if-range", ""), ("if-unmodified-since", ""),
+    ("last-modified", ""), ("link", ""), ("location", ""), ("max-forwards", ""),
+    ("proxy-authenticate", ""), ("proxy-authorization", ""), ("range", ""),
+    ("referer", ""), ("refresh", ""), ("retry-after", ""), ("server", ""),
+    ("set-cookie", ""), ("strict-transport-security", ""),
+    ("transfer-encoding", ""), ("user-agent", ""), ("vary", ""), ("via", ""),
+    ("www-authenticate", ""),
+]
+
+# HPACK Huffman code lengths for symbols 0..256 (EOS), encoded as chr(ord("a") + bits - 5).
+# The code is canonical, so the codes themselves are rebuilt from the lengths.
+HPACK_HUFFMAN_LENGTHS = (
+    "isxxxxxxxtzxxzxxxxxxxxzxxxxxxxxxbffhibdgffdgdbbbaaabbbbbbbcdkbhfibcccccc"
+    "ccccccccccccccccdcdioijbkabababbbaccbbbabcbaabccccckgjixprpprrrsrsssssts"
+    "ttrstssssqrsrsstrqprrssqsrrtqrssqqrqsrssprrrsrrsvvporsruvvvwwvtuoqvwwvwt"
+    "qqvvxwwwptpqrqqsrruuttvsvwvvwwwwwxwwwwwvz"
+)
+
+def _build_huffman_decode_table():
+    lengths = [ord(c) - ord("a") + 5 for c in HPACK_HUFFMAN_LENGTHS]
+    # A complete prefix code over 257 symbols: the Kraft sum is exactly 1
+    if len(lengths) != 257 or sum(1 << (30 - n) for n in lengths) != 1 << 30:
+        raise ValueError("HPACK_HUFFMAN_LENGTHS is not the RFC 7541 Appendix B code")
+    table = {}
+    code = 0
+    prev_len = 0
+    for sym in sorted(range(len(lengths)), key=lambda s: (lengths[s], s)):
+        code <<= lengths[sym] - prev_len
+        prev_len = lengths[sym]
+        table[(code, prev_len)] = sym
+        code += 1
+    return table
+
+_HUFFMAN_DECODE = _build_huffman_decode_table()
+
+def _huffman_decode(data):
+    out = bytearray()
+    code = 0
+    length = 0
+    for byte in data:
+        for shift in range(7, -1, -1):
+            code = (code << 1) | ((byte >> shift) & 1)
+            length += 1
+            sym = _HUFFMAN_DECODE.get((code, length))
+            if sym is not None:
+                if sym == 256:
+                    raise ValueError("EOS in huffman string")
+                out.append(sym)
+                code = 0
+                length = 0
+    # Padding is the most significant bits of EOS: up to 7 one bits
+    if length > 7 or code != (1 << length) - 1:
+        raise ValueError("invalid huffman padding")
+    return bytes(out)
+
+def _hpack_str_len(length):
+    """HPACK string length with a 7-bit prefix (huffman bit clear)."""
+    if length < 0x7F:
+        return bytes([length])
+    out = bytearray([0x7F])
+    length -= 0x7F
+    while length >= 0x80:
+        out.append((length & 0x7F) | 0x80)
+        length >>= 7
+    out.append(length)
+    return bytes(out)
+
+class HpackDecoder:
+    """Minimal HPACK header block decoder (dynamic table + huffman strings)."""
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.dynamic = []
+        self.size = 0
+
+    @staticmethod
+    def _read_int(data, pos, prefix):
+        mask = (1 << prefix) - 1
+        value = data[pos] & mask
+        pos += 1
+        if value < mask:
+            return value, pos
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value += (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, pos
+
+    def _read_str(self, data, pos):
+        huffman = data[pos] & 0x80
+        length, pos = self._read_int(data, pos, 7)
+        raw = bytes(data[pos:pos + length])
+        pos += length
+        if huffman:
+            raw = _huffman_decode(raw)
+        return raw.decode("latin-1"), pos
+
+    def _lookup(self, index):
+        if index <= 0:
+            raise ValueError("invalid header index 0")
+        if index <= len(HPACK_STATIC_TABLE):
+            return HPACK_STATIC_TABLE[index - 1]
+        return self.dynamic[index - len(HPACK_STATIC_TABLE) - 1]
+
+    def _evict(self):
+        while self.size > self.max_size and self.dynamic:
+            name, value = self.dynamic.pop()
+            self.size -= len(name) + len(value) + 32
+
+    def _add(self, name, value):
+        self.dynamic.insert(0, (name, value))
+        self.size += len(name) + len(value) + 32
+        self._evict()
+
+    def decode(self, data):
+        headers = []
+        pos = 0
+        while pos < len(data):
+            byte = data[pos]
+            if byte & 0x80:
+                index, pos = self._read_int(data, pos, 7)
+                headers.append(self._lookup(index))
+                continue
+            if byte & 0xE0 == 0x20:
+                self.max_size, pos = self._read_int(data, pos, 5)
+                self._evict()
+                continue
+            indexing = byte & 0xC0 == 0x40
+            index, pos = self._read_int(data, pos, 6 if indexing else 4)
+            if index:
+                name = self._lookup(index)[0]
+            else:
+                name, pos = self._read_str(data, pos)
+            value, pos = self._read_str(data, pos)
+            if indexing:
+                self._add(name, value)
+            headers.append((name, value))
+        return headers
+
+def _pb_varint(value):
+    out = bytearray()
+    value &= (1 << 64) - 1
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _pb_field(number, value):
+    """Encode one protobuf field. Strings/bytes are length-delimited, ints/bools are varints."""
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, (bytes, bytearray)):
+        return _pb_varint(number << 3 | 2) + _pb_varint(len(value)) + bytes(value)
+    return _pb_varint(number << 3) + _pb_varint(int(value))
+
+def _pb_message(*fields):
+    """Encode (number, value) pairs, skipping proto3 default values."""
+    return b"".join(_pb_field(n, v) for n, v in fields if v not in (None, "", b"", 0, False))
+
+def _pb_decode(data):
+    """Decode a protobuf message into {field_number: [values]} (varints as int, rest as bytes)."""
+    fields = defaultdict(list)
+    pos = 0
+    while pos < len(data):
+        key, pos = _pb_read_varint(data, pos)
+        number, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _pb_read_varint(data, pos)
+        elif wire == 2:
+            length, pos = _pb_read_varint(data, pos)
+            value = bytes(data[pos:pos + length])
+            pos += length
+        elif wire == 1:
+            value = struct.unpack_from("<q", data, pos)[0]
+            pos += 8
+        elif wire == 5:
+            value = struct.unpack_from("<i", data, pos)[0]
+            pos += 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire}")
+        fields[number].append(value)
+    return fields
+
+def _pb_read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+def _pb_int64(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _pb_typed_message(type_name, payload):
+    """xray.common.serial.TypedMessage"""
+    return _pb_message((1, type_name), (2, payload))
+
+class XrayApiError(Exception):
+    """Raised when an Xray API call fails (transport error or non-OK grpc-status)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class XrayApiClient:
+    """Persistent gRPC client for the Xray API (StatsService, HandlerService).
+
+    Speaks HTTP/2 over a single long-lived plaintext connection to the
+    dokodemo-door API inbound, so each call is one request/response on an
+    open socket instead of spawning the `xray` CLI. Calls are serialized
+    with a lock; the connection is re-established after any error.
+    """
+
+    H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+    FRAME_DATA, FRAME_HEADERS, FRAME_RST_STREAM, FRAME_SETTINGS = 0x0, 0x1, 0x3, 0x4
+    FRAME_PING, FRAME_GOAWAY, FRAME_WINDOW_UPDATE, FRAME_CONTINUATION = 0x6, 0x7, 0x8, 0x9
+    FLAG_END_STREAM, FLAG_ACK, FLAG_END_HEADERS, FLAG_PADDED, FLAG_PRIORITY = 0x1, 0x1, 0x4, 0x8, 0x20
+    STREAM_WINDOW = 1 << 24
+
+    STATS_SERVICE = "/xray.app.stats.command.StatsService"
+    HANDLER_SERVICE = "/xray.app.proxyman.command.HandlerService"
+
+    def __init__(self, host="127.0.0.1", port=10085, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._buf = b""
+        self._next_stream = 1
+        self._hpack = None
+
+    # ── Connection ────────────────────────────────────────────────────────
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._buf = b""
+        self._next_stream = 1
+        self._hpack = HpackDecoder()
+        # SETTINGS: ENABLE_PUSH=0, INITIAL_WINDOW_SIZE=STREAM_WINDOW
+        settings = struct.pack(">HI", 0x2, 0) + struct.pack(">HI", 0x4, self.STREAM_WINDOW)
+        sock.sendall(
+            self.H2_PREFACE
+            + self._frame(self.FRAME_SETTINGS, 0, 0, settings)
+            + self._frame(self.FRAME_WINDOW_UPDATE, 0, 0, struct.pack(">I", self.STREAM_WINDOW))
+        )
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+    @staticmethod
+    def _frame(ftype, flags, stream_id, payload=b""):
+        return struct.pack(">I", len(payload))[1:] + struct.pack(">BBI", ftype, flags, stream_id) + payload
+
+    def _recv_exact(self, n):
+        while len(self._buf) < n:
+            chunk = self._sock.recv(max(65536, n - len(self._buf)))
+            if not chunk:
+                raise ConnectionError("xray API connection closed")
+            self._buf += chunk
+        data, self._buf = self._buf[:n], self._buf[n:]
+        return data
+
+    def _read_frame(self):
+        header = self._recv_exact(9)
+        length = int.from_bytes(header[:3], "big")
+        ftype, flags, stream_id = struct.unpack(">BBI", header[3:])
+        return ftype, flags, stream_id & 0x7FFFFFFF, self._recv_exact(length)
+
+    # ── gRPC call ─────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _literal_header(name, value):
+        # Literal header field without indexing, new name, no huffman
+        name, value = name.encode(), value.encode()
+        return b"\x00" + _hpack_str_len(len(name)) + name + _hpack_str_len(len(value)) + value
+
+    def call(self, method, request):
+        """Perform one unary gRPC call and return the raw response message bytes."""
+        with self._lock:
+            for attempt in (1, 2):
+                fresh = self._sock is None
+                try:
+                    if fresh:
+                        self._connect()
+                    return self._call(method, request)
+                except XrayApiError:
+                    raise
+                except (OSError, ValueError, IndexError, struct.error) as e:
+                    self._close()
+                    # A reused connection may have been dropped by xray; retry once on a new one
+                    if fresh or attempt == 2:
+                        raise XrayApiError(f"xray API call {method} failed: {e}") from e
+
+    def _call(self, method, request):
+        stream_id = self._next_stream
+        self._next_stream += 2
+        block = (
+            b"\x83\x86"  # :method POST, :scheme http
+            + self._literal_header(":path", method)
+            + self._literal_header(":authority", f"{self.host}:{self.port}")
+            + self._literal_header("content-type", "application/grpc")
+            + self._literal_header("te", "trailers")
+        )
+        message = b"\x00" + struct.pack(">I", len(request)) + request
+        self._sock.sendall(
+            self._frame(self.FRAME_HEADERS, self.FLAG_END_HEADERS, stream_id, block)
+            + self._frame(self.FRAME_DATA, self.FLAG_END_STREAM, stream_id, message)
+        )
+
+        body = bytearray()
+        headers = {}
+        header_block = b""
+        while True:
+            ftype, flags, sid, payload = self._read_frame()
+            if ftype == self.FRAME_SETTINGS:
+                if not flags & self.FLAG_ACK:
+                    self._sock.sendall(self._frame(self.FRAME_SETTINGS, self.FLAG_ACK, 0))
+                continue
+            if ftype == self.FRAME_PING:
+                if not flags & self.FLAG_ACK:
+                    self._sock.sendall(self._frame(self.FRAME_PING, self.FLAG_ACK, 0, payload))
+                continue
+            if ftype == self.FRAME_GOAWAY:
+                last_stream = struct.unpack(">I", payload[:4])[0] & 0x7FFFFFFF
+                if last_stream < stream_id:
+                    raise ConnectionError("xray API sent GOAWAY")
+                continue
+            if ftype in (self.FRAME_HEADERS, self.FRAME_CONTINUATION):
+                if ftype == self.FRAME_HEADERS:
+                    payload = self._strip_padding(flags, payload)
+                    if flags & self.FLAG_PRIORITY:
+                        payload = payload[5:]
+                header_block += payload
+                if not flags & self.FLAG_END_HEADERS:
+                    continue
+                # Decode every block to keep the HPACK dynamic table in sync
+                decoded = self._hpack.decode(header_block)
+                header_block = b""
+                if sid == stream_id:
+                    headers.update(decoded)
+                    if flags & self.FLAG_END_STREAM:
+                        break
+                continue
+            if sid != stream_id:
+                continue
+            if ftype == self.FRAME_DATA:
+                body += self._strip_padding(flags, payload)
+                if payload:
+                    self._sock.sendall(self._frame(
+                        self.FRAME_WINDOW_UPDATE, 0, 0, struct.pack(">I", len(payload))))
+                if flags & self.FLAG_END_STREAM:
+                    break
+            elif ftype == self.FRAME_RST_STREAM:
+                code = struct.unpack(">I", payload[:4])[0]
+                raise XrayApiError(f"xray API reset stream (error {code})")
+
+        status = int(headers.get("grpc-status", "0") or 0)
+        if status != 0:
+            message = unquote(headers.get("grpc-message", ""))
+            raise XrayApiError(f"{method}: {message or 'grpc-status ' + str(status)}", status)
+        if len(body) < 5:
+            return b""
+        length = struct.unpack(">I", body[1:5])[0]
+        return bytes(body[5:5 + length])
+
+    def _strip_padding(self, flags, payload):
+        if flags & self.FLAG_PADDED:
+            pad = payload[0]
+            return payload[1:len(payload) - pad]
+        return payload
+
+    # ── StatsService ──────────────────────────────────────────────────────
+
+    def query_stats(self, pattern="", reset=False):
+        """QueryStats: return {name: value} for all counters matching pattern."""
+        resp = self.call(f"{self.STATS_SERVICE}/QueryStats",
+                         _pb_message((1, pattern), (2, reset)))
+        stats = {}
+        for raw in _pb_decode(resp).get(1, []):
+            stat = _pb_decode(raw)
+            name = stat.get(1, [b""])[0].decode()
+            stats[name] = _pb_int64(stat.get(2, [0])[0])
+        return stats
+
+    def get_stats_online(self, name):
+        """GetStatsOnline: number of online connections for e.g. 'user>>>alice@proxy>>>online'."""
+        resp = self.call(f"{self.STATS_SERVICE}/GetStatsOnline", _pb_message((1, name)))
+        stat = _pb_decode(_pb_decode(resp).get(1, [b""])[0])
+        return _pb_int64(stat.get(2, [0])[0])
+
+    def get_stats_online_ip_list(self, name):
+        """GetStatsOnlineIpList: {ip: last_seen_unix} for e.g. 'user>>>alice@proxy>>>online'."""
+        resp = _pb_decode(self.call(f"{self.STATS_SERVICE}/GetStatsOnlineIpList",
+                                    _pb_message((1, name))))
+        ips = {}
+        # map<string, int64> ips = 2; each entry is {1: key, 2: value}
+        for entry in resp.get(2, []):
+            fields = _pb_decode(entry)
+            ips[fields.get(1, [b""])[0].decode()] = _pb_int64(fields.get(2, [0])[0])
+        return ips
+
+    def get_all_online_users(self):
+        """GetAllOnlineUsers: names of the online maps, e.g. 'user>>>alice@proxy>>>online'."""
+        resp = _pb_decode(self.call(f"{self.STATS_SERVICE}/GetAllOnlineUsers", b""))
+        return [name.decode() for name in resp.get(1, [])]
+
+    # ── HandlerService ────────────────────────────────────────────────────
+
+    def _alter_inbound(self, tag, operation):
+        self.call(f"{self.HANDLER_SERVICE}/AlterInbound",
+                  _pb_message((1, tag), (2, operation)))
+
+    def add_user(self, tag, email, uuid, protocol="vless", level=0):
+        """Add a VLESS/VMess client to a running inbound."""
+        if protocol == "vmess":
+            account = _pb_typed_message("xray.proxy.vmess.Account", _pb_message((1, uuid)))
+        else:
+            account = _pb_typed_message("xray.proxy.vless.Account",
+                                        _pb_message((1, uuid), (3, "none")))
+        user = _pb_message((1, level), (2, email), (3, account))
+        operation = _pb_typed_message("xray.app.proxyman.command.AddUserOperation",
+                                      _pb_message((1, user)))
+        self._alter_inbound(tag, operation)
+
+    def remove_user(self, tag, email):
+        """Remove a client (by email) from a running inbound."""
+        operation = _pb_typed_message("xray.app.proxyman.command.RemoveUserOperation",
+                                      _pb_message((1, email)))
+        self._alter_inbound(tag, operation)
+
+# ─── Xray Stats Snapshot ──────────────────────────────────────────────────────
+
+XRAY_PROXY_INBOUND_TAG = "proxy"
+XRAY_STATS_BACKOFF = 30  # seconds to leave the API and CLI alone after a failed query
+XRAY_USER_STAT_RE = re.compile(r"^user>>>(.+)@proxy>>>traffic>>>(uplink|downlink)$")
+XRAY_ONLINE_STAT_RE = re.compile(r"^(?:user>>>)?(.+)@proxy(?:>>>online)?$")
+
+class XrayStats:
+    """Per-user Xray traffic counters pulled with a single stats query.
+
+    One `user>>>` query returns every user's uplink/downlink counters, so the
+    cost of a collection does not grow with the number of users. The parsed
+    snapshot is kept for `max_age` seconds and shared by all callers. After a
+    failed API query the last snapshot is served for XRAY_STATS_BACKOFF
+    seconds without touching the API or forking the CLI.
+    """
+
+    def __init__(self, config, max_age=5, client=None):
+        self.config = config
+        self.max_age = max_age
+        self.client = client or XrayApiClient(port=config.xray_stats_port)
+        self._lock = threading.Lock()
+        self._snapshot = {}
+        self._taken_at = 0
+        self._retry_at = 0
+        self._api_down = False
+        self._online_supported = True
+        self._all_online_supported = True
+
+    @property
+    def backing_off(self):
+        return time.monotonic() < self._retry_at
+
+    def _query(self):
+        """Parsed stats, or None while backing off or when the CLI fallback fails too."""
+        if self.backing_off:
+            return None
+        try:
+            stats = self.client.query_stats("user>>>")
+            if self._api_down:
+                log("Xray gRPC stats API is reachable again")
+                self._api_down = False
+        except XrayApiError as e:
+            self._retry_at = time.monotonic() + XRAY_STATS_BACKOFF
+            if not self._api_down:
+                log(f"Xray gRPC stats query failed, falling back to CLI and "
+                    f"retrying every {XRAY_STATS_BACKOFF}s: {e}", "WARN")
+                self._api_down = True
+            stats = self._query_cli()
+        return self.parse_stats(stats) if stats is not None else None
+
+    def _query_cli(self):
+        stats_port = self.config.xray_stats_port
+        result = run_command(
+            ["xray", "api", "statsquery",
+             f"--server=127.0.0.1:{stats_port}",
+             "-pattern=user>>>"],
+            capture_output=True, text=True, timeout=10
+        )
+        if result.returncode != 0:
+            return None
+        if not result.stdout.strip():
+            return {}
+        return {
+            stat.get("name", ""): int(stat.get("value", 0) or 0)
+            for stat in json.loads(result.stdout).get("stat", [])
+        }
+
+    @staticmethod
+    def parse_stats(stats):
+        """Turn a {stat_name: value} mapping into {username: {uplink, downlink}}."""
+        users = {}
+        for name, value in stats.items():
+            match = XRAY_USER_STAT_RE.match(name)
+            if not match:
+                continue
+            username, direction = match.groups()
+            entry = users.setdefault(username, {"uplink": 0, "downlink": 0})
+            entry[direction] = int(value)
+        return users
+
+    def get_user_stats(self, max_age=None):
+        """Return {username: {"uplink", "downlink"}} from a snapshot at most max_age seconds old."""
+        if max_age is None:
+            max_age = self.max_age
+        with self._lock:
+            if time.time() - self._taken_at > max_age:
+                try:
+                    snapshot = self._query()
+                except Exception as e:
+                    log(f"Error querying xray stats: {e}", "ERROR")
+                    snapshot = {}
+                # Keep the last counters (and their age) through an outage rather
+                # than dropping them to zero
+                if snapshot is not None:
+                    self._snapshot = snapshot
+                    self._taken_at = time.time()
+            return {name: dict(vals) for name, vals in self._snapshot.items()}
+
+    @property
+    def taken_at(self):
+        """Wall-clock time of the current snapshot."""
+        return self._taken_at
+
+    def _online_usernames(self, candidates):
+        """Users worth asking for an IP list: Xray's own online set when the
+        build has GetAllOnlineUsers, otherwise the given candidates."""
+        if self._all_online_supported:
+            try:
+                names = self.client.get_all_online_users()
+                return [m.group(1) for m in map(XRAY_ONLINE_STAT_RE.match, names) if m]
+            except XrayApiError as e:
+                if e.status != 12:  # UNIMPLEMENTED
+                    raise
+                self._all_online_supported = False
+        return candidates if candidates is not None else list(self.get_user_stats())
+
+    def get_online_ips(self, candidates=None):
+        """{remote_ip: username} from Xray's per-user online IP lists.
+
+        Needs statsUserOnline in the policy; xray builds without
+        GetStatsOnlineIpList are detected once and skipped from then on.
+        """
+        if not self._online_supported:
+            return {}
+        ip_users = {}
+        try:
+            usernames = self._online_usernames(candidates)
+        except XrayApiError as e:
+            log(f"Error listing xray online users: {e}", "WARN")
+            return {}
+        for username in usernames:
+            try:
+                ips = self.client.get_stats_online_ip_list(f"user>>>{username}@proxy>>>online")
+            except XrayApiError as e:
+                if e.status == 12:  # UNIMPLEMENTED
+                    log("Xray has no GetStatsOnlineIpList; connections stay unattributed", "WARN")
+                    self._online_supported = False
+                    return {}
+                continue  # no online entry for this user
+            for ip in ips:
+                ip_users[ip] = username
+        return ip_users
+
+# ─── SSH Session Tracking ─────────────────────────────────────────────────────
+
+# "sshd: alice [priv]", "sshd: alice@pts/0", "sshd-session: alice"... The name
+# follows add-user.sh's rules and must be whole, so "alice.smith@pts/0" is not alice
+SSHD_TITLE_RE = re.compile(r"^sshd(?:-session)?: ([a-zA-Z0-9_-]{3,32})(@\S+)?(?: \[(\w+)\])?$")
+
+class SshSessionTracker:
+    """Per-user SSH sessions from /proc, without forking ps.
+
+    Only processes whose comm is sshd are looked at. Every authenticated
+    connection has a root "[priv]" monitor and a child running as the user;
+    the larger of the two counts is taken so a missing monitor title (or a
+    build without privilege separation) still counts. Results are cached for
+    `ttl` seconds.
+    """
+
+    SSHD_COMMS = ("sshd", "sshd-session")
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._taken_at = 0
+        self._boot_time = None
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+
+    def _get_boot_time(self):
+        if self._boot_time is None:
+            with open("/proc/stat") as f:
+                for line in f:
+                    if line.startswith("btime"):
+                        self._boot_time = int(line.split()[1])
+                        break
+        return self._boot_time
+
+    def _start_time(self, pid):
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+        # Field 22 (starttime); comm may contain spaces, so count from the ")"
+        ticks = int(stat[stat.rindex(")") + 2:].split()[19])
+        return self._get_boot_time() + ticks // self._clock_ticks
+
+    @staticmethod
+    def parse_title(title):
+        """(username, is_monitor) for a logged-in session's sshd process title, else None."""
+        match = SSHD_TITLE_RE.match(title)
+        if not match:
+            return None
+        username, _, tag = match.groups()
+        # [net]/[preauth] belong to connections that have not logged in yet
+        if username == "unknown" or tag in ("net", "preauth", "listener"):
+            return None
+        return username, tag == "priv"
+
+    def _scan(self):
+        monitors = defaultdict(list)
+        children = defaultdict(list)
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/comm") as f:
+                    if f.read().strip() not in self.SSHD_COMMS:
+                        continue
+                with open(f"/proc/{pid}/cmdline", "rb") as f:
+                    title = f.read().split(b"\0", 1)[0].decode(errors="replace").strip()
+                session = self.parse_title(title)
+                if not session:
+                    continue
+                started = self._start_time(pid)
+            except (OSError, ValueError, IndexError):
+                continue  # process exited mid-scan
+            username, is_monitor = session
+            (monitors if is_monitor else children)[username].append(started)
+
+        sessions = {}
+        for username in set(monitors) | set(children):
+            starts = max(monitors.get(username, []), children.get(username, []), key=len)
+            sessions[username] = {"sessions": len(starts), "started": sorted(starts)}
+        return sessions
+
+    def get_sessions(self):
+        """{username: {"sessions": n, "started": [unix_ts, ...]}}"""
+        with self._lock:
+            if time.time() - self._taken_at > self.ttl:
+                try:
+                    self._sessions = self._scan()
+                except Exception as e:
+                    log(f"Error scanning SSH sessions: {e}", "ERROR")
+                    self._sessions = {}
+                self._taken_at = time.time()
+            return self._sessions
+
 # ─── Layer Detection & User Management ────────────────────────────────────────
 
 class LayerManager:
-    def __init__(self, config):
+    def __init__(self, config, xray_stats=None):
         self.config = config
         self.layer = config.layer
+        self.xray_stats = xray_stats or XrayStats(config)
+        self.ssh_sessions = SshSessionTracker()
+        self._public_ip = None  # ifconfig.me answer, looked up at most once
 
     def detect_layer(self):
         """Auto-detect installed proxy layer."""
@@ -356,6 +1259,28 @@ class LayerManager:
             return "nginx"
         return "ssh"
 
+    def get_proxy_ports(self):
+        """TCP ports carrying proxy traffic for the active layer.
+
+        SSH behind nginx/stunnel has two legs per tunnel: the client side on
+        443 and the loopback side on 22, which is the one owned by the user's
+        sshd process.
+        """
+        if self.is_v2ray_layer():
+            config_path = "/usr/local/etc/xray/config.json"
+            try:
+                with open(config_path) as f:
+                    cfg = json.load(f)
+                for inb in cfg.get("inbounds", []):
+                    if inb.get("protocol") in ("vless", "vmess") and inb.get("port"):
+                        return (int(inb["port"]),)
+            except Exception as e:
+                log(f"Error reading xray inbound port: {e}", "WARN")
+            return (443,)
+        if self.layer == "layer3-basic":
+            return (22,)
+        return (443, 22)
+
     def list_users(self):
         """List all proxy users."""
         if self.is_v2ray_layer():
@@ -365,12 +1290,19 @@ class LayerManager:
 
     def _list_ssh_users(self):
         users = []
-        connected_users = self._get_ssh_connected_users()
+        sessions = self.ssh_sessions.get_sessions()
         proxy_dir = Path("/root/proxy-users")
         if proxy_dir.exists():
             for f in proxy_dir.glob("*.txt"):
                 username = f.stem
-                user_info = {"username": username, "type": "ssh", "connected": username in connected_users}
+                user_sessions = sessions.get(username)
+                user_info = {
+                    "username": username,
+                    "type": "ssh",
+                    "connected": user_sessions is not None,
+                    "sessions": user_sessions["sessions"] if user_sessions else 0,
+                    "connected_since": user_sessions["started"][0] if user_sessions else None,
+                }
                 try:
                     content = f.read_text()
                     for line in content.splitlines():
@@ -383,31 +1315,6 @@ class LayerManager:
                 users.append(user_info)
         return users
 
-    def _get_ssh_connected_users(self):
-        """Best-effort detection of active SSH sessions per user."""
-        connected = set()
-        try:
-            result = subprocess.run(
-                ["ps", "-eo", "user=,cmd="],
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0 and result.stdout:
-                for line in result.stdout.splitlines():
-                    parts = line.strip().split(None, 1)
-                    if len(parts) != 2:
-                        continue
-                    user, cmd = parts
-                    if "sshd:" not in cmd:
-                        continue
-                    match = re.search(r"sshd:\s*([a-zA-Z0-9_-]+)", cmd)
-                    if match:
-                        connected.add(match.group(1))
-                    elif user not in ("root", "sshd"):
-                        connected.add(user)
-        except Exception:
-            pass
-        return connected
-
     def _list_v2ray_users(self):
         users = []
         users_file = "/usr/local/etc/xray/users.json"
@@ -429,26 +1336,11 @@ class LayerManager:
 
     def _check_v2ray_users_connected(self):
         """Check which V2Ray users have active traffic in the current xray session."""
-        connected = set()
-        stats_port = self.config.xray_stats_port
-        try:
-            result = subprocess.run(
-                ["xray", "api", "statsquery",
-                 f"--server=127.0.0.1:{stats_port}",
-                 "-pattern=user>>>"],
-                capture_output=True, text=True, timeout=10
-            )
-            if result.returncode == 0 and result.stdout.strip():
-                data = json.loads(result.stdout)
-                for stat in data.get("stat", []):
-                    name = stat.get("name", "")
-                    value = int(stat.get("value", "0"))
-                    match = re.match(r"user>>>(.+)@proxy>>>traffic>>>", name)
-                    if match and value > 0:
-                        connected.add(match.group(1))
-        except Exception:
-            pass
-        return connected
+        stats = self.xray_stats.get_user_stats()
+        return {
+            username for username, vals in stats.items()
+            if vals.get("uplink", 0) > 0 or vals.get("downlink", 0) > 0
+        }
 
     def add_user(self, username, password=None):
         """Add a proxy user using existing scripts."""
@@ -472,7 +1364,7 @@ class LayerManager:
         if not script:
             return {"success": False, "error": "add-user.sh script not found"}
         try:
-            result = subprocess.run(
+            result = run_command(
                 ["bash", script, username, password],
                 capture_output=True, text=True, timeout=30
             )
@@ -488,7 +1380,7 @@ class LayerManager:
 
     def _ssh_user_exists(self, username):
         try:
-            result = subprocess.run(
+            result = run_command(
                 ["id", username],
                 capture_output=True, text=True, timeout=5
             )
@@ -503,11 +1395,19 @@ class LayerManager:
         if not script:
             return {"success": False, "error": "add-user.sh script not found"}
         try:
-            result = subprocess.run(
+            existed = username in self._read_v2ray_users()
+            # The script only writes config.json; the client is added to the running xray below
+            result = run_command(
                 ["bash", script, username],
-                capture_output=True, text=True, timeout=30
+                capture_output=True, text=True, timeout=30,
+                env={**os.environ, "XRAY_NO_RESTART": "1"}
             )
             if result.returncode == 0:
+                if not existed and not self._add_xray_user_live(username):
+                    run_command(
+                        ["systemctl", "restart", "xray"],
+                        capture_output=True, timeout=15
+                    )
                 log(f"User '{username}' added successfully (V2Ray)")
                 # Return full connection config
                 config_result = self.get_user_config(username)
@@ -522,6 +1422,35 @@ class LayerManager:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    @staticmethod
+    def _read_v2ray_users():
+        try:
+            with open("/usr/local/etc/xray/users.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _add_xray_user_live(self, username):
+        """Add a client the script just wrote to config.json to the running xray
+        via HandlerService. Returns True on success."""
+        uuid = self._read_v2ray_users().get(username)
+        try:
+            with open("/usr/local/etc/xray/config.json") as f:
+                inbound = json.load(f)["inbounds"][0]
+        except (OSError, ValueError, KeyError, IndexError):
+            return False
+        tag, protocol = inbound.get("tag"), inbound.get("protocol")
+        if not uuid or not tag or protocol not in ("vless", "vmess"):
+            return False
+        try:
+            self.xray_stats.client.add_user(tag, f"{username}@proxy", uuid, protocol)
+            return True
+        except XrayApiError as e:
+            if "already exists" in str(e):  # an older script restarted xray itself
+                return True
+            log(f"Live add of '{username}' failed, restarting xray: {e}", "WARN")
+            return False
+
     def delete_user(self, username):
         """Delete a proxy user."""
         if self.is_v2ray_layer():
@@ -534,7 +1463,7 @@ class LayerManager:
         if not script:
             return {"success": False, "error": "delete-user.sh script not found"}
         try:
-            result = subprocess.run(
+            result = run_command(
                 ["bash", script, username],
                 capture_output=True, text=True, timeout=30
             )
@@ -562,28 +1491,43 @@ class LayerManager:
 
                 # Remove from config.json
                 config_file = "/usr/local/etc/xray/config.json"
+                live_tags = []
                 if os.path.exists(config_file):
                     with open(config_file) as f:
                         cfg = json.load(f)
                     for inb in cfg.get("inbounds", []):
                         clients = inb.get("settings", {}).get("clients", [])
-                        inb["settings"]["clients"] = [
-                            c for c in clients if c.get("id") != uuid
-                        ]
+                        kept = [c for c in clients if c.get("id") != uuid]
+                        if len(kept) != len(clients):
+                            live_tags.append(inb.get("tag"))
+                        inb["settings"]["clients"] = kept
                     with open(config_file, "w") as f:
                         json.dump(cfg, f, indent=2)
 
-                # Restart xray
-                subprocess.run(
-                    ["systemctl", "restart", "xray"],
-                    capture_output=True, timeout=15
-                )
+                # Drop the user from the running xray via HandlerService; restart only as a fallback
+                if not self._remove_xray_user_live(username, live_tags):
+                    run_command(
+                        ["systemctl", "restart", "xray"],
+                        capture_output=True, timeout=15
+                    )
                 log(f"User '{username}' deleted (V2Ray)")
                 return {"success": True}
             return {"success": False, "error": "Users file not found"}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _remove_xray_user_live(self, username, tags):
+        """Remove a client from running inbounds without restarting xray. Returns True on success."""
+        if not tags or None in tags:
+            return False
+        try:
+            for tag in tags:
+                self.xray_stats.client.remove_user(tag, f"{username}@proxy")
+            return True
+        except XrayApiError as e:
+            log(f"Live removal of '{username}' failed, restarting xray: {e}", "WARN")
+            return False
+
     def get_user_config(self, username):
         """Get V2Ray user connection configuration with proper transport detection."""
         if not self.is_v2ray_layer():
@@ -683,27 +1627,22 @@ class LayerManager:
             return {"success": False, "error": str(e)}
 
     def _get_server_ip(self):
-        try:
-            result = subprocess.run(
-                ["hostname", "-I"],
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0:
-                ips = result.stdout.strip().split()
-                if ips:
-                    return ips[0]
-        except Exception:
-            pass
-        try:
-            result = subprocess.run(
-                ["curl", "-s", "--max-time", "5", "ifconfig.me"],
-                capture_output=True, text=True, timeout=10
-            )
-            if result.returncode == 0:
-                return result.stdout.strip()
-        except Exception:
-            pass
-        return "SERVER_IP"
+        ips = SystemInfo.get_ip_addresses()
+        if ips:
+            return ips[0]
+        # No IPv4 address on any interface: ask once and reuse the answer
+        if self._public_ip is None:
+            self._public_ip = ""
+            try:
+                result = run_command(
+                    ["curl", "-s", "--max-time", "5", "ifconfig.me"],
+                    capture_output=True, text=True, timeout=10
+                )
+                if result.returncode == 0:
+                    self._public_ip = result.stdout.strip()
+            except Exception:
+                pass
+        return self._public_ip or "SERVER_IP"
 
     def _find_script(self, name, subdir):
         """Find a management script. Downloads from GitHub if not found locally."""
@@ -729,7 +1668,7 @@ class LayerManager:
         dest_dir.mkdir(parents=True, exist_ok=True)
         dest = dest_dir / f"{subdir}_{name}"
         try:
-            result = subprocess.run(
+            result = run_command(
                 ["curl", "-fsSL", url, "-o", str(dest)],
                 capture_output=True, text=True, timeout=30
             )
@@ -784,13 +1723,13 @@ class LayerManager:
             # Phase 1: Uninstall current layer
             update("uninstalling", 5, "Downloading uninstall script...")
             uninstall_url = f"{GITHUB_RAW_BASE}/common/uninstall.sh"
-            dl = subprocess.run(
+            dl = run_command(
                 ["curl", "-fsSL", uninstall_url, "-o", "/tmp/proxy-uninstall.sh"],
                 capture_output=True, text=True, timeout=60, env=env
             )
             if dl.returncode != 0:
                 raise RuntimeError(f"Failed to download uninstall script: {dl.stderr[-200:]}")
-            result = subprocess.run(
+            result = run_command(
                 ["bash", "/tmp/proxy-uninstall.sh"],
                 capture_output=True, text=True, timeout=300, env=env
             )
@@ -807,7 +1746,7 @@ class LayerManager:
             # Phase 2: Install target layer
             update("installing", 25, f"Downloading {target_layer_id} install script...")
             install_url = f"{GITHUB_RAW_BASE}/{target_layer_id}/install.sh"
-            dl = subprocess.run(
+            dl = run_command(
                 ["curl", "-fsSL", install_url, "-o", "/tmp/proxy-install.sh"],
                 capture_output=True, text=True, timeout=60, env=env
             )
@@ -824,14 +1763,14 @@ class LayerManager:
                 else:
                     stdin_lines += "\n"
                 update("installing", 30, f"Installing {target_layer_id} (domain: {domain})...")
-                result = subprocess.run(
+                result = run_command(
                     ["bash", "/tmp/proxy-install.sh"],
                     input=stdin_lines,
                     capture_output=True, text=True, timeout=600, env=env
                 )
             else:
                 update("installing", 30, f"Installing {target_layer_id}...")
-                result = subprocess.run(
+                result = run_command(
                     ["bash", "/tmp/proxy-install.sh"],
                     capture_output=True, text=True, timeout=600, env=env
                 )
@@ -843,12 +1782,12 @@ class LayerManager:
             # Phase 3: Reinstall panel with new layer flag
             update("reinstalling_panel", 85, "Reinstalling panel with new layer...")
             panel_url = f"{GITHUB_RAW_BASE}/panel/install-panel.sh"
-            dl = subprocess.run(
+            dl = run_command(
                 ["curl", "-fsSL", panel_url, "-o", "/tmp/proxy-panel-install.sh"],
                 capture_output=True, text=True, timeout=60, env=env
             )
             if dl.returncode == 0:
-                result = subprocess.run(
+                result = run_command(
                     ["bash", "/tmp/proxy-panel-install.sh", f"--layer={target_layer_id}"],
                     capture_output=True, text=True, timeout=300, env=env
                 )
@@ -869,6 +1808,8 @@ class LayerManager:
                 _config.service_type = "ssh"
                 _config.user_management = "ssh"
             _config.save()
+            # Users, ports and services all belong to the new layer now
+            RESPONSE_CACHE.invalidate()
 
             # Clean up state file
             if state_file.exists():
@@ -883,6 +1824,8 @@ class LayerManager:
             _switch_state["in_progress"] = False
             _switch_state["log_lines"].append(f"ERROR: {e}")
             log(f"Layer switch failed: {e}", "ERROR")
+            # The old layer may be partly removed already
+            RESPONSE_CACHE.invalidate()
             # Clean up state file on error
             state_file = DATA_DIR / "switch_state.json"
             if state_file.exists():
@@ -893,24 +1836,71 @@ class LayerManager:
 
 # ─── System Information ───────────────────────────────────────────────────────
 
+SIOCGIFADDR = 0x8915
+
+# Log levels, most to least severe; journal priorities 0-3 all count as errors
+LOG_LEVELS = ("error", "warning", "info", "debug")
+JOURNAL_PRIORITY_LEVELS = {0: "error", 1: "error", 2: "error", 3: "error",
+                           4: "warning", 5: "info", 6: "info", 7: "debug"}
+JOURNAL_TAG_LEVEL_RE = re.compile(r"\[(Error|Warning|Info|Debug)\]")
+JOURNAL_CURSOR_RE = re.compile(r"^[A-Za-z0-9=;_-]{1,256}\Z")  # \Z: $ would accept a trailing newline
+
 class SystemInfo:
+    # Hostname/OS never change while the panel runs; filled by load_static()
+    _static = None
+
+    @classmethod
+    def load_static(cls):
+        static = {"os": "", "hostname": os.uname().nodename}
+        try:
+            with open("/etc/os-release") as f:
+                for line in f:
+                    key, _, value = line.strip().partition("=")
+                    if key == "PRETTY_NAME":
+                        static["os"] = value.strip('"')
+                        break
+        except OSError as e:
+            log(f"Error reading /etc/os-release: {e}", "WARN")
+        if not static["os"]:
+            uname = os.uname()
+            static["os"] = f"{uname.sysname} {uname.release}"
+        cls._static = static
+        return static
+
+    @staticmethod
+    def get_ip_addresses():
+        """IPv4 addresses of non-loopback interfaces, in interface index order."""
+        ips = []
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for _, name in socket.if_nameindex():
+                try:
+                    ifreq = struct.pack("256s", name.encode()[:15])
+                    addr = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, ifreq)[20:24])
+                except OSError:
+                    continue  # interface has no IPv4 address
+                if not addr.startswith("127."):
+                    ips.append(addr)
+        finally:
+            sock.close()
+        return ips
+
     @staticmethod
     def get_info():
+        static = SystemInfo._static or SystemInfo.load_static()
         info = {
             "ip": "",
             "uptime": "",
-            "os": "",
-            "hostname": "",
+            "os": static["os"],
+            "hostname": static["hostname"],
             "cpu_usage": 0,
             "memory": {"total": 0, "used": 0, "percent": 0},
             "disk": {"total": 0, "used": 0, "percent": 0},
         }
         try:
             # IP
-            result = subprocess.run(["hostname", "-I"], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                ips = result.stdout.strip().split()
-                info["ip"] = ips[0] if ips else ""
+            ips = SystemInfo.get_ip_addresses()
+            info["ip"] = ips[0] if ips else ""
 
             # Uptime
             with open("/proc/uptime") as f:
@@ -920,19 +1910,6 @@ class SystemInfo:
             mins = int((uptime_sec % 3600) // 60)
             info["uptime"] = f"{days}d {hours}h {mins}m"
 
-            # OS
-            result = subprocess.run(
-                ["lsb_release", "-ds"],
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0:
-                info["os"] = result.stdout.strip().strip('"')
-
-            # Hostname
-            result = subprocess.run(["hostname"], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                info["hostname"] = result.stdout.strip()
-
             # CPU
             with open("/proc/stat") as f:
                 line = f.readline()
@@ -956,280 +1933,774 @@ class SystemInfo:
                     "percent": round(100 * used_kb / total_kb, 1) if total_kb else 0
                 }
 
-            # Disk
-            result = subprocess.run(
-                ["df", "-B1", "/"],
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0:
-                lines = result.stdout.strip().splitlines()
-                if len(lines) >= 2:
-                    parts = lines[1].split()
-                    total_bytes = int(parts[1])
-                    used_bytes = int(parts[2])
-                    info["disk"] = {
-                        "total": round(total_bytes / (1024**3), 1),
-                        "used": round(used_bytes / (1024**3), 1),
-                        "percent": round(100 * used_bytes / total_bytes, 1) if total_bytes else 0
-                    }
+            # Disk (same "used" as df: blocks minus free blocks)
+            st = os.statvfs("/")
+            total_bytes = st.f_blocks * st.f_frsize
+            used_bytes = (st.f_blocks - st.f_bfree) * st.f_frsize
+            info["disk"] = {
+                "total": round(total_bytes / (1024**3), 1),
+                "used": round(used_bytes / (1024**3), 1),
+                "percent": round(100 * used_bytes / total_bytes, 1) if total_bytes else 0
+            }
         except Exception as e:
             log(f"Error getting system info: {e}", "ERROR")
 
         return info
 
-    @staticmethod
-    def get_service_status(service_name):
-        """Get systemd service status."""
-        try:
-            result = subprocess.run(
-                ["systemctl", "is-active", service_name],
-                capture_output=True, text=True, timeout=5
-            )
-            return result.stdout.strip()
-        except Exception:
-            return "unknown"
+    MONITORED_SERVICES = ("ssh", "sshd", "nginx", "stunnel4", "xray")
+    SERVICE_PROPERTIES = "Id,LoadState,ActiveState,SubState,NRestarts,ActiveEnterTimestampMonotonic"
+    SERVICE_STATUS_TTL = 5
+    _services_cache = None
+    _services_taken_at = 0
+    _services_lock = threading.Lock()
 
     @staticmethod
-    def get_all_services_status():
+    def _query_services():
+        """One `systemctl show` for every monitored unit."""
+        result = run_command(
+            ["systemctl", "show", f"--property={SystemInfo.SERVICE_PROPERTIES}",
+             *SystemInfo.MONITORED_SERVICES],
+            capture_output=True, text=True, timeout=5
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"systemctl exited {result.returncode}")
+        # One blank-line separated block per unit, in argument order
+        blocks = [dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+                  for block in result.stdout.strip().split("\n\n")]
+        now = time.monotonic()
         services = {}
-        for svc in ["ssh", "sshd", "nginx", "stunnel4", "xray"]:
-            status = SystemInfo.get_service_status(svc)
-            if status != "unknown" or svc in ("ssh", "xray"):
-                services[svc] = status
+        for svc, props in zip(SystemInfo.MONITORED_SERVICES, blocks):
+            if props.get("LoadState") == "not-found" and svc not in ("ssh", "xray"):
+                continue
+            state = props.get("ActiveState", "unknown")
+            entered = int(props.get("ActiveEnterTimestampMonotonic", "0") or 0)
+            services[svc] = {
+                "state": state,
+                "sub_state": props.get("SubState", ""),
+                "restarts": int(props.get("NRestarts", "0") or 0),
+                # systemd's monotonic clock is CLOCK_MONOTONIC, same as time.monotonic()
+                "uptime": int(now - entered / 1e6) if state == "active" and entered else 0,
+            }
         return services
 
-# ─── Bandwidth Monitoring ─────────────────────────────────────────────────────
+    @classmethod
+    def get_all_services_status(cls):
+        """{service: {"state", "sub_state", "restarts", "uptime"}}, cached for a few seconds."""
+        with cls._services_lock:
+            if cls._services_cache is None or time.time() - cls._services_taken_at > cls.SERVICE_STATUS_TTL:
+                try:
+                    cls._services_cache = cls._query_services()
+                except Exception as e:
+                    log(f"Error getting service status: {e}", "ERROR")
+                    cls._services_cache = {svc: {"state": "unknown", "sub_state": "", "restarts": 0, "uptime": 0}
+                                           for svc in ("ssh", "xray")}
+                cls._services_taken_at = time.time()
+            return cls._services_cache
 
-class BandwidthMonitor:
-    def __init__(self, config):
-        self.config = config
-        self.data_file = DATA_DIR / "bandwidth.json"
-        self._data = self._load_data()
+    @classmethod
+    def invalidate_services_status(cls):
+        with cls._services_lock:
+            cls._services_cache = None
+
+    @staticmethod
+    def read_journal(service, cursor=None, limit=100):
+        """Journal entries for a unit, oldest first, plus the cursor of the last one.
+
+        Without a cursor these are the newest `limit` entries. With one they
+        are the first `limit` entries written after it, so a follower never
+        re-reads the tail and one that fell behind catches up over several polls.
+        """
+        cmd = ["journalctl", "-u", service, "-o", "json", "--no-pager", "-n", str(limit)]
+        if cursor:
+            cmd.append(f"--after-cursor={cursor}")
+        result = run_command(cmd, capture_output=True, text=True, timeout=10)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or "Failed to read logs")
+        return SystemInfo.parse_journal(result.stdout, service, cursor)
 
-    def _load_data(self):
-        if self.data_file.exists():
+    @staticmethod
+    def parse_journal(text, service, cursor=None):
+        """(entries, last_cursor) from `journalctl -o json` output; cursor is kept when there are none."""
+        entries = []
+        last_cursor = cursor
+        for line in text.splitlines():
             try:
-                with open(self.data_file) as f:
-                    return json.load(f)
-            except Exception:
-                pass
-        return {"users": {}, "daily": {}, "last_update": 0, "last_reset_day": ""}
+                record = json.loads(line)
+            except ValueError:
+                continue
+            last_cursor = record.get("__CURSOR", last_cursor)
+            message = record.get("MESSAGE", "")
+            if isinstance(message, list):
+                # Non-UTF-8 messages come back as a byte array
+                message = bytes(message).decode(errors="replace")
+            elif message is None:
+                message = ""
+            priority = int(record.get("PRIORITY", 6))
+            # Xray logs everything at one journal priority; its own tag is better
+            tag = JOURNAL_TAG_LEVEL_RE.search(message)
+            level = tag.group(1).lower() if tag else JOURNAL_PRIORITY_LEVELS.get(min(priority, 7), "info")
+            entries.append({
+                "ts": int(record.get("__REALTIME_TIMESTAMP", 0)) / 1e6,
+                "level": level,
+                "ident": record.get("SYSLOG_IDENTIFIER", service),
+                "pid": record.get("_PID", ""),
+                "message": message,
+            })
+        return entries, last_cursor
 
-    def _save_data(self):
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
+# ─── Bandwidth Monitoring ─────────────────────────────────────────────────────
+
+# nftables table used by common/add-user.sh for per-user accounting
+NFT_ACCT_TABLE = "proxy_acct"
+
+class BandwidthStore:
+    """SQLite (WAL) store for per-user traffic.
+
+    Each collection is written as one small transaction of UPSERTs into
+    hourly and daily rollup tables keyed by (username, bucket), plus running
+    totals and the previous session counters. Readers use their own
+    per-thread connection, so they never block the collector.
+    """
+
+    HOURLY_RETENTION_DAYS = 31
+    DAILY_RETENTION_DAYS = 400
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS totals (
+            username TEXT PRIMARY KEY,
+            uplink INTEGER NOT NULL DEFAULT 0,
+            downlink INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS prev_session (
+            username TEXT PRIMARY KEY,
+            uplink INTEGER NOT NULL DEFAULT 0,
+            downlink INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS hourly (
+            username TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            uplink INTEGER NOT NULL DEFAULT 0,
+            downlink INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, bucket)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS hourly_bucket ON hourly (bucket);
+        CREATE TABLE IF NOT EXISTS daily (
+            username TEXT NOT NULL,
+            day TEXT NOT NULL,
+            uplink INTEGER NOT NULL DEFAULT 0,
+            downlink INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, day)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS daily_day ON daily (day);
+        CREATE TABLE IF NOT EXISTS iface_counters (
+            iface TEXT PRIMARY KEY,
+            rx INTEGER NOT NULL,
+            tx INTEGER NOT NULL,
+            boot_id TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS iface_totals (
+            iface TEXT PRIMARY KEY,
+            rx INTEGER NOT NULL DEFAULT 0,
+            tx INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS iface_daily (
+            iface TEXT NOT NULL,
+            day TEXT NOT NULL,
+            rx INTEGER NOT NULL DEFAULT 0,
+            tx INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (iface, day)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_file, legacy_json=None):
+        self.db_file = Path(db_file)
+        self._local = threading.local()
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+        if legacy_json is not None:
+            self._migrate_json(Path(legacy_json))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_file), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate_json(self, json_file):
+        """One-time import of the old bandwidth.json, which is then renamed aside."""
+        if not json_file.exists() or self.get_meta("migrated_json"):
+            return
         try:
-            with open(self.data_file, "w") as f:
-                json.dump(self._data, f, indent=2)
+            with open(json_file) as f:
+                data = json.load(f)
         except Exception as e:
-            log(f"Error saving bandwidth data: {e}", "ERROR")
+            log(f"Skipping bandwidth.json migration: {e}", "WARN")
+            return
 
-    def get_system_bandwidth(self):
-        """Get system-wide bandwidth from vnstat."""
-        result = {"today": {"rx": 0, "tx": 0}, "month": {"rx": 0, "tx": 0}, "total": {"rx": 0, "tx": 0}}
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO totals (username, uplink, downlink) VALUES (?, ?, ?)",
+                [(name, int(v.get("uplink_acc", 0)), int(v.get("downlink_acc", 0)))
+                 for name, v in data.get("users", {}).items()]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO prev_session (username, uplink, downlink) VALUES (?, ?, ?)",
+                [(name, int(v.get("uplink", 0)), int(v.get("downlink", 0)))
+                 for name, v in data.get("prev_session", {}).items()]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO daily (username, day, uplink, downlink) VALUES (?, ?, ?, ?)",
+                [(name, day, int(v.get("uplink", 0)), int(v.get("downlink", 0)))
+                 for name, days in data.get("daily", {}).items()
+                 for day, v in days.items()]
+            )
+            self._set_meta(conn, "last_update", data.get("last_update", 0))
+            self._set_meta(conn, "migrated_json", time.time())
         try:
-            # Try vnstat JSON output
-            proc = subprocess.run(
-                ["vnstat", "--json"],
-                capture_output=True, text=True, timeout=10
+            json_file.rename(json_file.with_name(json_file.name + ".migrated"))
+        except OSError:
+            pass
+        log(f"Migrated {json_file} into {self.db_file}")
+
+    @staticmethod
+    def _set_meta(conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    @property
+    def last_update(self):
+        return float(self.get_meta("last_update", 0))
+
+    def get_totals(self):
+        """Return {username: {"uplink_acc", "downlink_acc"}}."""
+        rows = self._conn().execute("SELECT username, uplink, downlink FROM totals")
+        return {name: {"uplink_acc": up, "downlink_acc": down} for name, up, down in rows}
+
+    def get_prev_session(self):
+        rows = self._conn().execute("SELECT username, uplink, downlink FROM prev_session")
+        return {name: {"uplink": up, "downlink": down} for name, up, down in rows}
+
+    def record(self, deltas, session, ts=None):
+        """Add per-user deltas to the totals and rollups and store the new session counters.
+
+        deltas/session: {username: {"uplink", "downlink"}}.
+        """
+        ts = ts or time.time()
+        bucket = int(ts // 3600 * 3600)
+        day = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+        changed = [(name, d["uplink"], d["downlink"]) for name, d in deltas.items()
+                   if d["uplink"] or d["downlink"]]
+
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO totals (username, uplink, downlink) VALUES (?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET uplink = uplink + excluded.uplink, "
+                "downlink = downlink + excluded.downlink",
+                changed
             )
-            if proc.returncode == 0:
-                data = json.loads(proc.stdout)
-                interfaces = data.get("interfaces", [])
-                if interfaces:
-                    iface = interfaces[0]
-                    traffic = iface.get("traffic", {})
-
-                    # Today
-                    days = traffic.get("day", [])
-                    if days:
-                        today = days[-1]
-                        result["today"]["rx"] = today.get("rx", 0)
-                        result["today"]["tx"] = today.get("tx", 0)
-
-                    # This month
-                    months = traffic.get("month", [])
-                    if months:
-                        month = months[-1]
-                        result["month"]["rx"] = month.get("rx", 0)
-                        result["month"]["tx"] = month.get("tx", 0)
-
-                    # Total
-                    total = traffic.get("total", {})
-                    result["total"]["rx"] = total.get("rx", 0)
-                    result["total"]["tx"] = total.get("tx", 0)
-        except FileNotFoundError:
-            log("vnstat not installed", "WARN")
-        except Exception as e:
-            log(f"Error getting system bandwidth: {e}", "ERROR")
+            conn.executemany(
+                "INSERT INTO hourly (username, bucket, uplink, downlink) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(username, bucket) DO UPDATE SET uplink = uplink + excluded.uplink, "
+                "downlink = downlink + excluded.downlink",
+                [(name, bucket, up, down) for name, up, down in changed]
+            )
+            conn.executemany(
+                "INSERT INTO daily (username, day, uplink, downlink) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(username, day) DO UPDATE SET uplink = uplink + excluded.uplink, "
+                "downlink = downlink + excluded.downlink",
+                [(name, day, up, down) for name, up, down in changed]
+            )
+            conn.execute("DELETE FROM prev_session")
+            conn.executemany(
+                "INSERT INTO prev_session (username, uplink, downlink) VALUES (?, ?, ?)",
+                [(name, v.get("uplink", 0), v.get("downlink", 0)) for name, v in session.items()]
+            )
+            self._set_meta(conn, "last_update", ts)
+
+            if self.get_meta("last_prune") != day:
+                conn.execute("DELETE FROM hourly WHERE bucket < ?",
+                             (bucket - self.HOURLY_RETENTION_DAYS * 86400,))
+                cutoff = datetime.fromtimestamp(ts) - timedelta(days=self.DAILY_RETENTION_DAYS)
+                conn.execute("DELETE FROM daily WHERE day < ?", (cutoff.strftime("%Y-%m-%d"),))
+                self._set_meta(conn, "last_prune", day)
+
+    def get_period_totals(self, today, week_start, month_start):
+        """Return {username: {today_*, week_*, month_*}} summed from the daily rollup."""
+        rows = self._conn().execute(
+            "SELECT username, "
+            "SUM(CASE WHEN day = ? THEN uplink ELSE 0 END), "
+            "SUM(CASE WHEN day = ? THEN downlink ELSE 0 END), "
+            "SUM(CASE WHEN day >= ? THEN uplink ELSE 0 END), "
+            "SUM(CASE WHEN day >= ? THEN downlink ELSE 0 END), "
+            "SUM(uplink), SUM(downlink) "
+            "FROM daily WHERE day >= ? GROUP BY username",
+            (today, today, week_start, week_start, month_start)
+        )
+        return {
+            row[0]: {
+                "today_uplink": row[1], "today_downlink": row[2],
+                "week_uplink": row[3], "week_downlink": row[4],
+                "month_uplink": row[5], "month_downlink": row[6],
+            }
+            for row in rows
+        }
 
-        return result
+    def get_daily(self, since):
+        """Return {username: {day: {"uplink", "downlink"}}} for days >= since."""
+        daily = defaultdict(dict)
+        rows = self._conn().execute(
+            "SELECT username, day, uplink, downlink FROM daily WHERE day >= ? ORDER BY day",
+            (since,)
+        )
+        for name, day, up, down in rows:
+            daily[name][day] = {"uplink": up, "downlink": down}
+        return daily
+
+    def get_hourly(self, username, since_ts):
+        """Return [{"ts", "uplink", "downlink"}] hourly buckets for one user."""
+        rows = self._conn().execute(
+            "SELECT bucket, uplink, downlink FROM hourly "
+            "WHERE username = ? AND bucket >= ? ORDER BY bucket",
+            (username, int(since_ts))
+        )
+        return [{"ts": bucket, "uplink": up, "downlink": down} for bucket, up, down in rows]
+
+    # ── Interface accounting ──────────────────────────────────────────────
+
+    def get_interface_counters(self):
+        """Return {iface: (rx, tx, boot_id)}: the raw counters seen last time."""
+        rows = self._conn().execute("SELECT iface, rx, tx, boot_id FROM iface_counters")
+        return {iface: (rx, tx, boot_id) for iface, rx, tx, boot_id in rows}
+
+    def record_interfaces(self, deltas, counters, boot_id, ts=None):
+        """Add {iface: (rx, tx)} deltas to the totals/daily rollup and store the raw counters."""
+        ts = ts or time.time()
+        day = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+        changed = [(iface, rx, tx) for iface, (rx, tx) in deltas.items() if rx or tx]
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO iface_totals (iface, rx, tx) VALUES (?, ?, ?) "
+                "ON CONFLICT(iface) DO UPDATE SET rx = rx + excluded.rx, tx = tx + excluded.tx",
+                changed
+            )
+            conn.executemany(
+                "INSERT INTO iface_daily (iface, day, rx, tx) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(iface, day) DO UPDATE SET rx = rx + excluded.rx, tx = tx + excluded.tx",
+                [(iface, day, rx, tx) for iface, rx, tx in changed]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO iface_counters (iface, rx, tx, boot_id) VALUES (?, ?, ?, ?)",
+                [(iface, rx, tx, boot_id) for iface, (rx, tx) in counters.items()]
+            )
+            if self.get_meta("last_iface_prune") != day:
+                cutoff = datetime.fromtimestamp(ts) - timedelta(days=self.DAILY_RETENTION_DAYS)
+                conn.execute("DELETE FROM iface_daily WHERE day < ?", (cutoff.strftime("%Y-%m-%d"),))
+                self._set_meta(conn, "last_iface_prune", day)
+
+    def import_interface_history(self, iface, days, total):
+        """Seed an interface that has no history yet. days: {day: (rx, tx)}, total: (rx, tx)."""
+        conn = self._conn()
+        with conn:
+            if conn.execute("SELECT 1 FROM iface_totals WHERE iface = ?", (iface,)).fetchone():
+                return False
+            conn.executemany(
+                "INSERT OR REPLACE INTO iface_daily (iface, day, rx, tx) VALUES (?, ?, ?, ?)",
+                [(iface, day, rx, tx) for day, (rx, tx) in days.items()]
+            )
+            conn.execute("INSERT INTO iface_totals (iface, rx, tx) VALUES (?, ?, ?)",
+                         (iface, total[0], total[1]))
+        return True
+
+    def get_interface_summary(self, iface, today, month_start):
+        """Return {"today", "month", "total"} as {"rx", "tx"} for one interface."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT SUM(CASE WHEN day = ? THEN rx ELSE 0 END), "
+            "SUM(CASE WHEN day = ? THEN tx ELSE 0 END), "
+            "SUM(rx), SUM(tx) FROM iface_daily WHERE iface = ? AND day >= ?",
+            (today, today, iface, month_start)
+        ).fetchone()
+        total = conn.execute("SELECT rx, tx FROM iface_totals WHERE iface = ?", (iface,)).fetchone()
+        return {
+            "today": {"rx": row[0] or 0, "tx": row[1] or 0},
+            "month": {"rx": row[2] or 0, "tx": row[3] or 0},
+            "total": {"rx": total[0] if total else 0, "tx": total[1] if total else 0},
+        }
 
-    def get_user_bandwidth(self):
-        """Get per-user bandwidth with daily breakdown and period summaries."""
-        # Ensure fresh data by persisting if stale (> 60s since last persist)
-        last_update = self._data.get("last_update", 0)
-        if time.time() - last_update > 60:
-            try:
-                self.persist_stats()
-            except Exception as e:
-                log(f"Error persisting stats on demand: {e}", "ERROR")
+    def get_interface_names(self):
+        return [row[0] for row in self._conn().execute("SELECT iface FROM iface_totals ORDER BY iface")]
 
-        if self.config.user_management == "v2ray":
-            raw = self._get_xray_user_bandwidth()
-        else:
-            raw = self._get_ssh_user_bandwidth()
+# ─── Interface Accounting ─────────────────────────────────────────────────────
 
-        today = datetime.now().strftime("%Y-%m-%d")
-        daily = self._data.get("daily", {})
-        now = datetime.now()
-        week_start = (now - timedelta(days=7)).strftime("%Y-%m-%d")
-        month_start = (now - timedelta(days=30)).strftime("%Y-%m-%d")
+def read_proc_net_dev():
+    """{iface: (rx_bytes, tx_bytes)} from /proc/net/dev, excluding loopback."""
+    counters = {}
+    with open("/proc/net/dev") as f:
+        for line in f.readlines()[2:]:
+            name, _, data = line.partition(":")
+            name = name.strip()
+            if name == "lo":
+                continue
+            fields = data.split()
+            counters[name] = (int(fields[0]), int(fields[8]))
+    return counters
+
+def detect_egress_interface():
+    """Interface of the IPv4 default route with the lowest metric, if any."""
+    best = None
+    try:
+        with open("/proc/net/route") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                # Destination 0 and mask 0 is the default route
+                if fields[1] == "00000000" and fields[7] == "00000000":
+                    metric = int(fields[6])
+                    if best is None or metric < best[1]:
+                        best = (fields[0], metric)
+    except (OSError, StopIteration, IndexError, ValueError):
+        pass
+    return best[0] if best else None
 
-        for username, data in raw.items():
-            user_daily = daily.get(username, {})
-
-            # Today
-            today_data = user_daily.get(today, {"uplink": 0, "downlink": 0})
-            data["today_uplink"] = today_data.get("uplink", 0)
-            data["today_downlink"] = today_data.get("downlink", 0)
-            data["today_total"] = data["today_uplink"] + data["today_downlink"]
-
-            # This week (last 7 days)
-            week_up = 0
-            week_down = 0
-            for day_key, day_data in user_daily.items():
-                if day_key >= week_start:
-                    week_up += day_data.get("uplink", 0)
-                    week_down += day_data.get("downlink", 0)
-            data["week_uplink"] = week_up
-            data["week_downlink"] = week_down
-            data["week_total"] = week_up + week_down
-
-            # This month (last 30 days)
-            month_up = 0
-            month_down = 0
-            for day_key, day_data in user_daily.items():
-                if day_key >= month_start:
-                    month_up += day_data.get("uplink", 0)
-                    month_down += day_data.get("downlink", 0)
-            data["month_uplink"] = month_up
-            data["month_downlink"] = month_down
-            data["month_total"] = month_up + month_down
+class InterfaceAccountant:
+    """Per-interface traffic totals from /proc/net/dev, persisted by day.
 
-            # Include daily breakdown for frontend charts
-            data["daily"] = user_daily
+    Each sample stores the raw counters; the next one adds the difference.
+    A changed boot id or a counter that went backwards (reboot, interface
+    re-created) means the counter restarted from zero.
+    """
 
-        return raw
+    def __init__(self, store, config):
+        self.store = store
+        self.config = config
 
     @staticmethod
-    def _read_iptables_chain_bytes(table, chain):
-        """Return a list of byte counters for rules in a chain or None if chain missing."""
+    def _boot_id():
         try:
-            cmd = ["iptables"]
-            if table:
-                cmd += ["-t", table]
-            cmd += ["-L", chain, "-v", "-n", "-x"]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-            if result.returncode != 0:
-                return None
-            lines = result.stdout.splitlines()[2:]
-            bytes_list = []
-            for line in lines:
-                parts = line.split()
-                if len(parts) >= 2:
-                    try:
-                        bytes_list.append(int(parts[1]))
-                    except ValueError:
-                        continue
-            return bytes_list
-        except Exception:
-            return None
+            with open("/proc/sys/kernel/random/boot_id") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def get_interface(self):
+        """The configured egress interface, else the default-route one."""
+        if self.config.egress_interface:
+            return self.config.egress_interface
+        detected = detect_egress_interface()
+        if detected:
+            return detected
+        names = self.store.get_interface_names()
+        return names[0] if names else ""
+
+    def sample(self, ts=None):
+        counters = read_proc_net_dev()
+        boot_id = self._boot_id()
+        prev = self.store.get_interface_counters()
+        deltas = {}
+        for iface, (rx, tx) in counters.items():
+            last = prev.get(iface)
+            if last is None:
+                # First sight: traffic before this point is not ours to count
+                deltas[iface] = (0, 0)
+            elif last[2] != boot_id or rx < last[0] or tx < last[1]:
+                deltas[iface] = (rx, tx)
+            else:
+                deltas[iface] = (rx - last[0], tx - last[1])
+        self.store.record_interfaces(deltas, counters, boot_id, ts)
 
-    def _get_xray_user_bandwidth(self):
-        """Get V2Ray per-user bandwidth from current xray session + accumulated data."""
-        users = {}
-        users_file = "/usr/local/etc/xray/users.json"
-        if not os.path.exists(users_file):
-            return users
+    def get_summary(self, iface=None):
+        iface = iface or self.get_interface()
+        now = datetime.now()
+        summary = self.store.get_interface_summary(
+            iface, now.strftime("%Y-%m-%d"), now.strftime("%Y-%m-01"))
+        summary["interface"] = iface
+        return summary
 
+    def import_vnstat(self):
+        """Seed interfaces with no history from vnstat's database, if vnstat is installed."""
         try:
-            with open(users_file) as f:
-                user_data = json.load(f)
-
-            # Include current session stats so usage shows immediately
-            current_stats = self._get_raw_xray_stats()
-
-            for username in user_data:
-                persistent = self._data.get("users", {}).get(username, {})
-                current = current_stats.get(username, {})
-                users[username] = {
-                    "uplink": current.get("uplink", 0) + persistent.get("uplink_acc", 0),
-                    "downlink": current.get("downlink", 0) + persistent.get("downlink_acc", 0),
-                }
+            proc = run_command(["vnstat", "--json", "d"], capture_output=True, text=True, timeout=30)
+        except FileNotFoundError:
+            return
         except Exception as e:
-            log(f"Error getting xray user bandwidth: {e}", "ERROR")
+            log(f"vnstat import failed: {e}", "WARN")
+            return
+        if proc.returncode != 0:
+            return
+        try:
+            data = json.loads(proc.stdout)
+        except ValueError:
+            return
+        if str(data.get("jsonversion", "")) != "2":
+            log("vnstat import skipped: only vnstat 2.x JSON is supported", "WARN")
+            return
+        for iface in data.get("interfaces", []):
+            name = iface.get("name", "")
+            traffic = iface.get("traffic", {})
+            days = {}
+            for entry in traffic.get("day", []):
+                date = entry.get("date", {})
+                try:
+                    day = f"{date['year']:04d}-{date['month']:02d}-{date['day']:02d}"
+                except (KeyError, TypeError, ValueError):
+                    continue
+                days[day] = (int(entry.get("rx", 0)), int(entry.get("tx", 0)))
+            total = traffic.get("total", {})
+            if name and self.store.import_interface_history(
+                    name, days, (int(total.get("rx", 0)), int(total.get("tx", 0)))):
+                log(f"Imported vnstat history for {name} ({len(days)} days)")
 
-        return users
+class BandwidthMonitor:
+    # A bandwidth read within this many seconds counts as someone watching
+    WATCH_WINDOW = 60
 
-    def _get_ssh_user_bandwidth(self):
-        """Get SSH per-user bandwidth from iptables accounting."""
-        users = {}
-        proxy_dir = Path("/root/proxy-users")
-        if not proxy_dir.exists():
-            return users
+    def __init__(self, config, xray_stats=None):
+        self.config = config
+        self.xray_stats = xray_stats or XrayStats(config)
+        self.store = BandwidthStore(DATA_DIR / "bandwidth.db", legacy_json=DATA_DIR / "bandwidth.json")
+        self.interfaces = InterfaceAccountant(self.store, config)
+        self._snapshot = None
+        self.last_read = 0
+        self.wake = threading.Event()
+        self.scanner = ConnectionScanner()
+        self.throughput = ThroughputTracker(config.throughput_samples)
 
-        for f in proxy_dir.glob("*.txt"):
-            username = f.stem
-            uplink = 0
-            downlink = 0
+    def get_system_bandwidth(self):
+        """Get today/month/total traffic of the egress interface from the interface accountant."""
+        try:
+            return self.interfaces.get_summary()
+        except Exception as e:
+            log(f"Error getting system bandwidth: {e}", "ERROR")
+            return {"interface": "", "today": {"rx": 0, "tx": 0},
+                    "month": {"rx": 0, "tx": 0}, "total": {"rx": 0, "tx": 0}}
 
-            try:
-                out_bytes = self._read_iptables_chain_bytes("mangle", f"PROXY_USER_{username}_OUT")
-                in_bytes = self._read_iptables_chain_bytes("mangle", f"PROXY_USER_{username}_IN")
-
-                if out_bytes:
-                    uplink = out_bytes[0]
-                if in_bytes:
-                    downlink = in_bytes[0]
-
-                if out_bytes is None and in_bytes is None:
-                    legacy = self._read_iptables_chain_bytes("filter", f"PROXY_USER_{username}")
-                    if legacy:
-                        uplink = legacy[0] if len(legacy) >= 1 else 0
-                        downlink = legacy[1] if len(legacy) >= 2 else 0
-                        if len(legacy) > 2:
-                            downlink += sum(legacy[2:])
-            except Exception:
-                pass
+    def collect(self):
+        """Collect counters, persist them and publish a new read snapshot.
+
+        Only the BandwidthCollector thread calls this, so it is the single
+        writer. Each snapshot is built from fresh dicts and never mutated
+        after publication; readers just take the current reference.
+        """
+        started = time.time()
+        try:
+            self.interfaces.sample()
+        except Exception as e:
+            log(f"Interface accounting error: {e}", "ERROR")
+        raw_stats = self.persist_stats()
+        users = self._build_user_bandwidth(raw_stats)
+        self._snapshot = {
+            "users": users,
+            "collected_at": time.time(),
+            "duration": round(time.time() - started, 3),
+        }
+
+    def get_user_bandwidth(self):
+        """Get per-user bandwidth from the last published snapshot.
+
+        Never collects inline; a stale snapshot only wakes the collector.
+        """
+        self.last_read = time.time()
+        snapshot = self._snapshot
+        if snapshot is None or self.last_read - snapshot["collected_at"] > self.config.bandwidth_active_interval:
+            self.wake.set()
+        if not snapshot:
+            return {}
+        # Overlay live rates on a shallow copy; the snapshot itself stays untouched
+        rates = self.throughput.get_rates()
+        return {
+            username: {**data, **rates.get(username, {})}
+            for username, data in snapshot["users"].items()
+        }
+
+    def get_counters(self):
+        """{username: (uplink, downlink)} all-time totals from the last snapshot.
+
+        Unlike get_user_bandwidth this does not count as a dashboard read, so
+        scrapes do not switch the collector to its short interval.
+        """
+        snapshot = self._snapshot
+        if not snapshot:
+            return {}
+        return {username: (data["uplink"], data["downlink"])
+                for username, data in snapshot["users"].items()}
+
+    def get_live_throughput(self, username=None):
+        """Current and peak per-user rates, plus the sample history for one user if given."""
+        result = {
+            "interval": self.config.throughput_interval,
+            "window": self.config.throughput_interval * self.throughput.samples,
+            "users": self.throughput.get_rates(),
+        }
+        if username:
+            result["history"] = self.throughput.get_history(username)
+        return result
+
+    def next_interval(self):
+        """Seconds until the next collection: short while the bandwidth view is being read."""
+        if time.time() - self.last_read < self.WATCH_WINDOW:
+            return self.config.bandwidth_active_interval
+        return self.config.bandwidth_interval
+
+    def _build_user_bandwidth(self, raw_stats):
+        """Per-user totals (accumulated + current session) with period summaries and daily breakdown."""
+        totals = self.store.get_totals()
+        now = datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        week_start = (now - timedelta(days=7)).strftime("%Y-%m-%d")
+        month_start = (now - timedelta(days=30)).strftime("%Y-%m-%d")
+        periods = self.store.get_period_totals(today, week_start, month_start)
+        daily = self.store.get_daily(month_start)
 
-            persistent = self._data.get("users", {}).get(username, {})
-            users[username] = {
-                "uplink": uplink + persistent.get("uplink_acc", 0),
-                "downlink": downlink + persistent.get("downlink_acc", 0),
+        users = {}
+        for username, current in raw_stats.items():
+            persistent = totals.get(username, {})
+            data = {
+                "uplink": current.get("uplink", 0) + persistent.get("uplink_acc", 0),
+                "downlink": current.get("downlink", 0) + persistent.get("downlink_acc", 0),
             }
+            period = periods.get(username, {})
+            for name in ("today", "week", "month"):
+                up = period.get(f"{name}_uplink", 0)
+                down = period.get(f"{name}_downlink", 0)
+                data[f"{name}_uplink"] = up
+                data[f"{name}_downlink"] = down
+                data[f"{name}_total"] = up + down
+
+            # Include daily breakdown for frontend charts
+            data["daily"] = daily.get(username, {})
+            users[username] = data
 
         return users
 
-    def persist_stats(self):
-        """Persist current stats to survive restarts and track daily usage."""
-        today = datetime.now().strftime("%Y-%m-%d")
+    def get_user_hourly(self, username, hours=24):
+        """Hourly traffic buckets for one user over the last `hours` hours."""
+        return self.store.get_hourly(username, time.time() - hours * 3600)
 
-        # Reset daily counters if new day
-        last_day = self._data.get("last_reset_day", "")
-        if today != last_day:
-            self._data["last_reset_day"] = today
+    @staticmethod
+    def _read_iptables_save(table):
+        """Dump one table with `iptables-save -c` and return {chain: [rule byte counters]}.
 
-        # Get raw session stats (without accumulated)
-        if self.config.user_management == "v2ray":
-            raw_stats = self._get_raw_xray_stats()
-        else:
-            raw_stats = self._get_raw_ssh_stats()
+        Every chain declared in the table is present (possibly with an empty
+        list). Returns None if the dump fails.
+        """
+        try:
+            result = run_command(
+                ["iptables-save", "-c", "-t", table],
+                capture_output=True, text=True, timeout=10
+            )
+            if result.returncode != 0:
+                return None
+        except Exception:
+            return None
+        return BandwidthMonitor._parse_iptables_save(result.stdout)
 
-        if "daily" not in self._data:
-            self._data["daily"] = {}
+    @staticmethod
+    def _parse_iptables_save(text):
+        """{chain: [rule byte counters]} from `iptables-save -c` output."""
+        chains = {}
+        for line in text.splitlines():
+            if line.startswith(":"):
+                chains.setdefault(line[1:].split(None, 1)[0], [])
+            elif line.startswith("["):
+                # [packets:bytes] -A CHAIN ...
+                counters, _, rule = line.partition(" ")
+                parts = rule.split(None, 2)
+                if len(parts) < 2 or parts[0] != "-A":
+                    continue
+                try:
+                    byte_count = int(counters.strip("[]").split(":")[1])
+                except (IndexError, ValueError):
+                    continue
+                chains.setdefault(parts[1], []).append(byte_count)
+        return chains
+
+    @staticmethod
+    def _read_nft_counters():
+        """Return {counter_name: bytes} from the nftables accounting table, or None if absent."""
+        try:
+            result = run_command(
+                ["nft", "-j", "list", "counters", "table", "inet", NFT_ACCT_TABLE],
+                capture_output=True, text=True, timeout=10
+            )
+            if result.returncode != 0:
+                return None
+            counters = {}
+            for item in json.loads(result.stdout).get("nftables", []):
+                counter = item.get("counter")
+                if counter:
+                    counters[counter.get("name", "")] = int(counter.get("bytes", 0))
+            return counters
+        except Exception:
+            return None
+
+    def _read_ssh_counters(self, usernames):
+        """Read raw uplink/downlink counters for SSH users.
+
+        Users provisioned with the nftables backend are read from its named
+        counters (one `nft` call); everyone else falls back to the iptables
+        accounting chains, dumped once per table rather than per user.
+        """
+        nft = self._read_nft_counters() or {}
+        mangle = None
+        legacy_table = None
+        counters = {}
+
+        for username in usernames:
+            nft_out = nft.get(f"proxy_{username}_out")
+            nft_in = nft.get(f"proxy_{username}_in")
+            if nft_out is not None or nft_in is not None:
+                counters[username] = {"uplink": nft_out or 0, "downlink": nft_in or 0}
+                continue
+
+            if mangle is None:
+                mangle = self._read_iptables_save("mangle") or {}
+            uplink = 0
+            downlink = 0
+            out_bytes = mangle.get(f"PROXY_USER_{username}_OUT")
+            in_bytes = mangle.get(f"PROXY_USER_{username}_IN")
+
+            if out_bytes:
+                uplink = out_bytes[0]
+            if in_bytes:
+                downlink = in_bytes[0]
+
+            if out_bytes is None and in_bytes is None:
+                if legacy_table is None:
+                    legacy_table = self._read_iptables_save("filter") or {}
+                legacy = legacy_table.get(f"PROXY_USER_{username}")
+                if legacy:
+                    uplink = legacy[0]
+                    downlink = sum(legacy[1:])
+
+            counters[username] = {"uplink": uplink, "downlink": downlink}
+
+        return counters
+
+    def persist_stats(self):
+        """Persist current stats to survive restarts and track hourly/daily usage.
+
+        Returns the raw session counters that were read.
+        """
+        # Get raw session stats (without accumulated)
+        raw_stats = self.read_counters()
 
         # Track previous session values to compute deltas
-        prev_session = self._data.get("prev_session", {})
+        prev_session = self.store.get_prev_session()
+        deltas = {}
 
         for username, stats in raw_stats.items():
             up = stats.get("uplink", 0)
@@ -1246,37 +2717,28 @@ class BandwidthMonitor:
             if down < prev.get("downlink", 0):
                 delta_down = down
 
-            # Update accumulated totals
-            if username not in self._data["users"]:
-                self._data["users"][username] = {"uplink_acc": 0, "downlink_acc": 0}
-            self._data["users"][username]["uplink_acc"] += delta_up
-            self._data["users"][username]["downlink_acc"] += delta_down
-
-            # Update daily totals
-            if username not in self._data["daily"]:
-                self._data["daily"][username] = {}
-            if today not in self._data["daily"][username]:
-                self._data["daily"][username][today] = {"uplink": 0, "downlink": 0}
-            self._data["daily"][username][today]["uplink"] += delta_up
-            self._data["daily"][username][today]["downlink"] += delta_down
-
-            # Clean old daily data (keep 30 days)
-            user_days = self._data["daily"][username]
-            cutoff = (datetime.now().timestamp() - 30 * 86400)
-            for day_key in list(user_days.keys()):
-                try:
-                    day_ts = datetime.strptime(day_key, "%Y-%m-%d").timestamp()
-                    if day_ts < cutoff:
-                        del user_days[day_key]
-                except ValueError:
-                    pass
+            deltas[username] = {"uplink": delta_up, "downlink": delta_down}
 
-        # Store current session values for next delta calculation
-        self._data["prev_session"] = raw_stats
-        self._data["last_update"] = time.time()
-        self._save_data()
+        # Store deltas and current session values in one transaction
+        try:
+            self.store.record(deltas, raw_stats)
+        except Exception as e:
+            log(f"Error saving bandwidth data: {e}", "ERROR")
+        return raw_stats
 
-    def _get_raw_xray_stats(self):
+    def read_counters(self, max_age=None):
+        """Raw session counters {username: {"uplink", "downlink"}} for the active layer."""
+        if self.config.user_management == "v2ray":
+            return self._get_raw_xray_stats(max_age)
+        return self._get_raw_ssh_stats()
+
+    def counters_taken_at(self):
+        """When the counters read_counters() returns were taken."""
+        if self.config.user_management == "v2ray":
+            return self.xray_stats.taken_at
+        return time.time()
+
+    def _get_raw_xray_stats(self, max_age=None):
         """Get raw Xray session stats (without accumulated data)."""
         users = {}
         users_file = "/usr/local/etc/xray/users.json"
@@ -1287,41 +2749,14 @@ class BandwidthMonitor:
             with open(users_file) as f:
                 user_data = json.load(f)
 
-            stats_port = self.config.xray_stats_port
+            # One query for all users instead of two per user
+            snapshot = self.xray_stats.get_user_stats(max_age)
             for username in user_data:
-                email = f"{username}@proxy"
-                uplink = 0
-                downlink = 0
-
-                try:
-                    result = subprocess.run(
-                        ["xray", "api", "statsquery",
-                         f"--server=127.0.0.1:{stats_port}",
-                         f"-pattern=user>>>{email}>>>traffic>>>uplink"],
-                        capture_output=True, text=True, timeout=10
-                    )
-                    if result.returncode == 0:
-                        match = re.search(r'"value":\s*"?(\d+)"?', result.stdout)
-                        if match:
-                            uplink = int(match.group(1))
-                except Exception:
-                    pass
-
-                try:
-                    result = subprocess.run(
-                        ["xray", "api", "statsquery",
-                         f"--server=127.0.0.1:{stats_port}",
-                         f"-pattern=user>>>{email}>>>traffic>>>downlink"],
-                        capture_output=True, text=True, timeout=10
-                    )
-                    if result.returncode == 0:
-                        match = re.search(r'"value":\s*"?(\d+)"?', result.stdout)
-                        if match:
-                            downlink = int(match.group(1))
-                except Exception:
-                    pass
-
-                users[username] = {"uplink": uplink, "downlink": downlink}
+                current = snapshot.get(username, {})
+                users[username] = {
+                    "uplink": current.get("uplink", 0),
+                    "downlink": current.get("downlink", 0),
+                }
         except Exception as e:
             log(f"Error getting raw xray stats: {e}", "ERROR")
 
@@ -1329,64 +2764,203 @@ class BandwidthMonitor:
 
     def _get_raw_ssh_stats(self):
         """Get raw SSH session stats from iptables (without accumulated data)."""
-        users = {}
         proxy_dir = Path("/root/proxy-users")
         if not proxy_dir.exists():
-            return users
+            return {}
+        return self._read_ssh_counters([f.stem for f in proxy_dir.glob("*.txt")])
 
-        for f in proxy_dir.glob("*.txt"):
-            username = f.stem
-            uplink = 0
-            downlink = 0
-
-            try:
-                out_bytes = self._read_iptables_chain_bytes("mangle", f"PROXY_USER_{username}_OUT")
-                in_bytes = self._read_iptables_chain_bytes("mangle", f"PROXY_USER_{username}_IN")
-
-                if out_bytes:
-                    uplink = out_bytes[0]
-                if in_bytes:
-                    downlink = in_bytes[0]
-
-                if out_bytes is None and in_bytes is None:
-                    legacy = self._read_iptables_chain_bytes("filter", f"PROXY_USER_{username}")
-                    if legacy:
-                        uplink = legacy[0] if len(legacy) >= 1 else 0
-                        downlink = legacy[1] if len(legacy) >= 2 else 0
-                        if len(legacy) > 2:
-                            downlink += sum(legacy[2:])
-            except Exception:
-                pass
-
-            users[username] = {"uplink": uplink, "downlink": downlink}
+    def get_connections(self, ports):
+        """Get active connections on the given local ports.
 
-        return users
+        The scan is shared through RESPONSE_CACHE, so the summary, a page of
+        the list and the event stream requested together cost one pass over /proc.
+        """
+        return RESPONSE_CACHE.get(("connections", tuple(ports)), lambda: self._scan_connections(ports))
 
-    def get_connections(self):
-        """Get active connections."""
-        connections = []
+    def _scan_connections(self, ports):
         try:
-            result = subprocess.run(
-                ["ss", "-tnp"],
-                capture_output=True, text=True, timeout=10
-            )
-            if result.returncode == 0:
-                for line in result.stdout.splitlines()[1:]:
-                    parts = line.split()
-                    if len(parts) >= 5:
-                        state = parts[0]
-                        local = parts[3]
-                        remote = parts[4]
-                        # Filter for proxy port connections
-                        if ":443" in local or ":22" in local:
-                            connections.append({
-                                "state": state,
-                                "local": local,
-                                "remote": remote,
-                                "process": parts[5] if len(parts) > 5 else ""
-                            })
+            connections = self.scanner.scan(ports)
+            if self.config.user_management == "v2ray":
+                # Xray owns every socket; attribute by the client's IP instead.
+                # Users moving traffic right now are the candidates when
+                # xray cannot list its online users itself.
+                rates = self.throughput.get_rates()
+                candidates = [u for u, r in rates.items()
+                              if r["uplink_bps"] or r["downlink_bps"]] if rates else None
+                ip_users = self.xray_stats.get_online_ips(candidates)
+                for conn in connections:
+                    conn["user"] = ip_users.get(_endpoint_ip(conn["remote"]), "")
         except Exception as e:
             log(f"Error getting connections: {e}", "ERROR")
+            connections = []
+        return connections
+
+# ─── Connection Scanner ───────────────────────────────────────────────────────
+
+# /proc/net/tcp state codes, named as ss prints them
+TCP_STATES = {
+    "01": "ESTAB", "02": "SYN-SENT", "03": "SYN-RECV", "04": "FIN-WAIT-1",
+    "05": "FIN-WAIT-2", "06": "TIME-WAIT", "07": "UNCONN", "08": "CLOSE-WAIT",
+    "09": "LAST-ACK", "0A": "LISTEN", "0B": "CLOSING",
+}
+
+def _decode_proc_addr(hex_addr):
+    """'0100007F:01BB' -> ('127.0.0.1', 443); IPv4-mapped IPv6 comes back as IPv4."""
+    ip_hex, port_hex = hex_addr.split(":")
+    raw = bytes.fromhex(ip_hex)
+    if len(raw) == 4:
+        return socket.inet_ntop(socket.AF_INET, raw[::-1]), int(port_hex, 16)
+    # Four host-endian 32-bit words
+    raw = b"".join(raw[i:i + 4][::-1] for i in range(0, 16, 4))
+    if raw[:12] == b"\x00" * 10 + b"\xff\xff":
+        return socket.inet_ntop(socket.AF_INET, raw[12:]), int(port_hex, 16)
+    return socket.inet_ntop(socket.AF_INET6, raw), int(port_hex, 16)
+
+def _format_endpoint(ip, port):
+    return f"[{ip}]:{port}" if ":" in ip else f"{ip}:{port}"
+
+def _endpoint_ip(endpoint):
+    """'1.2.3.4:443' -> '1.2.3.4', '[::1]:443' -> '::1'."""
+    return endpoint.rpartition(":")[0].strip("[]")
+
+def summarize_connections(connections, top=10):
+    """Counts by state, by user and by remote IP, plus the top-N remote IPs."""
+    by_state = Counter(c["state"] for c in connections)
+    by_user = Counter(c["user"] or "-" for c in connections)
+    by_remote = Counter(_endpoint_ip(c["remote"]) for c in connections)
+    top_remotes = by_remote.most_common(top)
+    top_ips = {ip for ip, _ in top_remotes}
+    remote_users = defaultdict(set)
+    for c in connections:
+        if c["user"]:
+            ip = _endpoint_ip(c["remote"])
+            if ip in top_ips:
+                remote_users[ip].add(c["user"])
+    return {
+        "total": len(connections),
+        "unique_remotes": len(by_remote),
+        "by_state": dict(by_state.most_common()),
+        "by_user": dict(by_user.most_common()),
+        "top_remotes": [
+            {"ip": ip, "count": count, "users": sorted(remote_users.get(ip, ()))}
+            for ip, count in top_remotes
+        ],
+    }
+
+def filter_connections(connections, state="", user="", query=""):
+    """Exact state/user match and a substring match on remote, local or process."""
+    result = connections
+    if state:
+        result = [c for c in result if c["state"] == state]
+    if user:
+        # "-" is how summaries label unattributed connections
+        wanted = "" if user == "-" else user
+        result = [c for c in result if c["user"] == wanted]
+    if query:
+        result = [c for c in result
+                  if query in c["remote"] or query in c["local"] or query in c["process"]]
+    return result
+
+class ConnectionScanner:
+    """Reads TCP sockets from /proc/net/tcp{,6} and attributes them to processes.
+
+    Sockets are filtered on the exact local port before anything is decoded,
+    and the /proc/<pid>/fd walk for inode -> pid only runs when something
+    matched.
+    """
+
+    def __init__(self):
+        self._usernames = {}
+
+    def _username(self, uid):
+        name = self._usernames.get(uid)
+        if name is None:
+            try:
+                name = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                name = str(uid)
+            self._usernames[uid] = name
+        return name
+
+    @staticmethod
+    def _read_sockets(ports, paths=("/proc/net/tcp", "/proc/net/tcp6")):
+        """[(state, local_hex, remote_hex, inode)] for non-listening sockets on ports."""
+        wanted = {f"{port:04X}" for port in ports}
+        sockets = []
+        for path in paths:
+            try:
+                with open(path) as f:
+                    next(f)
+                    for line in f:
+                        fields = line.split()
+                        if fields[1][-4:] not in wanted or fields[3] == "0A":
+                            continue
+                        sockets.append((fields[3], fields[1], fields[2], fields[9]))
+            except (OSError, StopIteration):
+                continue
+        return sockets
+
+    @staticmethod
+    def _socket_owners(inodes):
+        """{inode: [pid, ...]} for the given socket inodes."""
+        owners = defaultdict(list)
+        targets = {f"socket:[{inode}]" for inode in inodes}
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            fd_dir = f"/proc/{pid}/fd"
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    link = os.readlink(f"{fd_dir}/{fd}")
+                except OSError:
+                    continue
+                if link in targets:
+                    owners[link[8:-1]].append(int(pid))
+        return owners
+
+    def _process_info(self, pids, cache):
+        """(comm, pid, user) for the socket holder, preferring a non-root process.
+
+        OpenSSH's privileged monitor and the per-user child share the socket;
+        the child carries the user's uid.
+        """
+        best = None
+        for pid in pids:
+            info = cache.get(pid)
+            if info is None:
+                try:
+                    with open(f"/proc/{pid}/comm") as f:
+                        comm = f.read().strip()
+                    uid = os.stat(f"/proc/{pid}").st_uid
+                except OSError:
+                    continue
+                info = cache[pid] = (comm, pid, uid)
+            if best is None or (best[2] == 0 and info[2] != 0):
+                best = info
+        if best is None:
+            return "", None, ""
+        return best[0], best[1], self._username(best[2])
+
+    def scan(self, ports):
+        sockets = self._read_sockets(ports)
+        # TIME-WAIT and other orphaned sockets have inode 0
+        owners = self._socket_owners({s[3] for s in sockets if s[3] != "0"}) if sockets else {}
+        proc_cache = {}
+        connections = []
+        for state, local_hex, remote_hex, inode in sockets:
+            process, pid, user = self._process_info(owners.get(inode, ()), proc_cache)
+            connections.append({
+                "state": TCP_STATES.get(state, state),
+                "local": _format_endpoint(*_decode_proc_addr(local_hex)),
+                "remote": _format_endpoint(*_decode_proc_addr(remote_hex)),
+                "process": process,
+                "pid": pid,
+                "user": user,
+            })
         return connections
 
 # ─── Background Bandwidth Collector ───────────────────────────────────────────
@@ -1398,11 +2972,534 @@ class BandwidthCollector(threading.Thread):
 
     def run(self):
         while True:
+            started = time.monotonic()
             try:
-                self.monitor.persist_stats()
+                self.monitor.collect()
             except Exception as e:
                 log(f"Bandwidth collector error: {e}", "ERROR")
-            time.sleep(300)  # Every 5 minutes
+            COLLECTOR_DURATION.observe("bandwidth", time.monotonic() - started)
+            # bandwidth_interval normally, bandwidth_active_interval while the dashboard is open;
+            # a request that finds the snapshot stale wakes us early
+            self.monitor.wake.wait(self.monitor.next_interval())
+            self.monitor.wake.clear()
+
+# ─── Live Throughput ──────────────────────────────────────────────────────────
+
+class ThroughputTracker:
+    """Per-user throughput (bits/sec) over a sliding window of samples.
+
+    Each user has a fixed-size ring buffer, and users that disappear from the
+    counters are dropped, so memory stays bounded however long the panel
+    runs. Only the sampler thread mutates the buffers; readers get the
+    rates dict published after each sample.
+    """
+
+    def __init__(self, samples=60):
+        self.samples = samples
+        self._last = {}     # username -> (ts, uplink_bytes, downlink_bytes)
+        self._buffers = {}  # username -> deque[(ts, uplink_bps, downlink_bps)]
+        self._rates = {}
+
+    def add_sample(self, counters, ts=None):
+        ts = ts or time.time()
+        for username, vals in counters.items():
+            up = vals.get("uplink", 0)
+            down = vals.get("downlink", 0)
+            prev = self._last.get(username)
+            self._last[username] = (ts, up, down)
+            if prev is None or ts <= prev[0]:
+                continue
+            elapsed = ts - prev[0]
+            # A counter that went backwards was reset (xray restart); skip that interval
+            up_bps = (up - prev[1]) * 8 / elapsed if up >= prev[1] else 0
+            down_bps = (down - prev[2]) * 8 / elapsed if down >= prev[2] else 0
+            buf = self._buffers.get(username)
+            if buf is None:
+                buf = self._buffers[username] = deque(maxlen=self.samples)
+            buf.append((ts, int(up_bps), int(down_bps)))
+
+        for username in list(self._last):
+            if username not in counters:
+                del self._last[username]
+                self._buffers.pop(username, None)
+
+        rates = {}
+        for username, buf in self._buffers.items():
+            if not buf:
+                continue
+            _, up_bps, down_bps = buf[-1]
+            rates[username] = {
+                "uplink_bps": up_bps,
+                "downlink_bps": down_bps,
+                "peak_uplink_bps": max(s[1] for s in buf),
+                "peak_downlink_bps": max(s[2] for s in buf),
+            }
+        self._rates = rates
+
+    def get_rates(self):
+        """{username: {uplink_bps, downlink_bps, peak_uplink_bps, peak_downlink_bps}}"""
+        return self._rates
+
+    def get_history(self, username):
+        """[{"ts", "uplink_bps", "downlink_bps"}] for one user, oldest first."""
+        buf = self._buffers.get(username)
+        if not buf:
+            return []
+        return [{"ts": ts, "uplink_bps": up, "downlink_bps": down} for ts, up, down in list(buf)]
+
+class ThroughputSampler(threading.Thread):
+    def __init__(self, bandwidth_monitor, interval=5):
+        super().__init__(daemon=True)
+        self.monitor = bandwidth_monitor
+        self.interval = interval
+
+    def sample(self):
+        # Go through the shared xray snapshot, so a collection taken within the
+        # last interval is reused and a query in backoff costs nothing. The sample
+        # is stamped with the snapshot's own time, which keeps rates exact and
+        # skips a snapshot that was already sampled.
+        counters = self.monitor.read_counters(max_age=self.interval)
+        self.monitor.throughput.add_sample(counters, self.monitor.counters_taken_at())
+
+    def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                log(f"Throughput sampler error: {e}", "ERROR")
+            COLLECTOR_DURATION.observe("throughput", time.monotonic() - started)
+            time.sleep(self.interval)
+
+# ─── System Resource Sampler ──────────────────────────────────────────────────
+
+class SystemSampler(threading.Thread):
+    """Samples /proc at a fixed interval and keeps a ring buffer of the results.
+
+    CPU, network and disk figures are deltas between consecutive samples, so
+    they reflect current load rather than the average since boot.
+    """
+
+    def __init__(self, interval=5, samples=720):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self._history = deque(maxlen=samples)
+        self._current = None
+        self._prev = None
+        # Physical block devices only; loop, zram and dm devices would double count
+        self._disks = sorted(p.parent.name for p in Path("/sys/block").glob("*/device"))
+
+    @staticmethod
+    def _read_cpu_times():
+        """{"cpu": (busy, total), "cpu0": ...} in jiffies, plus iowait/steal for "cpu"."""
+        times = {}
+        with open("/proc/stat") as f:
+            for line in f:
+                if not line.startswith("cpu"):
+                    break
+                parts = line.split()
+                values = [int(v) for v in parts[1:]]
+                # user nice system idle iowait irq softirq steal (guest is already in user)
+                values = (values + [0] * 8)[:8]
+                total = sum(values)
+                idle = values[3] + values[4]
+                times[parts[0]] = (total - idle, total, values[4], values[7])
+        return times
+
+    @staticmethod
+    def _read_meminfo():
+        mem = {}
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                mem[key] = int(rest.split()[0])
+        return mem
+
+    @staticmethod
+    def _read_loadavg():
+        with open("/proc/loadavg") as f:
+            parts = f.read().split()
+        running, total = parts[3].split("/")
+        return [float(parts[0]), float(parts[1]), float(parts[2])], int(running), int(total)
+
+    def _read_diskstats(self):
+        """{disk: (read_bytes, write_bytes, io_ms)} for physical disks."""
+        counters = {}
+        with open("/proc/diskstats") as f:
+            for line in f:
+                fields = line.split()
+                if fields[2] in self._disks:
+                    counters[fields[2]] = (int(fields[5]) * 512, int(fields[9]) * 512, int(fields[12]))
+        return counters
+
+    def sample(self):
+        now = time.time()
+        raw = {
+            "cpu": self._read_cpu_times(),
+            "net": read_proc_net_dev(),
+            "disk": self._read_diskstats(),
+        }
+        prev, self._prev = self._prev, (now, raw)
+        if prev is None:
+            return None
+        elapsed = now - prev[0]
+        if elapsed <= 0:
+            return None
+        old = prev[1]
+
+        def cpu_pct(name):
+            busy, total, iowait, steal = raw["cpu"][name]
+            if name not in old["cpu"]:
+                return 0.0, 0.0, 0.0
+            o_busy, o_total, o_iowait, o_steal = old["cpu"][name]
+            d_total = total - o_total
+            if d_total <= 0:
+                return 0.0, 0.0, 0.0
+            return (round(100 * (busy - o_busy) / d_total, 1),
+                    round(100 * (iowait - o_iowait) / d_total, 1),
+                    round(100 * (steal - o_steal) / d_total, 1))
+
+        def rate(new, prev_value):
+            # Counters reset when an interface or disk is re-created
+            return max(new - prev_value, 0) / elapsed
+
+        cpu_total, iowait, steal = cpu_pct("cpu")
+        per_core = [cpu_pct(name)[0] for name in raw["cpu"] if name != "cpu"]
+
+        mem = self._read_meminfo()
+        mem_total = mem.get("MemTotal", 0)
+        mem_used = mem_total - mem.get("MemAvailable", mem.get("MemFree", 0))
+        swap_total = mem.get("SwapTotal", 0)
+        swap_used = swap_total - mem.get("SwapFree", 0)
+
+        load, running, procs = self._read_loadavg()
+
+        interfaces = {}
+        for name, (rx, tx) in raw["net"].items():
+            o_rx, o_tx = old["net"].get(name, (rx, tx))
+            interfaces[name] = {
+                "rx_bps": int(rate(rx, o_rx) * 8),
+                "tx_bps": int(rate(tx, o_tx) * 8),
+            }
+
+        disks = {}
+        for name, (rd, wr, io_ms) in raw["disk"].items():
+            o_rd, o_wr, o_io_ms = old["disk"].get(name, (rd, wr, io_ms))
+            disks[name] = {
+                "read_bps": int(rate(rd, o_rd)),
+                "write_bps": int(rate(wr, o_wr)),
+                "util": round(min(100.0, rate(io_ms, o_io_ms) / 10), 1),
+            }
+
+        current = {
+            "ts": int(now),
+            "interval": round(elapsed, 2),
+            "cpu": {"percent": cpu_total, "iowait": iowait, "steal": steal, "per_core": per_core},
+            "memory": {
+                "total_kb": mem_total,
+                "used_kb": mem_used,
+                "percent": round(100 * mem_used / mem_total, 1) if mem_total else 0,
+                "swap_total_kb": swap_total,
+                "swap_used_kb": swap_used,
+            },
+            "load": {"avg": load, "running": running, "processes": procs},
+            "net": {
+                "rx_bps": sum(i["rx_bps"] for i in interfaces.values()),
+                "tx_bps": sum(i["tx_bps"] for i in interfaces.values()),
+                "interfaces": interfaces,
+            },
+            "disk": {
+                "read_bps": sum(d["read_bps"] for d in disks.values()),
+                "write_bps": sum(d["write_bps"] for d in disks.values()),
+                "devices": disks,
+            },
+        }
+        self._current = current
+        self._history.append({
+            "ts": current["ts"],
+            "cpu": cpu_total,
+            "iowait": iowait,
+            "mem": current["memory"]["percent"],
+            "load1": load[0],
+            "rx_bps": current["net"]["rx_bps"],
+            "tx_bps": current["net"]["tx_bps"],
+            "disk_read_bps": current["disk"]["read_bps"],
+            "disk_write_bps": current["disk"]["write_bps"],
+        })
+        return current
+
+    def get_current(self):
+        return self._current
+
+    def get_history(self, seconds=None):
+        """Flattened samples, oldest first, optionally limited to the last N seconds."""
+        history = list(self._history)
+        if seconds:
+            cutoff = time.time() - seconds
+            history = [h for h in history if h["ts"] >= cutoff]
+        return history
+
+    def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                log(f"System sampler error: {e}", "ERROR")
+            COLLECTOR_DURATION.observe("system", time.monotonic() - started)
+            time.sleep(self.interval)
+
+# ─── Event Stream ─────────────────────────────────────────────────────────────
+
+# Reconnect quickly when the panel restarts (e.g. during a layer switch)
+SSE_RETRY = b"retry: 2000\n\n"
+SSE_PING = b": ping\n\n"
+SSE_KEEPALIVE = 15
+
+class EventHub(threading.Thread):
+    """Computes each topic once per interval and fans it out to SSE subscribers.
+
+    topics maps name -> (interval_seconds, producer). Producers only run while
+    at least one subscriber wants the topic.
+    """
+
+    QUEUE_SIZE = 32
+
+    def __init__(self, topics):
+        super().__init__(daemon=True)
+        self.topics = topics
+        self._subscribers = {}
+        self._latest = {}
+        self._due = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def subscribe(self, topics, q=None, since=None):
+        """Register a subscriber queue; cached fresh payloads are queued at once.
+
+        q may be any object with a queue.Queue-style put_nowait. since is when
+        the client last fetched these topics itself (e.g. via /api/dashboard);
+        while that is within a topic's interval no snapshot is sent or computed.
+        """
+        if q is None:
+            q = queue.Queue(maxsize=self.QUEUE_SIZE)
+        now = time.time()
+        with self._lock:
+            self._subscribers[q] = set(topics)
+            for topic in topics:
+                interval = self.topics[topic][0]
+                latest = self._latest.get(topic)
+                if latest and latest[1] is not None and now - latest[0] < interval \
+                        and (since is None or latest[0] > since):
+                    q.put_nowait(latest[1])
+                elif since is not None and 0 <= now - since < interval:
+                    # Client is current; a placeholder makes the next run wait out the interval
+                    if not latest:
+                        self._latest[topic] = (since, None)
+                else:
+                    self._due.add(topic)
+        self._wake.set()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.pop(q, None)
+
+    def refresh(self, topic):
+        """Recompute a topic on the next tick instead of waiting for its interval."""
+        with self._lock:
+            self._due.add(topic)
+        self._wake.set()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _publish(self, topic, data):
+        message = f"event: {topic}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+        with self._lock:
+            self._latest[topic] = (time.time(), message)
+            for q, wanted in self._subscribers.items():
+                if topic in wanted:
+                    try:
+                        q.put_nowait(message)
+                    except queue.Full:
+                        # Slow client; it will catch up on the next event
+                        pass
+
+    def run(self):
+        while True:
+            now = time.time()
+            with self._lock:
+                wanted = set().union(*self._subscribers.values()) if self._subscribers else set()
+                due = self._due & wanted
+                self._due.clear()
+            for topic in wanted:
+                interval, producer = self.topics[topic]
+                latest = self._latest.get(topic)
+                if topic not in due and latest and now - latest[0] < interval:
+                    continue
+                try:
+                    self._publish(topic, producer())
+                except Exception as e:
+                    log(f"Event producer '{topic}' error: {e}", "ERROR")
+            self._wake.wait(timeout=1)
+            self._wake.clear()
+
+# ─── Static Assets ────────────────────────────────────────────────────────────
+
+STATIC_CONTENT_TYPES = {
+    ".css": "text/css",
+    ".js": "application/javascript",
+    ".html": "text/html; charset=utf-8",
+    ".ico": "image/x-icon",
+    ".png": "image/png",
+    ".svg": "image/svg+xml",
+}
+# Types worth compressing; images are already compressed (or tiny)
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "image/svg+xml")
+STATIC_URL_RE = re.compile(r"""(?<=["'])/static/([\w.-]+)(?=["'])""")
+
+class AssetCache:
+    """Static files and page templates, read once at startup.
+
+    Each asset keeps its bytes, a gzip variant (when smaller) and a strong
+    ETag from its content hash. Static files are also reachable under a
+    hashed URL (/static/app.<hash>.js) that can be cached forever; the
+    templates are rewritten to link those, so a changed file gets a new URL.
+    """
+
+    IMMUTABLE = "public, max-age=31536000, immutable"
+
+    def __init__(self, static_dir, templates_dir):
+        self.static_dir = Path(static_dir)
+        self.templates_dir = Path(templates_dir)
+        self.static = {}   # URL path (plain and hashed) -> asset
+        self.pages = {}    # template file name -> asset
+
+    @staticmethod
+    def _build(body, content_type):
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        asset = {"body": body, "type": content_type, "hash": digest,
+                 "etag": f'"{digest}"', "gzip": None, "gzip_etag": f'"{digest}-gz"'}
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                asset["gzip"] = compressed
+        return asset
+
+    def load(self):
+        static = {}
+        for path in sorted(self.static_dir.iterdir()) if self.static_dir.is_dir() else []:
+            if not path.is_file():
+                continue
+            asset = self._build(path.read_bytes(),
+                                STATIC_CONTENT_TYPES.get(path.suffix.lower(), "application/octet-stream"))
+            asset["url"] = f"/static/{path.stem}.{asset['hash'][:10]}{path.suffix}"
+            static[f"/static/{path.name}"] = asset
+            static[asset["url"]] = asset
+
+        def hashed_url(match):
+            asset = static.get(match.group(0))
+            return asset["url"] if asset else match.group(0)
+
+        pages = {}
+        for path in sorted(self.templates_dir.glob("*.html")) if self.templates_dir.is_dir() else []:
+            html = STATIC_URL_RE.sub(hashed_url, path.read_text())
+            pages[path.name] = self._build(html.encode(), STATIC_CONTENT_TYPES[".html"])
+
+        self.static, self.pages = static, pages
+        assets = list({id(a): a for a in static.values()}.values()) + list(pages.values())
+        raw = sum(len(a["body"]) for a in assets)
+        packed = sum(len(a["gzip"] or a["body"]) for a in assets)
+        log(f"Loaded {len(assets)} static assets ({raw // 1024} KB, {packed // 1024} KB gzipped)")
+
+    def cache_control(self, url_path):
+        """Hashed URLs never change; plain ones are revalidated after an hour."""
+        asset = self.static.get(url_path)
+        return self.IMMUTABLE if asset and asset["url"] == url_path else "public, max-age=3600"
+
+# ─── Routing ──────────────────────────────────────────────────────────────────
+
+ROUTE_PARAM_RE = re.compile(r"<(\w+)>")
+
+class Route:
+    """One entry of the route table: a method, a path with <param>s and its requirements."""
+
+    def __init__(self, method, path, handler, auth=True, csrf=False, stream=False):
+        self.method = method
+        self.path = path
+        self.handler = handler
+        self.auth = auth
+        self.csrf = csrf
+        self.stream = stream
+        self.name = f"{method} {path}"
+        self.regex = re.compile("^" + ROUTE_PARAM_RE.sub(r"(?P<\1>[^/]+)", re.escape(path)) + "$")
+
+class Router:
+    """Resolves method + path against a route table; exact paths are a dict lookup."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self._exact = {(r.method, r.path): r for r in routes if "<" not in r.path}
+        self._patterns = [r for r in routes if "<" in r.path]
+
+    def match(self, method, path):
+        """Return (route, params), or (None, allowed_methods) if nothing matches."""
+        route = self._exact.get((method, path))
+        if route:
+            return route, {}
+        for route in self._patterns:
+            if route.method == method:
+                m = route.regex.match(path)
+                if m:
+                    return route, {k: unquote(v) for k, v in m.groupdict().items()}
+        allowed = sorted({r.method for r in self.routes
+                          if r.path == path or ("<" in r.path and r.regex.match(path))})
+        return None, allowed
+
+class RouteStats:
+    """Request and error counts plus a latency histogram per route."""
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.latency = Histogram(self.BUCKETS)
+        self._lock = threading.Lock()
+        self._counts = defaultdict(Counter)  # route -> {"requests", "client_errors", "errors"}
+
+    def record(self, route, status, seconds=None):
+        with self._lock:
+            counts = self._counts[route]
+            counts["requests"] += 1
+            if status >= 500:
+                counts["errors"] += 1
+            elif status >= 400:
+                counts["client_errors"] += 1
+        if seconds is not None:
+            self.latency.observe(route, seconds)
+
+    def counts(self):
+        with self._lock:
+            return {route: dict(c) for route, c in self._counts.items()}
+
+    def summary(self):
+        """Per-route counts and p50/p95/p99/mean latency in milliseconds, slowest p95 first."""
+        latency = self.latency.snapshot()
+        rows = []
+        for route, counts in self.counts().items():
+            row = {"route": route, "requests": counts.get("requests", 0),
+                   "client_errors": counts.get("client_errors", 0), "errors": counts.get("errors", 0)}
+            if route in latency:
+                buckets, count, total = latency[route]
+                for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                    row[f"{name}_ms"] = round(self.latency.quantile(q, buckets, count) * 1000, 2)
+                row["mean_ms"] = round(total / count * 1000, 2) if count else 0
+            rows.append(row)
+        rows.sort(key=lambda r: r.get("p95_ms", 0), reverse=True)
+        return rows
+
+ROUTE_STATS = RouteStats()
 
 # ─── HTTP Request Handler ─────────────────────────────────────────────────────
 
@@ -1423,22 +3520,279 @@ _switch_state = {
     "error": "",
 }
 _switch_lock = threading.Lock()
+_event_hub = None
+_system_sampler = None
+_http_server = None
+_assets = None
+_tls = None
+
+def _system_info_payload():
+    info = SystemInfo.get_info()
+    # Prefer the sampler's interval CPU% over the since-boot average
+    current = _system_sampler.get_current() if _system_sampler else None
+    if current:
+        info["cpu_usage"] = current["cpu"]["percent"]
+    info["layer"] = _layer_mgr.layer
+    info["service"] = _layer_mgr.get_service_name()
+    return info
+
+def _layers_payload():
+    layers = []
+    for layer_def in LAYER_DEFINITIONS:
+        layers.append({
+            **layer_def,
+            "active": layer_def["id"] == _layer_mgr.layer,
+        })
+    return {"layers": layers, "current": _layer_mgr.layer}
+
+def _switch_status_payload():
+    return {
+        "in_progress": _switch_state["in_progress"],
+        "phase": _switch_state["phase"],
+        "target_layer": _switch_state["target_layer"],
+        "progress_pct": _switch_state["progress_pct"],
+        "log_lines": _switch_state["log_lines"][-20:],
+        "error": _switch_state["error"],
+    }
+
+def _user_summary():
+    users = RESPONSE_CACHE.get("users", _layer_mgr.list_users)
+    return {
+        "total": len(users),
+        "connected": sum(1 for u in users if u.get("connected")),
+        # V2Ray users carry no session count; a connected one counts once
+        "sessions": sum(u.get("sessions", 1 if u.get("connected") else 0) for u in users),
+    }
+
+# Fields served by /api/dashboard, in response order
+DASHBOARD_FIELDS = {
+    "overview": lambda: RESPONSE_CACHE.get("system_info", _system_info_payload),
+    "status": lambda: SystemInfo.get_all_services_status(),
+    "users": _user_summary,
+    "layers": _layers_payload,
+}
+_dashboard_pool = ThreadPoolExecutor(max_workers=len(DASHBOARD_FIELDS), thread_name_prefix="dashboard")
+
+def _dashboard_payload(fields):
+    """Compute the requested dashboard fields in parallel.
+
+    A field that fails is reported under "errors" so the rest still render.
+    """
+    # Taken before computing, so anything that changes meanwhile shows up in the next event
+    result, errors = {"time": time.time()}, {}
+    futures = {name: _dashboard_pool.submit(DASHBOARD_FIELDS[name]) for name in fields}
+    for name, future in futures.items():
+        try:
+            result[name] = future.result()
+        except Exception as e:
+            log(f"Dashboard field {name} failed: {e}", "ERROR")
+            errors[name] = str(e)
+    if errors:
+        result["errors"] = errors
+    return result
+
+def _session_user(cookie_header):
+    for part in (cookie_header or "").split(";"):
+        part = part.strip()
+        if part.startswith("session="):
+            return _sessions.validate_token(part[len("session="):])
+    return None
+
+def _event_topics(url):
+    """Known topics named in the ?topics= list of an /api/events URL."""
+    requested = parse_qs(urlparse(url).query).get("topics", [""])[0].split(",")
+    return [t for t in requested if t in _event_hub.topics]
+
+def _event_since(url):
+    """The ?since= timestamp of an /api/events URL, or None."""
+    try:
+        return float(parse_qs(urlparse(url).query)["since"][0])
+    except (KeyError, ValueError):
+        return None
+
+def _metric_labels(labels):
+    if not labels:
+        return ""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+def _render_metrics():
+    """Prometheus text exposition (format 0.0.4) of the panel's state."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_metric_labels(labels)} {value}")
+
+    def histogram(name, help_text, hist, label):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for value, (buckets, count, total) in sorted(hist.snapshot().items()):
+            bounds = [str(b) for b in hist.buckets] + ["+Inf"]
+            for bound, cumulative in zip(bounds, buckets):
+                lines.append(f"{name}_bucket{_metric_labels({label: value, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{_metric_labels({label: value})} {round(total, 6)}")
+            lines.append(f"{name}_count{_metric_labels({label: value})} {count}")
+
+    metric("proxy_panel_info", "gauge", "Active layer and user management mode.",
+           [({"layer": _config.layer, "user_management": _config.user_management}, 1)])
+
+    counters = _bandwidth.get_counters()
+    metric("proxy_panel_user_uplink_bytes_total", "counter", "Bytes uploaded per user.",
+           [({"user": u}, up) for u, (up, _) in sorted(counters.items())])
+    metric("proxy_panel_user_downlink_bytes_total", "counter", "Bytes downloaded per user.",
+           [({"user": u}, down) for u, (_, down) in sorted(counters.items())])
+
+    connections = _bandwidth.get_connections(_layer_mgr.get_proxy_ports())
+    by_state = Counter(c["state"] for c in connections)
+    by_user = Counter(c["user"] for c in connections if c.get("user"))
+    metric("proxy_panel_connections", "gauge", "Proxy connections by TCP state.",
+           [({"state": state}, n) for state, n in sorted(by_state.items())])
+    metric("proxy_panel_user_connections", "gauge", "Proxy connections attributed to each user.",
+           [({"user": user}, n) for user, n in sorted(by_user.items())])
+
+    services = SystemInfo.get_all_services_status()
+    metric("proxy_panel_service_up", "gauge", "1 if the systemd unit is active.",
+           [({"service": svc}, int(st["state"] == "active")) for svc, st in sorted(services.items())])
+    metric("proxy_panel_service_restarts_total", "counter", "Automatic restarts of the systemd unit.",
+           [({"service": svc}, st["restarts"]) for svc, st in sorted(services.items())])
+    metric("proxy_panel_service_uptime_seconds", "gauge", "Seconds since the unit became active.",
+           [({"service": svc}, st["uptime"]) for svc, st in sorted(services.items())])
+
+    current = _system_sampler.get_current() if _system_sampler else None
+    if current:
+        mem = current["memory"]
+        metric("proxy_panel_cpu_usage_percent", "gauge", "CPU busy percentage over the last sample interval.",
+               [(None, current["cpu"]["percent"])])
+        metric("proxy_panel_memory_total_bytes", "gauge", "Total memory.", [(None, mem["total_kb"] * 1024)])
+        metric("proxy_panel_memory_used_bytes", "gauge", "Memory in use (total minus available).",
+               [(None, mem["used_kb"] * 1024)])
+        metric("proxy_panel_load_average", "gauge", "System load average.",
+               [({"period": p}, v) for p, v in zip(("1m", "5m", "15m"), current["load"]["avg"])])
+    else:
+        info = SystemInfo.get_info()
+        metric("proxy_panel_cpu_usage_percent", "gauge", "CPU busy percentage since boot.",
+               [(None, info["cpu_usage"])])
+        metric("proxy_panel_memory_used_percent", "gauge", "Memory in use.",
+               [(None, info["memory"]["percent"])])
+
+    metric("proxy_panel_event_subscribers", "gauge", "Open dashboard event streams.",
+           [(None, _event_hub.subscriber_count() if _event_hub else 0)])
+    if isinstance(_http_server, PooledHTTPServer):
+        metric("proxy_panel_http_workers_busy", "gauge", "HTTP workers serving a connection.",
+               [(None, _http_server.busy)])
+        metric("proxy_panel_http_queue_depth", "gauge", "Accepted connections waiting for a worker.",
+               [(None, _http_server.queue_depth())])
+        metric("proxy_panel_http_rejected_connections_total", "counter",
+               "Connections closed because the queue was full.", [(None, _http_server.rejected)])
+    elif isinstance(_http_server, AsyncPanelServer):
+        metric("proxy_panel_http_connections", "gauge", "Open client connections.",
+               [(None, _http_server.connections)])
+    if _tls:
+        tls_stats = _tls.session_stats()
+        metric("proxy_panel_tls_handshakes_total", "counter", "Completed TLS handshakes by kind.",
+               [({"kind": "full"}, tls_stats["accept_good"] - tls_stats["hits"]),
+                ({"kind": "resumed"}, tls_stats["hits"])])
+        metric("proxy_panel_tls_context_replacements_total", "counter",
+               "TLS contexts rebuilt for a changed certificate or ticket key rotation.",
+               [({"reason": "reload"}, _tls.stats["reloads"]), ({"reason": "rotation"}, _tls.stats["rotations"])])
+        metric("proxy_panel_tls_reload_errors_total", "counter", "Certificate reloads that failed.",
+               [(None, _tls.stats["reload_errors"])])
+    histogram("proxy_panel_collector_duration_seconds", "Duration of background collector runs.",
+              COLLECTOR_DURATION, "collector")
+    histogram("proxy_panel_subprocess_duration_seconds", "Wall time of external commands.",
+              SUBPROCESS_LATENCY, "command")
+    metric("proxy_panel_response_cache_total", "counter", "Response cache lookups by outcome.",
+           [({"result": result}, RESPONSE_CACHE.stats.get(result, 0)) for result in ("hits", "misses", "coalesced")])
+    histogram("proxy_panel_route_duration_seconds", "Request latency per route.",
+              ROUTE_STATS.latency, "route")
+    route_counts = sorted(ROUTE_STATS.counts().items())
+    metric("proxy_panel_route_requests_total", "counter", "Requests per route.",
+           [({"route": route}, c.get("requests", 0)) for route, c in route_counts])
+    metric("proxy_panel_route_errors_total", "counter", "Responses per route by error class.",
+           [({"route": route, "class": cls}, c.get(key, 0))
+            for route, c in route_counts for cls, key in (("4xx", "client_errors"), ("5xx", "errors"))])
+    histogram("proxy_panel_json_gzip_cpu_seconds", "CPU time spent gzipping one JSON response.",
+              JSON_GZIP_CPU, "level")
+    with _json_bytes_lock:
+        json_bytes = dict(JSON_BYTES)
+    metric("proxy_panel_json_bytes_total", "counter", "JSON response bytes before and after compression.",
+           [({"stage": stage}, json_bytes.get(stage, 0)) for stage in ("raw", "sent")])
+    return "\n".join(lines) + "\n"
 
 class PanelHandler(http.server.BaseHTTPRequestHandler):
     """Main HTTP request handler with routing."""
 
+    # Persistent connections; every response carries Content-Length or closes
+    protocol_version = "HTTP/1.1"
+    # Slow handshake/request timeout and the (shorter) wait for the next request
+    # on a kept-alive connection, during which a pool worker stays pinned; set in main()
+    timeout = 15
+    keepalive_timeout = 5
+    # Headers and body go out as separate writes; don't let Nagle hold the body
+    disable_nagle_algorithm = True
+    _body_pending = False
+
     def log_message(self, format, *args):
         """Override default logging."""
         pass
 
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._next_request_arrives():
+            self.handle_one_request()
+
+    def _next_request_arrives(self):
+        self.connection.settimeout(self.keepalive_timeout)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            # Idle past keepalive_timeout (or a TLS error): free the worker
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def parse_request(self):
+        self._body_pending = False
+        ok = super().parse_request()
+        if ok:
+            self._body_pending = (self.headers.get("Content-Length", "0").strip() not in ("", "0")
+                                  or "Transfer-Encoding" in self.headers)
+        return ok
+
+    def end_headers(self):
+        # Close after this response if the body went unread (e.g. a 401), since
+        # it would be parsed as the next request, or if the pool is short of
+        # workers, rather than keep one idling on this connection
+        if not self.close_connection and (self._body_pending or self.server.saturated()):
+            self.send_header("Connection", "close")
+        super().end_headers()
+
     def _get_client_ip(self):
         return self.client_address[0]
 
     def _send_json(self, data, status=200):
-        body = json.dumps(data).encode()
+        body = json.dumps(data, separators=(",", ":")).encode()
+        raw_size = len(body)
+        level = _config.json_gzip_level
+        compress = 0 < level <= 9 and raw_size >= _config.json_gzip_min_size and self._accepts_gzip()
+        if compress:
+            started = time.thread_time()
+            body = gzip.compress(body, compresslevel=level, mtime=0)
+            JSON_GZIP_CPU.observe(str(level), time.thread_time() - started)
+        with _json_bytes_lock:
+            JSON_BYTES["raw"] += raw_size
+            JSON_BYTES["sent"] += len(body)
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
         self.end_headers()
         self.wfile.write(body)
 
@@ -1450,32 +3804,56 @@ class PanelHandler(http.server.BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(body)
 
-    def _send_file(self, filepath, content_type):
-        try:
-            with open(filepath, "rb") as f:
-                body = f.read()
-            self.send_response(200)
-            self.send_header("Content-Type", content_type)
-            self.send_header("Content-Length", str(len(body)))
-            self.send_header("Cache-Control", "public, max-age=3600")
-            self.end_headers()
-            self.wfile.write(body)
-        except FileNotFoundError:
+    def _accepts_gzip(self):
+        for coding in self.headers.get("Accept-Encoding", "").split(","):
+            name, _, params = coding.strip().partition(";")
+            if name.strip().lower() in ("gzip", "*"):
+                return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+        return False
+
+    def _send_asset(self, asset, cache_control):
+        """Send a cached asset, gzipped if accepted, or 304 if the client's copy is current."""
+        use_gzip = asset["gzip"] is not None and self._accepts_gzip()
+        etag = asset["gzip_etag"] if use_gzip else asset["etag"]
+        if_none_match = self.headers.get("If-None-Match", "")
+        if if_none_match:
+            # If-None-Match uses weak comparison
+            tags = {t.strip()[2:] if t.strip().startswith("W/") else t.strip() for t in if_none_match.split(",")}
+            if "*" in tags or asset["etag"] in tags or asset["gzip_etag"] in tags:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", cache_control)
+                self.send_header("Vary", "Accept-Encoding")
+                self.end_headers()
+                return
+        body = asset["gzip"] if use_gzip else asset["body"]
+        self.send_response(200)
+        self.send_header("Content-Type", asset["type"])
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_page(self, name):
+        asset = _assets.pages.get(name)
+        if not asset:
             self.send_error(404)
+            return
+        # Pages link hashed asset URLs, so they must be revalidated every time
+        self._send_asset(asset, "no-cache")
 
     def _redirect(self, location):
         self.send_response(302)
         self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def _get_session_user(self):
-        cookies = self.headers.get("Cookie", "")
-        for part in cookies.split(";"):
-            part = part.strip()
-            if part.startswith("session="):
-                token = part[len("session="):]
-                return _sessions.validate_token(token)
-        return None
+        return _session_user(self.headers.get("Cookie", ""))
 
     def _require_auth(self):
         user = self._get_session_user()
@@ -1488,166 +3866,284 @@ class PanelHandler(http.server.BaseHTTPRequestHandler):
 
     def _read_body(self):
         length = int(self.headers.get("Content-Length", 0))
+        self._body_pending = False
         if length > 0:
             return self.rfile.read(length)
         return b""
 
+    def _handle_metrics(self):
+        """Serve /metrics to scrapers presenting the configured bearer token."""
+        token = _config.metrics_token
+        header = self.headers.get("Authorization", "")
+        if not token:
+            self.send_error(404)
+            return
+        if not hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            self._send_json({"error": "Unauthorized"}, 401)
+            return
+        try:
+            body = _render_metrics().encode()
+        except Exception as e:
+            log(f"Error rendering metrics: {e}", "ERROR")
+            self._send_json({"error": "Failed to render metrics"}, 500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     # ── Routes ────────────────────────────────────────────────────────────────
 
     def do_GET(self):
-        path = urlparse(self.path).path
+        self._dispatch("GET")
 
-        # Static files
-        if path.startswith("/static/"):
-            filename = path[len("/static/"):]
-            # Prevent directory traversal
-            if ".." in filename or filename.startswith("/"):
-                self.send_error(403)
-                return
-            filepath = STATIC_DIR / filename
-            ext = filepath.suffix.lower()
-            content_types = {
-                ".css": "text/css",
-                ".js": "application/javascript",
-                ".ico": "image/x-icon",
-                ".png": "image/png",
-                ".svg": "image/svg+xml",
-            }
-            self._send_file(str(filepath), content_types.get(ext, "application/octet-stream"))
-            return
+    def do_POST(self):
+        self._dispatch("POST")
 
-        # Pages
-        if path == "/" or path == "/login":
-            if self._get_session_user():
-                self._redirect("/dashboard")
-            else:
-                self._send_file(str(TEMPLATES_DIR / "login.html"), "text/html; charset=utf-8")
-            return
+    def do_DELETE(self):
+        self._dispatch("DELETE")
 
-        if path == "/dashboard":
-            if not self._get_session_user():
-                self._redirect("/login")
-            else:
-                self._send_file(str(TEMPLATES_DIR / "dashboard.html"), "text/html; charset=utf-8")
-            return
+    # No route takes these; dispatching them answers 405 with Allow instead of 501
+    def do_PUT(self):
+        self._dispatch("PUT")
 
-        # API endpoints
-        if path.startswith("/api/"):
-            self._handle_api_get(path)
-            return
+    def do_PATCH(self):
+        self._dispatch("PATCH")
 
-        self.send_error(404)
+    def log_request(self, code="-", size="-"):
+        # Called by send_response; remember the status for the route stats
+        self._status = code if isinstance(code, int) else 0
 
-    def do_POST(self):
+    def _dispatch(self, method):
         path = urlparse(self.path).path
-
-        if path == "/api/login":
-            self._handle_login()
+        route, params = ROUTER.match(method, path)
+        if route is None:
+            # Without a session every unmatched API path is 401, so probing
+            # for 404 versus 405 reveals nothing about which endpoints exist
+            if path.startswith("/api/") and not self._require_auth():
+                self._send_json({"error": "Unauthorized"}, 401)
+            elif params:
+                self.send_response(405)
+                self.send_header("Allow", ", ".join(params))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            else:
+                self.send_error(404)
             return
 
-        if path == "/api/logout":
-            self._handle_logout()
-            return
+        self._status = 0
+        started = time.perf_counter()
+        try:
+            if route.auth and not self._require_auth():
+                self._send_json({"error": "Unauthorized"}, 401)
+            elif route.csrf and not self._check_csrf():
+                self._send_json({"error": "CSRF check failed"}, 403)
+            else:
+                getattr(self, route.handler)(**params)
+        except Exception:
+            self._status = 500
+            raise
+        finally:
+            # A stream's duration is its lifetime, not its latency
+            elapsed = None if route.stream else time.perf_counter() - started
+            ROUTE_STATS.record(route.name, self._status or 500, elapsed)
+
+    # ── Pages and static files ────────────────────────────────────────────────
+
+    def _get_metrics(self):
+        # Metrics stay off the panel port when a dedicated port is configured
+        if _config.metrics_port:
+            self.send_error(404)
+        else:
+            self._handle_metrics()
 
-        # All other POST endpoints require auth + CSRF
-        user = self._require_auth()
-        if not user:
-            self._send_json({"error": "Unauthorized"}, 401)
-            return
-        if not self._check_csrf():
-            self._send_json({"error": "CSRF check failed"}, 403)
+    def _get_static(self, name):
+        # Served from the startup cache only
+        path = f"/static/{name}"
+        asset = _assets.static.get(path)
+        if not asset:
+            self.send_error(404)
             return
+        self._send_asset(asset, _assets.cache_control(path))
 
-        if path == "/api/users":
-            self._handle_add_user()
-        elif path.startswith("/api/users/") and path.endswith("/password"):
-            username = path[len("/api/users/"):-len("/password")]
-            self._handle_update_password(unquote(username))
-        elif path == "/api/service/restart":
-            self._handle_service_restart()
-        elif path == "/api/layer/switch":
-            self._handle_layer_switch()
-        elif path == "/api/layer/switch/clear":
-            self._handle_switch_clear()
+    def _get_login_page(self):
+        if self._get_session_user():
+            self._redirect("/dashboard")
         else:
-            self.send_error(404)
+            self._send_page("login.html")
 
-    def do_DELETE(self):
-        path = urlparse(self.path).path
-        user = self._require_auth()
-        if not user:
-            self._send_json({"error": "Unauthorized"}, 401)
-            return
-        if not self._check_csrf():
-            self._send_json({"error": "CSRF check failed"}, 403)
-            return
-
-        # DELETE /api/users/<username>
-        match = re.match(r"^/api/users/([a-zA-Z0-9_-]+)$", path)
-        if match:
-            username = match.group(1)
-            self._handle_delete_user(username)
+    def _get_dashboard_page(self):
+        if not self._get_session_user():
+            self._redirect("/login")
         else:
-            self.send_error(404)
+            self._send_page("dashboard.html")
 
     # ── API GET Handlers ──────────────────────────────────────────────────────
 
-    def _handle_api_get(self, path):
-        user = self._require_auth()
-        if not user:
-            self._send_json({"error": "Unauthorized"}, 401)
+    def _get_system_info(self):
+        self._send_json(RESPONSE_CACHE.get("system_info", _system_info_payload))
+
+    def _get_system_status(self):
+        self._send_json(SystemInfo.get_all_services_status())
+
+    def _get_dashboard(self):
+        params = parse_qs(urlparse(self.path).query)
+        requested = params.get("fields", [""])[0]
+        if requested:
+            fields = [f.strip() for f in requested.split(",") if f.strip()]
+            unknown = [f for f in fields if f not in DASHBOARD_FIELDS]
+            if unknown:
+                self._send_json({"error": f"Unknown fields: {', '.join(unknown)}",
+                                 "fields": list(DASHBOARD_FIELDS)}, 400)
+                return
+        else:
+            fields = list(DASHBOARD_FIELDS)
+        self._send_json(_dashboard_payload(fields))
+
+    def _get_system_resources(self):
+        if not _system_sampler:
+            self._send_json({"error": "System sampler disabled"}, 404)
             return
+        self._send_json(_system_sampler.get_current() or {})
 
-        if path == "/api/system/info":
-            info = SystemInfo.get_info()
-            info["layer"] = _layer_mgr.layer
-            info["service"] = _layer_mgr.get_service_name()
-            self._send_json(info)
+    def _get_system_resources_history(self):
+        if not _system_sampler:
+            self._send_json({"error": "System sampler disabled"}, 404)
+            return
+        try:
+            seconds = max(int(parse_qs(urlparse(self.path).query).get("seconds", ["0"])[0]), 0)
+        except ValueError:
+            seconds = 0
+        self._send_json({
+            "interval": _system_sampler.interval,
+            "samples": _system_sampler.get_history(seconds),
+        })
 
-        elif path == "/api/system/status":
-            self._send_json(SystemInfo.get_all_services_status())
+    def _get_users(self):
+        self._send_json(RESPONSE_CACHE.get("users", _layer_mgr.list_users))
 
-        elif path == "/api/users":
-            self._send_json(_layer_mgr.list_users())
+    def _get_sessions(self):
+        if _layer_mgr.is_v2ray_layer():
+            self._send_json({})
+        else:
+            self._send_json(_layer_mgr.ssh_sessions.get_sessions())
 
-        elif path.startswith("/api/users/") and path.endswith("/config"):
-            username = path[len("/api/users/"):-len("/config")]
-            username = unquote(username)
-            self._send_json(_layer_mgr.get_user_config(username))
+    def _get_user_config(self, username):
+        self._send_json(_layer_mgr.get_user_config(username))
 
-        elif path == "/api/bandwidth/system":
-            self._send_json(_bandwidth.get_system_bandwidth())
+    def _get_system_bandwidth(self):
+        self._send_json(RESPONSE_CACHE.get("system_bandwidth", _bandwidth.get_system_bandwidth))
 
-        elif path == "/api/bandwidth/users":
-            self._send_json(_bandwidth.get_user_bandwidth())
+    def _get_bandwidth_interfaces(self):
+        self._send_json({
+            "interfaces": sorted(read_proc_net_dev()),
+            "selected": _config.egress_interface,
+            "detected": detect_egress_interface() or "",
+        })
 
-        elif path == "/api/connections":
-            self._send_json(_bandwidth.get_connections())
+    def _get_user_bandwidth(self):
+        self._send_json(_bandwidth.get_user_bandwidth())
 
-        elif path == "/api/service/logs":
-            self._handle_service_logs()
+    def _get_live_bandwidth(self):
+        username = parse_qs(urlparse(self.path).query).get("user", [""])[0]
+        if username and not re.match(r"^[a-zA-Z0-9_-]{3,32}$", username):
+            self._send_json({"error": "Invalid username"}, 400)
+            return
+        self._send_json(_bandwidth.get_live_throughput(username))
 
-        elif path == "/api/layers":
-            layers = []
-            for layer_def in LAYER_DEFINITIONS:
-                layers.append({
-                    **layer_def,
-                    "active": layer_def["id"] == _layer_mgr.layer,
-                })
-            self._send_json({"layers": layers, "current": _layer_mgr.layer})
+    def _get_hourly_bandwidth(self):
+        query = parse_qs(urlparse(self.path).query)
+        username = query.get("user", [""])[0]
+        try:
+            hours = min(max(int(query.get("hours", ["24"])[0]), 1), 24 * 31)
+        except ValueError:
+            hours = 24
+        if not re.match(r"^[a-zA-Z0-9_-]{3,32}$", username):
+            self._send_json({"error": "Invalid username"}, 400)
+            return
+        self._send_json({"user": username, "hours": _bandwidth.get_user_hourly(username, hours)})
 
-        elif path == "/api/layer/switch/status":
-            self._send_json({
-                "in_progress": _switch_state["in_progress"],
-                "phase": _switch_state["phase"],
-                "target_layer": _switch_state["target_layer"],
-                "progress_pct": _switch_state["progress_pct"],
-                "log_lines": _switch_state["log_lines"][-20:],
-                "error": _switch_state["error"],
-            })
+    def _get_connections(self):
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            page = max(int(query.get("page", ["1"])[0]), 1)
+            per_page = min(max(int(query.get("per_page", ["100"])[0]), 1), 500)
+        except ValueError:
+            self._send_json({"error": "Invalid page"}, 400)
+            return
+        connections = _bandwidth.get_connections(_layer_mgr.get_proxy_ports())
+        filtered = filter_connections(
+            connections,
+            state=query.get("state", [""])[0],
+            user=query.get("user", [""])[0],
+            query=query.get("q", [""])[0].strip(),
+        )
+        start = (page - 1) * per_page
+        self._send_json({
+            "total": len(connections),
+            "filtered": len(filtered),
+            "page": page,
+            "per_page": per_page,
+            "pages": max((len(filtered) + per_page - 1) // per_page, 1),
+            "connections": filtered[start:start + per_page],
+        })
 
-        else:
-            self.send_error(404)
+    def _get_connection_summary(self):
+        try:
+            top = min(max(int(parse_qs(urlparse(self.path).query).get("top", ["10"])[0]), 1), 100)
+        except ValueError:
+            top = 10
+        self._send_json(summarize_connections(
+            _bandwidth.get_connections(_layer_mgr.get_proxy_ports()), top))
+
+    def _get_layers(self):
+        self._send_json(_layers_payload())
+
+    def _get_switch_status(self):
+        self._send_json(_switch_status_payload())
+
+    def _get_route_stats(self):
+        self._send_json({"routes": ROUTE_STATS.summary()})
+
+    def _handle_events(self):
+        """Server-Sent Events stream: GET /api/events?topics=overview,users"""
+        topics = _event_topics(self.path)
+        if not topics:
+            self._send_json({"error": "No valid topics"}, 400)
+            return
+        # A stream holds its worker for good; leave room for ordinary requests.
+        # The dashboard falls back to polling when the stream is refused.
+        limit = self.server.max_streams
+        if limit is not None and _event_hub.subscriber_count() >= limit:
+            self._send_json({"error": "Too many event streams"}, 503)
+            return
+
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Accel-Buffering", "no")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        q = _event_hub.subscribe(topics, since=_event_since(self.path))
+        try:
+            self.wfile.write(SSE_RETRY)
+            while True:
+                try:
+                    message = q.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    # Keepalive; also drop the stream once the session expires
+                    if not self._get_session_user():
+                        break
+                    message = SSE_PING
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, ssl.SSLError, OSError):
+            pass
+        finally:
+            _event_hub.unsubscribe(q)
 
     # ── API POST/DELETE Handlers ──────────────────────────────────────────────
 
@@ -1725,6 +4221,8 @@ class PanelHandler(http.server.BaseHTTPRequestHandler):
 
         result = _layer_mgr.add_user(username, password if password else None)
         status = 200 if result.get("success") else 400
+        RESPONSE_CACHE.invalidate("users")
+        _event_hub.refresh("users")
         self._send_json(result, status)
 
     def _handle_delete_user(self, username):
@@ -1733,6 +4231,8 @@ class PanelHandler(http.server.BaseHTTPRequestHandler):
             return
         result = _layer_mgr.delete_user(username)
         status = 200 if result.get("success") else 400
+        RESPONSE_CACHE.invalidate("users")
+        _event_hub.refresh("users")
         self._send_json(result, status)
 
     def _handle_update_password(self, username):
@@ -1759,10 +4259,11 @@ class PanelHandler(http.server.BaseHTTPRequestHandler):
     def _handle_service_restart(self):
         service = _layer_mgr.get_service_name()
         try:
-            result = subprocess.run(
+            result = run_command(
                 ["systemctl", "restart", service],
                 capture_output=True, text=True, timeout=15
             )
+            SystemInfo.invalidate_services_status()
             if result.returncode == 0:
                 log(f"Service '{service}' restarted via panel")
                 self._send_json({"success": True, "service": service})
@@ -1808,8 +4309,26 @@ class PanelHandler(http.server.BaseHTTPRequestHandler):
 
         result = _layer_mgr.switch_layer(target, domain, email, duckdns_token)
         status = 200 if result.get("success") else 400
+        _event_hub.refresh("switch")
         self._send_json(result, status)
 
+    def _handle_set_interface(self):
+        """Pick the interface for system bandwidth; an empty name means auto-detect."""
+        try:
+            body = json.loads(self._read_body())
+        except Exception:
+            self._send_json({"error": "Invalid request"}, 400)
+            return
+        iface = body.get("interface", "").strip()
+        if iface and iface not in read_proc_net_dev():
+            self._send_json({"error": "Unknown interface"}, 400)
+            return
+        _config.egress_interface = iface
+        _config.save()
+        RESPONSE_CACHE.invalidate("system_bandwidth")
+        _event_hub.refresh("bandwidth")
+        self._send_json({"success": True, "interface": _bandwidth.interfaces.get_interface()})
+
     def _handle_switch_clear(self):
         """Reset switch state and clean up state file."""
         global _switch_state
@@ -1827,22 +4346,74 @@ class PanelHandler(http.server.BaseHTTPRequestHandler):
                 os.unlink(str(state_file))
             except Exception:
                 pass
+        _event_hub.refresh("switch")
         self._send_json({"success": True})
 
     def _handle_service_logs(self):
+        """GET /api/service/logs?cursor=&grep=&level=&lines=
+
+        Without a cursor returns the last `lines` matching entries; with one,
+        only entries written since. Always returns the cursor to poll from next.
+        """
         service = _layer_mgr.get_service_name()
+        query = parse_qs(urlparse(self.path).query)
+        cursor = query.get("cursor", [""])[0]
+        grep = query.get("grep", [""])[0]
+        level = query.get("level", [""])[0]
         try:
-            result = subprocess.run(
-                ["journalctl", "-u", service, "-n", "100", "--no-pager"],
-                capture_output=True, text=True, timeout=10
-            )
-            logs = result.stdout if result.returncode == 0 else "Failed to read logs"
-            self._send_json({"logs": logs, "service": service})
+            lines = min(max(int(query.get("lines", ["100"])[0]), 1), 1000)
+        except ValueError:
+            lines = 100
+
+        if cursor and not JOURNAL_CURSOR_RE.match(cursor):
+            self._send_json({"error": "Invalid cursor"}, 400)
+            return
+        if level and level not in LOG_LEVELS:
+            self._send_json({"error": "Invalid level"}, 400)
+            return
+        try:
+            pattern = re.compile(grep, re.IGNORECASE) if grep else None
+        except re.error:
+            self._send_json({"error": "Invalid grep pattern"}, 400)
+            return
+
+        # Filters are applied here, so read a wider window when they can drop lines
+        filtered = bool(pattern or level)
+        limit = 1000 if (cursor or filtered) else lines
+        try:
+            entries, next_cursor = SystemInfo.read_journal(service, cursor or None, limit)
         except Exception as e:
-            self._send_json({"logs": str(e), "service": service})
+            self._send_json({"logs": str(e), "service": service, "entries": [], "cursor": cursor})
+            return
+
+        if level:
+            max_rank = LOG_LEVELS.index(level)
+            entries = [e for e in entries if LOG_LEVELS.index(e["level"]) <= max_rank]
+        if pattern:
+            entries = [e for e in entries if pattern.search(e["message"])]
+        if not cursor:
+            entries = entries[-lines:]
+
+        text = "\n".join(
+            f"{datetime.fromtimestamp(e['ts']).strftime('%b %d %H:%M:%S')} "
+            f"{e['ident']}[{e['pid']}]: {e['message']}"
+            for e in entries
+        )
+        self._send_json({
+            "service": service,
+            "cursor": next_cursor,
+            "entries": entries,
+            "logs": text,
+        })
 
-def _ensure_xray_client_emails():
-    """Patch existing xray clients to add email fields for per-user stats tracking."""
+def _ensure_xray_panel_config():
+    """Patch the xray config with what the panel relies on.
+
+    - email fields on clients, for per-user stats tracking
+    - a tag on the proxy inbound and HandlerService in the API, so users can
+      be removed from the running xray without a restart
+    - statsUserOnline, so connections can be attributed to users by IP
+    """
     config_path = "/usr/local/etc/xray/config.json"
     users_file = "/usr/local/etc/xray/users.json"
     if not os.path.exists(config_path) or not os.path.exists(users_file):
@@ -1860,6 +4431,9 @@ def _ensure_xray_client_emails():
         for inb in cfg.get("inbounds", []):
             if inb.get("protocol") not in ("vless", "vmess"):
                 continue
+            if not inb.get("tag"):
+                inb["tag"] = XRAY_PROXY_INBOUND_TAG
+                changed = True
             for client in inb.get("settings", {}).get("clients", []):
                 if not client.get("email"):
                     cid = client.get("id", "")
@@ -1867,33 +4441,523 @@ def _ensure_xray_client_emails():
                     client["email"] = f"{username}@proxy"
                     changed = True
 
+        api = cfg.get("api")
+        if api is not None:
+            services = api.setdefault("services", [])
+            if "HandlerService" not in services:
+                services.append("HandlerService")
+                changed = True
+
+        level0 = cfg.setdefault("policy", {}).setdefault("levels", {}).setdefault("0", {})
+        if not level0.get("statsUserOnline"):
+            level0["statsUserOnline"] = True
+            changed = True
+
         if changed:
             with open(config_path, "w") as f:
                 json.dump(cfg, f, indent=2)
-            subprocess.run(
+            run_command(
                 ["systemctl", "restart", "xray"],
                 capture_output=True, timeout=15
             )
-            log("Patched xray clients with email fields for stats tracking")
+            log("Patched xray config (client emails, inbound tag, HandlerService, online stats)")
     except Exception as e:
-        log(f"Error patching xray client emails: {e}", "ERROR")
+        log(f"Error patching xray config: {e}", "ERROR")
+
+# ─── TLS ──────────────────────────────────────────────────────────────────────
+
+# TLS 1.2 suites: ECDHE with AEAD only; finite-field DHE is slow on small CPUs.
+# With server preference the default group list (X25519, then P-256) decides
+# the curve, so clients offering several never land on P-384/P-521 or X448.
+TLS_CIPHERS = "ECDHE+AESGCM:ECDHE+CHACHA20"
+TLS_CHECK_INTERVAL = 30
+
+class TLSContextManager(threading.Thread):
+    """Owns the panel's TLS context and swaps in new ones without a restart.
+
+    A fresh context is built when panel.pem or panel.key change on disk and
+    every rotation_interval seconds. Python cannot set session ticket keys,
+    but each context generates its own, so replacing the context rotates
+    them; a client holding an older ticket does one full handshake.
+
+    Every context carries an SNI callback that moves the handshake onto the
+    current context, so a listener holding an older one (the asyncio
+    engine's) serves the reloaded certificate straight away. Tickets stay
+    sealed with the listening context's keys, which is why AsyncPanelServer
+    also re-listens with current() once it changes.
+    """
+
+    def __init__(self, cert_file, key_file, rotation_interval=43200):
+        super().__init__(daemon=True)
+        self.cert_file = Path(cert_file)
+        self.key_file = Path(key_file)
+        self.rotation_interval = rotation_interval
+        self.stats = Counter()    # reloads / rotations / reload_errors
+        self._retired = Counter()  # session_stats() of replaced contexts
+        self._lock = threading.Lock()
+        self._mtimes = self._cert_mtimes()
+        self.context = self._build()
+        self._built = time.monotonic()
+
+    def _cert_mtimes(self):
+        return tuple(p.stat().st_mtime_ns if p.exists() else None
+                     for p in (self.cert_file, self.key_file))
+
+    def _build(self):
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+        ctx.options |= ssl.OP_CIPHER_SERVER_PREFERENCE | ssl.OP_NO_COMPRESSION
+        ctx.set_ciphers(TLS_CIPHERS)
+        ctx.load_cert_chain(str(self.cert_file), str(self.key_file))
+        ctx.sni_callback = self._select_context
+        return ctx
+
+    def _select_context(self, ssl_obj, server_name, listener):
+        current = self.context
+        if listener is not current:
+            ssl_obj.context = current
+
+    def current(self):
+        """The SSLContext new connections should use."""
+        return self.context
+
+    def wrap_socket(self, sock):
+        # Handshake lazily in the worker, not in the accept loop
+        return self.context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+
+    def session_stats(self):
+        """OpenSSL handshake counters summed over the current and replaced contexts."""
+        with self._lock:
+            totals = self._retired.copy()
+            totals.update(self.context.session_stats())
+        return totals
+
+    def check(self):
+        mtimes = self._cert_mtimes()
+        if mtimes != self._mtimes:
+            self._replace(mtimes, "reloads", "Reloaded panel certificate")
+        elif self.rotation_interval > 0 and time.monotonic() - self._built >= self.rotation_interval:
+            self._replace(mtimes, "rotations", "Rotated TLS session ticket keys")
+
+    def _replace(self, mtimes, stat, message):
+        # A renewal that has written only one of the two files fails here and is
+        # retried when the other one changes; the current context stays in use.
+        self._mtimes = mtimes
+        try:
+            ctx = self._build()
+        except (OSError, ssl.SSLError) as e:
+            self.stats["reload_errors"] += 1
+            log(f"TLS reload failed, keeping the current certificate: {e}", "WARN")
+            return
+        with self._lock:
+            self._retired.update(self.context.session_stats())
+            self.context = ctx
+        self._built = time.monotonic()
+        self.stats[stat] += 1
+        log(message)
+
+    def run(self):
+        while True:
+            time.sleep(TLS_CHECK_INTERVAL)
+            try:
+                self.check()
+            except Exception as e:
+                log(f"TLS check error: {e}", "ERROR")
 
 # ─── Threaded HTTPS Server ────────────────────────────────────────────────────
 
-class ThreadedHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
-    daemon_threads = True
+ROUTER = Router([
+    # Pages, static files and metrics (metrics check their own bearer token)
+    Route("GET", "/", "_get_login_page", auth=False),
+    Route("GET", "/login", "_get_login_page", auth=False),
+    Route("GET", "/dashboard", "_get_dashboard_page", auth=False),
+    Route("GET", "/static/<name>", "_get_static", auth=False),
+    Route("GET", "/metrics", "_get_metrics", auth=False),
+
+    # Session
+    Route("POST", "/api/login", "_handle_login", auth=False),
+    Route("POST", "/api/logout", "_handle_logout", auth=False),
+
+    # Read-only API
+    Route("GET", "/api/dashboard", "_get_dashboard"),
+    Route("GET", "/api/system/info", "_get_system_info"),
+    Route("GET", "/api/system/status", "_get_system_status"),
+    Route("GET", "/api/system/resources", "_get_system_resources"),
+    Route("GET", "/api/system/resources/history", "_get_system_resources_history"),
+    Route("GET", "/api/users", "_get_users"),
+    Route("GET", "/api/users/<username>/config", "_get_user_config"),
+    Route("GET", "/api/sessions", "_get_sessions"),
+    Route("GET", "/api/bandwidth/system", "_get_system_bandwidth"),
+    Route("GET", "/api/bandwidth/interfaces", "_get_bandwidth_interfaces"),
+    Route("GET", "/api/bandwidth/users", "_get_user_bandwidth"),
+    Route("GET", "/api/bandwidth/live", "_get_live_bandwidth"),
+    Route("GET", "/api/bandwidth/hourly", "_get_hourly_bandwidth"),
+    Route("GET", "/api/connections", "_get_connections"),
+    Route("GET", "/api/connections/summary", "_get_connection_summary"),
+    Route("GET", "/api/service/logs", "_handle_service_logs"),
+    Route("GET", "/api/layers", "_get_layers"),
+    Route("GET", "/api/layer/switch/status", "_get_switch_status"),
+    Route("GET", "/api/events", "_handle_events", stream=True),
+    Route("GET", "/api/admin/routes", "_get_route_stats"),
+
+    # Changes: session plus the X-Requested-With CSRF header
+    Route("POST", "/api/users", "_handle_add_user", csrf=True),
+    Route("POST", "/api/users/<username>/password", "_handle_update_password", csrf=True),
+    Route("DELETE", "/api/users/<username>", "_handle_delete_user", csrf=True),
+    Route("POST", "/api/service/restart", "_handle_service_restart", csrf=True),
+    Route("POST", "/api/layer/switch", "_handle_layer_switch", csrf=True),
+    Route("POST", "/api/layer/switch/clear", "_handle_switch_clear", csrf=True),
+    Route("POST", "/api/bandwidth/interface", "_handle_set_interface", csrf=True),
+])
+
+class PanelHTTPServer(http.server.HTTPServer):
     allow_reuse_address = True
+    max_streams = None
+    tls = None
+
+    def get_request(self):
+        # Wrap per connection so a reloaded context applies without rebinding
+        request, client_address = self.socket.accept()
+        if self.tls:
+            request = self.tls.wrap_socket(request)
+        return request, client_address
+
+    def saturated(self):
+        """True when responses should close their connection to free the worker."""
+        return False
+
+    def handle_error(self, request, client_address):
+        # Resets, timeouts and failed TLS handshakes are routine on a public port
+        if isinstance(sys.exc_info()[1], OSError):
+            return
+        super().handle_error(request, client_address)
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, PanelHTTPServer):
+    """One thread per connection, without limit."""
+    daemon_threads = True
+
+class PooledHTTPServer(PanelHTTPServer):
+    """Fixed worker threads fed by a bounded queue of accepted connections.
+
+    When the queue is full new connections are closed straight away, so a
+    flood costs sockets rather than threads and memory.
+    """
+
+    def __init__(self, server_address, handler_class, workers=32, queue_size=128):
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self.max_streams = max(1, workers // 2)
+        # Every kept-alive connection pins a worker; past this many busy ones
+        # responses close, so a quarter of the pool stays free for new connections
+        self.keepalive_limit = max(1, workers * 3 // 4)
+        self.busy = 0
+        self.rejected = 0
+        self._queue = queue.Queue(queue_size)
+        self._busy_lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"http-worker-{i}", daemon=True).start()
+
+    def process_request(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            self.rejected += 1
+            self.shutdown_request(request)
+
+    def saturated(self):
+        return not self._queue.empty() or self.busy >= self.keepalive_limit
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            request, client_address = self._queue.get()
+            with self._busy_lock:
+                self.busy += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._busy_lock:
+                    self.busy -= 1
+
+class MetricsHandler(PanelHandler):
+    """Serves only /metrics, for the optional plain-HTTP metrics listener."""
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/metrics":
+            self._handle_metrics()
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        self.send_error(404)
+
+    do_DELETE = do_POST
+
+# ─── Async Server ─────────────────────────────────────────────────────────────
+
+class BufferedPanelHandler(PanelHandler):
+    """Runs PanelHandler on one fully read request and collects the response in memory."""
+
+    def __init__(self, raw_request, client_address, server):
+        self.rfile = io.BytesIO(raw_request)
+        self.wfile = io.BytesIO()
+        self.client_address = client_address
+        self.server = server
+        self.close_connection = True
+        self.handle_one_request()
+
+    def handle_expect_100(self):
+        # The engine already answered the Expect header before reading the body
+        return True
+
+class AsyncSubprocessRunner:
+    """Runs commands with asyncio.create_subprocess_exec on the engine's loop.
+
+    At most `limit` commands run at once; callers on worker threads block
+    until their command finishes, as they would with subprocess.run.
+    """
+
+    SUPPORTED_ARGS = {"capture_output", "text", "timeout", "input", "env"}
+
+    def __init__(self, loop, limit):
+        self.loop = loop
+        self._limit = asyncio.Semaphore(limit)
+        self._loop_thread = threading.get_ident()
+
+    def accepts(self, kwargs):
+        return kwargs.keys() <= self.SUPPORTED_ARGS and threading.get_ident() != self._loop_thread
+
+    def run(self, args, capture_output=False, text=False, timeout=None, input=None, env=None):
+        return asyncio.run_coroutine_threadsafe(
+            self._run(args, capture_output, text, timeout, input, env), self.loop).result()
+
+    async def _run(self, args, capture_output, text, timeout, input, env):
+        pipe = subprocess.PIPE if capture_output else None
+        if text and input is not None:
+            input = input.encode()
+        async with self._limit:
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdin=subprocess.PIPE if input is not None else None,
+                stdout=pipe, stderr=pipe, env=env)
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise subprocess.TimeoutExpired(args, timeout)
+        if text:
+            stdout = stdout.decode(errors="replace") if stdout is not None else None
+            stderr = stderr.decode(errors="replace") if stderr is not None else None
+        return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+
+class _StreamSubscription:
+    """EventHub subscriber queue that hands messages to an asyncio.Queue."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(EventHub.QUEUE_SIZE)
+
+    def put_nowait(self, message):
+        if self.queue.full():
+            raise queue.Full
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+class AsyncPanelServer:
+    """asyncio engine serving the same routes as PanelHandler.
+
+    Connections, TLS handshakes, keep-alive and event streams live on one
+    event loop, so idle clients and open streams cost no threads. Each
+    request is handed to PanelHandler on a small worker pool once it has
+    been read in full.
+    """
+
+    MAX_HEADER = 65536
+    MAX_BODY = 1048576
+
+    def __init__(self, server_address, tls=None, workers=8, subprocess_limit=8, idle_timeout=15,
+                 max_streams=256):
+        self.server_address = server_address
+        self.tls = tls
+        # Streams cost no threads here, only memory, so the cap is far above the pool's
+        self.max_streams = max_streams
+        self.workers = workers
+        self.subprocess_limit = subprocess_limit
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self._executor = None
+        self._loop = None
+        self._stop = None
+
+    def saturated(self):
+        return False
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        if self._loop and self._stop:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    async def _serve(self):
+        global _subprocess_runner
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="http-worker")
+        _subprocess_runner = AsyncSubprocessRunner(self._loop, self.subprocess_limit)
+        sock = socket.create_server(self.server_address, backlog=1024)
+        listener = self.tls.current() if self.tls else None
+        server = await self._listen(sock, listener)
+        try:
+            while not self._stop.is_set():
+                try:
+                    await asyncio.wait_for(self._stop.wait(), TLS_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                if self.tls and self.tls.current() is not listener:
+                    # Tickets are sealed with the listening context's keys, so a rotated
+                    # context needs a new listener; both share the socket and its backlog
+                    listener = self.tls.current()
+                    previous, server = server, await self._listen(sock, listener)
+                    previous.close()
+        finally:
+            server.close()
+            sock.close()
+            _subprocess_runner = None
+            self._executor.shutdown(wait=False)
+
+    async def _listen(self, sock, ssl_context):
+        # Each asyncio server closes the socket it was given, so it gets its own dup
+        return await asyncio.start_server(
+            self._handle_connection, sock=sock.dup(), ssl=ssl_context,
+            ssl_handshake_timeout=self.idle_timeout if ssl_context else None)
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        client_address = writer.get_extra_info("peername")[:2]
+        try:
+            keep_alive = True
+            while keep_alive:
+                keep_alive = await self._handle_request(reader, writer, client_address)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ssl.SSLError, OSError):
+            pass
+        except Exception as e:
+            log(f"Error serving {client_address[0]}: {e}", "ERROR")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _handle_request(self, reader, writer, client_address):
+        """Read and answer one request; returns whether the connection stays open."""
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+        if len(head) > self.MAX_HEADER:
+            return False
+        request_line, _, header_block = head.partition(b"\r\n")
+        parts = request_line.decode("latin-1").split()
+        headers = http.client.parse_headers(io.BytesIO(header_block))
+        if len(parts) != 3:
+            return await self._handle_buffered(head, writer, client_address)
+        method, target, _ = parts
+
+        if "Transfer-Encoding" in headers:
+            writer.write(b"HTTP/1.1 411 Length Required\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return False
+        length = (headers.get("Content-Length") or "0").strip()
+        if not (length.isascii() and length.isdigit()):
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return False
+        length = int(length)
+        if length > self.MAX_BODY:
+            writer.write(b"HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return False
+        body = b""
+        if length:
+            if headers.get("Expect", "").lower() == "100-continue":
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                await writer.drain()
+            body = await asyncio.wait_for(reader.readexactly(length), self.idle_timeout)
+
+        if method == "GET" and urlparse(target).path == "/api/events":
+            topics = _event_topics(target)
+            if topics and _session_user(headers.get("Cookie")):
+                if self.max_streams is not None and _event_hub.subscriber_count() >= self.max_streams:
+                    # Same refusal as PanelHandler; the dashboard falls back to polling
+                    body = json.dumps({"error": "Too many event streams"}).encode()
+                    writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                                 b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+                    await writer.drain()
+                    return False
+                await self._stream_events(reader, writer, topics, headers.get("Cookie"), _event_since(target))
+                return False
+
+        return await self._handle_buffered(head + body, writer, client_address)
+
+    async def _handle_buffered(self, raw_request, writer, client_address):
+        handler = await self._loop.run_in_executor(
+            self._executor, BufferedPanelHandler, raw_request, client_address, self)
+        writer.write(handler.wfile.getvalue())
+        await writer.drain()
+        return not handler.close_connection
+
+    @staticmethod
+    async def _wait_disconnect(reader):
+        while await reader.read(4096):
+            pass
+
+    async def _stream_events(self, reader, writer, topics, cookie, since=None):
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"X-Accel-Buffering: no\r\n"
+                     b"Connection: close\r\n\r\n" + SSE_RETRY)
+        subscription = _StreamSubscription(self._loop)
+        _event_hub.subscribe(topics, subscription, since)
+        # Writes to a vanished client can succeed for a while; notice the EOF instead
+        disconnected = asyncio.ensure_future(self._wait_disconnect(reader))
+        try:
+            while True:
+                getter = asyncio.ensure_future(subscription.queue.get())
+                done, _ = await asyncio.wait({getter, disconnected}, timeout=SSE_KEEPALIVE,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    message = getter.result()
+                else:
+                    getter.cancel()
+                    # Keepalive; also drop the stream once the session expires
+                    if disconnected.done() or not _session_user(cookie):
+                        break
+                    message = SSE_PING
+                writer.write(message)
+                await writer.drain()
+        finally:
+            disconnected.cancel()
+            _event_hub.unsubscribe(subscription)
 
 # ─── Main ─────────────────────────────────────────────────────────────────────
 
 def main():
-    global _config, _auth, _sessions, _layer_mgr, _bandwidth
+    global _config, _auth, _sessions, _layer_mgr, _bandwidth, _event_hub, _system_sampler, _http_server, _assets, _tls
 
     _config = Config.load()
     _auth = Authenticator()
     _sessions = SessionManager(_config.secret_key, _config.session_timeout)
-    _layer_mgr = LayerManager(_config)
-    _bandwidth = BandwidthMonitor(_config)
+    xray_stats = XrayStats(_config)
+    _layer_mgr = LayerManager(_config, xray_stats)
+    _bandwidth = BandwidthMonitor(_config, xray_stats)
 
     # Always re-detect layer on startup (handles layer changes after reinstall)
     detected = _layer_mgr.detect_layer()
@@ -1910,6 +4974,10 @@ def main():
     _config.save()
     log(f"Active layer: {detected}")
 
+    SystemInfo.load_static()
+    _assets = AssetCache(STATIC_DIR, TEMPLATES_DIR)
+    _assets.load()
+
     # Ensure data directory exists
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -1929,30 +4997,82 @@ def main():
         except Exception as e:
             log(f"Error recovering switch state: {e}", "WARN")
 
-    # Patch existing xray clients to add email fields for stats tracking
+    # Patch existing xray config for stats tracking and live user changes
     if _config.user_management == "v2ray":
-        _ensure_xray_client_emails()
+        _ensure_xray_panel_config()
+
+    # Seed interface history from vnstat once, if it is installed
+    if _config.vnstat_import:
+        _bandwidth.interfaces.import_vnstat()
 
     # Start bandwidth collector
     collector = BandwidthCollector(_bandwidth)
     collector.start()
 
-    # Create HTTPS server
-    server = ThreadedHTTPServer(("0.0.0.0", _config.port), PanelHandler)
-
-    # Set up SSL
+    # Start live throughput sampler (throughput_interval <= 0 disables it)
+    if _config.throughput_interval > 0:
+        ThroughputSampler(_bandwidth, _config.throughput_interval).start()
+
+    # Start system resource sampler (system_sample_interval <= 0 disables it)
+    if _config.system_sample_interval > 0:
+        _system_sampler = SystemSampler(_config.system_sample_interval, _config.system_samples)
+        _system_sampler.start()
+
+    # Start the dashboard event stream; intervals match the old polling cadence
+    _event_hub = EventHub({
+        "overview": (20, lambda: {"info": RESPONSE_CACHE.get("system_info", _system_info_payload),
+                                  "status": SystemInfo.get_all_services_status()}),
+        "users": (5, lambda: RESPONSE_CACHE.get("users", _layer_mgr.list_users)),
+        "bandwidth": (10, lambda: {"system": RESPONSE_CACHE.get("system_bandwidth", _bandwidth.get_system_bandwidth),
+                                   "users": _bandwidth.get_user_bandwidth()}),
+        "connections": (5, lambda: summarize_connections(
+            _bandwidth.get_connections(_layer_mgr.get_proxy_ports()))),
+        "switch": (2, _switch_status_payload),
+    })
+    _event_hub.start()
+
+    # Optional local metrics listener, e.g. for a node-local Prometheus agent
+    if _config.metrics_port and _config.metrics_token:
+        metrics_server = ThreadedHTTPServer((_config.metrics_bind, _config.metrics_port), MetricsHandler)
+        threading.Thread(target=metrics_server.serve_forever, daemon=True).start()
+        log(f"Metrics on http://{_config.metrics_bind}:{_config.metrics_port}/metrics")
+    elif _config.metrics_port:
+        log("metrics_port is set but metrics_token is empty; metrics disabled", "WARN")
+
+    # Set up TLS; renewed certificates are picked up while running
     cert_file = PANEL_DIR / "certs" / "panel.pem"
     key_file = PANEL_DIR / "certs" / "panel.key"
-
     if cert_file.exists() and key_file.exists():
-        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        ctx.minimum_version = ssl.TLSVersion.TLSv1_2
-        ctx.load_cert_chain(str(cert_file), str(key_file))
-        server.socket = ctx.wrap_socket(server.socket, server_side=True)
+        _tls = TLSContextManager(cert_file, key_file, _config.tls_ticket_rotation)
+        _tls.start()
+
+    # Create HTTPS server
+    PanelHandler.timeout = _config.http_idle_timeout
+    PanelHandler.keepalive_timeout = _config.http_keepalive_timeout
+    if _config.server_mode == "asyncio":
+        server = AsyncPanelServer(("0.0.0.0", _config.port), _tls, _config.http_workers,
+                                  _config.subprocess_limit, _config.http_idle_timeout,
+                                  _config.max_event_streams)
+    else:
+        if _config.server_mode == "threading":
+            server = ThreadedHTTPServer(("0.0.0.0", _config.port), PanelHandler)
+        else:
+            server = PooledHTTPServer(("0.0.0.0", _config.port), PanelHandler,
+                                      _config.http_workers, _config.http_queue)
+        server.tls = _tls
+    _http_server = server
+
+    if _tls:
         log(f"Panel started on https://0.0.0.0:{_config.port} (HTTPS)")
     else:
         log(f"Panel started on http://0.0.0.0:{_config.port} (HTTP - no certs found)", "WARN")
 
+    if isinstance(server, PooledHTTPServer):
+        log(f"HTTP workers: {server.workers}, queue: {_config.http_queue}, idle timeout: {_config.http_idle_timeout}s, "
+            f"keep-alive: {_config.http_keepalive_timeout}s for up to {server.keepalive_limit} connections")
+    elif isinstance(server, AsyncPanelServer):
+        log(f"asyncio engine: {server.workers} workers, {server.subprocess_limit} concurrent commands, "
+            f"{server.max_streams} event streams")
     log(f"Layer: {_config.layer} | Service: {_config.service_type} | User mgmt: {_config.user_management}")
 
     try:
@@ -25,6 +25,7 @@ const translations = {
         users_title: "User Management",
         add_user: "Add User",
         total_users: "Total users",
+        sessions_label: "Sessions",
         th_username: "Username",
         th_type: "Type",
         th_status: "Status",
@@ -34,6 +35,7 @@ const translations = {
         no_users: "No users found. Add your first user.",
         connected: "Connected",
         offline: "Offline",
+        connected_since: "Connected since",
         config: "Config",
         delete: "Delete",
         show_password: "Show password",
@@ -80,6 +82,7 @@ const translations = {
         upload_label: "Upload",
         download_label: "Download",
         total_label: "Total",
+        live_rate_label: "Live",
         auto_refresh_note: "Auto refresh every 10s",
         auto_refresh_note_5s: "Auto refresh every 5s",
 
@@ -91,6 +94,17 @@ const translations = {
         th_state: "State",
         th_process: "Process",
         active_connections: "Active connections",
+        unique_remotes: "Unique remote IPs",
+        established: "Established",
+        top_sources: "Top Sources",
+        th_count: "Connections",
+        all_states: "All states",
+        auto_detect: "Auto-detect",
+        interface_changed: "Interface updated",
+        all_users: "All users",
+        prev_page: "Previous",
+        next_page: "Next",
+        page_label: "Page",
 
         // Service
         service_title: "Service Control",
@@ -100,6 +114,9 @@ const translations = {
         service_logs: "Service Logs",
         load_logs: "Load Logs",
         click_load_logs: "Click \"Load Logs\" to view service logs...",
+        follow_logs: "Follow",
+        stop_following: "Stop following",
+        all_levels: "All levels",
 
         // Settings / Layer Switching
         nav_settings: "Settings",
@@ -151,6 +168,7 @@ const translations = {
         users_title: "\u0645\u062f\u06cc\u0631\u06cc\u062a \u06a9\u0627\u0631\u0628\u0631\u0627\u0646",
         add_user: "\u0627\u0641\u0632\u0648\u062f\u0646 \u06a9\u0627\u0631\u0628\u0631",
         total_users: "\u062a\u0639\u062f\u0627\u062f \u06a9\u0627\u0631\u0628\u0631\u0627\u0646",
+        sessions_label: "\u0646\u0634\u0633\u062a\u200c\u0647\u0627",
         th_username: "\u0646\u0627\u0645 \u06a9\u0627\u0631\u0628\u0631\u06cc",
         th_type: "\u0646\u0648\u0639",
         th_status: "\u0648\u0636\u0639\u06cc\u062a",
@@ -160,6 +178,7 @@ const translations = {
         no_users: "\u06a9\u0627\u0631\u0628\u0631\u06cc \u06cc\u0627\u0641\u062a \u0646\u0634\u062f. \u0627\u0648\u0644\u06cc\u0646 \u06a9\u0627\u0631\u0628\u0631 \u0631\u0627 \u0627\u0636\u0627\u0641\u0647 \u06a9\u0646\u06cc\u062f.",
         connected: "\u0645\u062a\u0635\u0644",
         offline: "\u0622\u0641\u0644\u0627\u06cc\u0646",
+        connected_since: "\u0645\u062a\u0635\u0644 \u0627\u0632",
         config: "\u067e\u06cc\u06a9\u0631\u0628\u0646\u062f\u06cc",
         delete: "\u062d\u0630\u0641",
         show_password: "\u0646\u0645\u0627\u06cc\u0634 \u0631\u0645\u0632 \u0639\u0628\u0648\u0631",
@@ -203,6 +222,7 @@ const translations = {
         upload_label: "\u0622\u067e\u0644\u0648\u062f",
         download_label: "\u062f\u0627\u0646\u0644\u0648\u062f",
         total_label: "\u06a9\u0644",
+        live_rate_label: "\u0644\u062d\u0638\u0647\u200c\u0627\u06cc",
         auto_refresh_note: "\u0628\u0647\u200c\u0631\u0648\u0632\u0631\u0633\u0627\u0646\u06cc \u062e\u0648\u062f\u06a9\u0627\u0631 \u0647\u0631 \u06f1\u06f0 \u062b\u0627\u0646\u06cc\u0647",
         auto_refresh_note_5s: "\u0628\u0647\u200c\u0631\u0648\u0632\u0631\u0633\u0627\u0646\u06cc \u062e\u0648\u062f\u06a9\u0627\u0631 \u0647\u0631 \u06f5 \u062b\u0627\u0646\u06cc\u0647",
 
@@ -213,6 +233,17 @@ const translations = {
         th_state: "\u0648\u0636\u0639\u06cc\u062a",
         th_process: "\u0641\u0631\u0622\u06cc\u0646\u062f",
         active_connections: "\u0627\u062a\u0635\u0627\u0644\u0627\u062a \u0641\u0639\u0627\u0644",
+        unique_remotes: "\u0622\u06cc\u200c\u067e\u06cc\u200c\u0647\u0627\u06cc \u06cc\u06a9\u062a\u0627",
+        established: "\u0628\u0631\u0642\u0631\u0627\u0631",
+        top_sources: "\u0645\u0646\u0627\u0628\u0639 \u067e\u0631\u062a\u06a9\u0631\u0627\u0631",
+        th_count: "\u0627\u062a\u0635\u0627\u0644\u0627\u062a",
+        all_states: "\u0647\u0645\u0647 \u0648\u0636\u0639\u06cc\u062a\u200c\u0647\u0627",
+        auto_detect: "\u062a\u0634\u062e\u06cc\u0635 \u062e\u0648\u062f\u06a9\u0627\u0631",
+        interface_changed: "\u0631\u0627\u0628\u0637 \u0634\u0628\u06a9\u0647 \u062a\u063a\u06cc\u06cc\u0631 \u06a9\u0631\u062f",
+        all_users: "\u0647\u0645\u0647 \u06a9\u0627\u0631\u0628\u0631\u0627\u0646",
+        prev_page: "\u0642\u0628\u0644\u06cc",
+        next_page: "\u0628\u0639\u062f\u06cc",
+        page_label: "\u0635\u0641\u062d\u0647",
 
         service_title: "\u06a9\u0646\u062a\u0631\u0644 \u0633\u0631\u0648\u06cc\u0633",
         restart_service: "\u0631\u0627\u0647\u200c\u0627\u0646\u062f\u0627\u0632\u06cc \u0645\u062c\u062f\u062f",
@@ -220,6 +251,9 @@ const translations = {
         service_restarted: "\u0633\u0631\u0648\u06cc\u0633 \u0628\u0627 \u0645\u0648\u0641\u0642\u06cc\u062a \u0631\u0627\u0647\u200c\u0627\u0646\u062f\u0627\u0632\u06cc \u0634\u062f",
         service_logs: "\u0644\u0627\u06af\u200c\u0647\u0627\u06cc \u0633\u0631\u0648\u06cc\u0633",
         load_logs: "\u0628\u0627\u0631\u06af\u0630\u0627\u0631\u06cc \u0644\u0627\u06af",
+        follow_logs: "\u062f\u0646\u0628\u0627\u0644 \u06a9\u0631\u062f\u0646",
+        stop_following: "\u062a\u0648\u0642\u0641 \u062f\u0646\u0628\u0627\u0644 \u06a9\u0631\u062f\u0646",
+        all_levels: "\u0647\u0645\u0647 \u0633\u0637\u0648\u062d",
         click_load_logs: "\u0628\u0631\u0627\u06cc \u0645\u0634\u0627\u0647\u062f\u0647 \u0644\u0627\u06af\u200c\u0647\u0627 \u0631\u0648\u06cc \"\u0628\u0627\u0631\u06af\u0630\u0627\u0631\u06cc \u0644\u0627\u06af\" \u06a9\u0644\u06cc\u06a9 \u06a9\u0646\u06cc\u062f...",
 
         // Settings / Layer Switching
@@ -266,6 +300,22 @@ let layersData = null;
 let switchPollInterval = null;
 let pendingSwitchLayer = null;
 let sectionRefreshInterval = null;
+let eventSource = null;
+let connectionFilter = { q: "", state: "", user: "", page: 1 };
+let connectionFilterTimer = null;
+const CONNECTIONS_PER_PAGE = 100;
+let logCursor = null;
+let logFollowInterval = null;
+let logFilterTimer = null;
+const LOG_FOLLOW_MS = 2000;
+const LOG_MAX_LINES = 2000;
+const SECTION_EVENT_TOPICS = {
+    overview: ["overview"],
+    users: ["users"],
+    bandwidth: ["bandwidth"],
+    connections: ["connections"],
+    settings: ["switch"]
+};
 const SECTION_REFRESH_MS = {
     overview: 20000,
     users: 5000,
@@ -319,14 +369,77 @@ function showSection(name, navEl) {
     // Load data for section
     stopBandwidthAutoRefresh();
     stopSectionAutoRefresh();
+    stopLogFollow();
 
-    if (name === "overview") loadOverview();
-    else if (name === "users") loadUsers();
-    else if (name === "bandwidth") loadBandwidth();
-    else if (name === "connections") loadConnections();
-    else if (name === "settings") loadLayers();
+    if (name === "settings") {
+        // Paint the layer list fetched with the dashboard while it refreshes
+        if (layersData) renderLayerCards(layersData);
+        loadLayers();
+    }
 
-    startSectionAutoRefresh(name);
+    subscribeSection(name);
+}
+
+/* ─── Live Updates ──────────────────────────────────────────────────────── */
+
+function subscribeSection(name, since) {
+    // since: server time of data already rendered for this section, if any
+    unsubscribeEvents();
+    const topics = SECTION_EVENT_TOPICS[name];
+    if (!topics) return;
+
+    if (!window.EventSource) {
+        // No SSE support: fall back to polling
+        if (!since) {
+            if (name === "overview") loadOverview();
+            else if (name === "users") loadUsers();
+            else if (name === "bandwidth") loadBandwidth();
+            else if (name === "connections") loadConnections();
+        }
+        startSectionAutoRefresh(name);
+        return;
+    }
+
+    // The server pushes the latest snapshot on connect, unless the data from
+    // `since` is still current, then on every interval
+    eventSource = new EventSource("/api/events?topics=" + topics.join(",") + (since ? "&since=" + since : ""));
+    eventSource.addEventListener("overview", e => {
+        const data = JSON.parse(e.data);
+        renderOverview(data.info, data.status);
+    });
+    eventSource.addEventListener("users", e => {
+        const users = JSON.parse(e.data);
+        renderUsers(users);
+        renderUserSummary(summarizeUsers(users));
+    });
+    eventSource.addEventListener("bandwidth", e => {
+        const data = JSON.parse(e.data);
+        renderSystemBandwidth(data.system);
+        bandwidthData = data.users;
+        renderUserBandwidth(bandwidthData);
+    });
+    eventSource.addEventListener("connections", e => {
+        // The stream carries the summary; the visible page is re-fetched with its filters
+        renderConnectionSummary(JSON.parse(e.data));
+        loadConnectionPage();
+    });
+    eventSource.addEventListener("switch", e => handleSwitchEvent(JSON.parse(e.data)));
+    eventSource.onerror = () => {
+        // EventSource retries on its own; a closed stream means it was rejected
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            unsubscribeEvents();
+            api("/api/system/info").then(resp => {
+                if (resp) startSectionAutoRefresh(name);
+            }).catch(() => startSectionAutoRefresh(name));
+        }
+    };
+}
+
+function unsubscribeEvents() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
 }
 
 /* ─── API Helper ────────────────────────────────────────────────────────── */
@@ -348,63 +461,89 @@ async function api(path, options = {}) {
 
 /* ─── Overview ──────────────────────────────────────────────────────────── */
 
-async function loadOverview() {
+async function loadDashboard(fields) {
+    // One round trip for everything the first screen needs; resolves to the
+    // server time of the overview when it was rendered, otherwise null
     try {
-        const [infoResp, statusResp] = await Promise.all([
-            api("/api/system/info"),
-            api("/api/system/status")
-        ]);
+        const resp = await api("/api/dashboard" + (fields ? "?fields=" + fields.join(",") : ""));
+        if (!resp) return null;
+        const data = await resp.json();
+        if (data.overview || data.status) renderOverview(data.overview, data.status);
+        if (data.users) renderUserSummary(data.users);
+        if (data.layers) layersData = data.layers;
+        return data.overview && data.status ? data.time : null;
+    } catch (err) {
+        console.error("Failed to load dashboard:", err);
+        return null;
+    }
+}
 
-        if (infoResp) {
-            const info = await infoResp.json();
-            document.getElementById("stat-ip").textContent = info.ip || "-";
-            document.getElementById("stat-uptime").textContent = info.uptime || "-";
-            document.getElementById("stat-layer").textContent = info.layer || "-";
-            document.getElementById("stat-os").textContent = info.os || "-";
-
-            // CPU
-            const cpuPct = info.cpu_usage || 0;
-            document.getElementById("stat-cpu").textContent = cpuPct + "%";
-            const cpuBar = document.getElementById("cpu-bar");
-            cpuBar.style.width = cpuPct + "%";
-            cpuBar.className = "progress-fill" + (cpuPct > 80 ? " danger" : cpuPct > 60 ? " warn" : "");
-
-            // Memory
-            const mem = info.memory || {};
-            const memPct = mem.percent || 0;
-            document.getElementById("stat-mem").textContent = `${mem.used || 0} / ${mem.total || 0} GB (${memPct}%)`;
-            const memBar = document.getElementById("mem-bar");
-            memBar.style.width = memPct + "%";
-            memBar.className = "progress-fill" + (memPct > 80 ? " danger" : memPct > 60 ? " warn" : "");
-
-            // Disk
-            const disk = info.disk || {};
-            const diskPct = disk.percent || 0;
-            document.getElementById("stat-disk").textContent = `${disk.used || 0} / ${disk.total || 0} GB (${diskPct}%)`;
-            const diskBar = document.getElementById("disk-bar");
-            diskBar.style.width = diskPct + "%";
-            diskBar.className = "progress-fill" + (diskPct > 80 ? " danger" : diskPct > 60 ? " warn" : "");
-
-            // Track layer type
-            currentLayerIsV2Ray = (info.layer || "").startsWith("layer7");
-        }
+async function loadOverview() {
+    await loadDashboard(["overview", "status", "users"]);
+}
 
-        if (statusResp) {
-            const status = await statusResp.json();
-            const container = document.getElementById("service-status-list");
-            container.innerHTML = "";
-            for (const [svc, st] of Object.entries(status)) {
-                const dotClass = st === "active" ? "active" : st === "inactive" ? "inactive" : "unknown";
-                container.innerHTML += `
-                    <div class="service-badge">
-                        <span class="service-dot ${dotClass}"></span>
-                        <span>${svc}: ${st}</span>
-                    </div>
-                `;
-            }
+function summarizeUsers(users) {
+    return {
+        total: users.length,
+        connected: users.filter(u => u.connected).length,
+        sessions: users.reduce((n, u) => n + (u.sessions !== undefined ? u.sessions : u.connected ? 1 : 0), 0)
+    };
+}
+
+function renderUserSummary(summary) {
+    document.getElementById("stat-users-total").textContent = summary.total;
+    document.getElementById("stat-users-connected").textContent = summary.connected;
+    document.getElementById("stat-users-sessions").textContent = summary.sessions;
+}
+
+function renderOverview(info, status) {
+    if (info) {
+        document.getElementById("stat-ip").textContent = info.ip || "-";
+        document.getElementById("stat-uptime").textContent = info.uptime || "-";
+        document.getElementById("stat-layer").textContent = info.layer || "-";
+        document.getElementById("stat-os").textContent = info.os || "-";
+
+        // CPU
+        const cpuPct = info.cpu_usage || 0;
+        document.getElementById("stat-cpu").textContent = cpuPct + "%";
+        const cpuBar = document.getElementById("cpu-bar");
+        cpuBar.style.width = cpuPct + "%";
+        cpuBar.className = "progress-fill" + (cpuPct > 80 ? " danger" : cpuPct > 60 ? " warn" : "");
+
+        // Memory
+        const mem = info.memory || {};
+        const memPct = mem.percent || 0;
+        document.getElementById("stat-mem").textContent = `${mem.used || 0} / ${mem.total || 0} GB (${memPct}%)`;
+        const memBar = document.getElementById("mem-bar");
+        memBar.style.width = memPct + "%";
+        memBar.className = "progress-fill" + (memPct > 80 ? " danger" : memPct > 60 ? " warn" : "");
+
+        // Disk
+        const disk = info.disk || {};
+        const diskPct = disk.percent || 0;
+        document.getElementById("stat-disk").textContent = `${disk.used || 0} / ${disk.total || 0} GB (${diskPct}%)`;
+        const diskBar = document.getElementById("disk-bar");
+        diskBar.style.width = diskPct + "%";
+        diskBar.className = "progress-fill" + (diskPct > 80 ? " danger" : diskPct > 60 ? " warn" : "");
+
+        // Track layer type
+        currentLayerIsV2Ray = (info.layer || "").startsWith("layer7");
+    }
+
+    if (status) {
+        const container = document.getElementById("service-status-list");
+        container.innerHTML = "";
+        for (const [svc, st] of Object.entries(status)) {
+            const dotClass = st.state === "active" ? "active" : st.state === "inactive" || st.state === "failed" ? "inactive" : "unknown";
+            const uptime = st.state === "active" && st.uptime ? ` \u00b7 ${formatDuration(st.uptime)}` : "";
+            const restarts = st.restarts ? ` \u00b7 \u21bb${st.restarts}` : "";
+            container.innerHTML += `
+                <div class="service-badge" title="${escapeHtml(st.sub_state || "")}">
+                    <span class="service-dot ${dotClass}"></span>
+                    <span>${svc}: ${st.state}${uptime}${restarts}</span>
+                </div>
+            `;
         }
-    } catch (err) {
-        console.error("Failed to load overview:", err);
     }
 }
 
@@ -414,64 +553,68 @@ async function loadUsers() {
     try {
         const resp = await api("/api/users");
         if (!resp) return;
-        const users = await resp.json();
-        const tbody = document.getElementById("users-tbody");
-        const noUsers = document.getElementById("no-users");
-        const countEl = document.getElementById("user-count");
+        renderUsers(await resp.json());
+    } catch (err) {
+        console.error("Failed to load users:", err);
+    }
+}
 
-        countEl.textContent = users.length;
+function renderUsers(users) {
+    const tbody = document.getElementById("users-tbody");
+    const noUsers = document.getElementById("no-users");
+    const countEl = document.getElementById("user-count");
 
-        if (users.length === 0) {
-            tbody.innerHTML = "";
-            noUsers.style.display = "block";
-            document.querySelector(".table-container")?.style && (document.querySelector("#section-users .table-container").style.display = "none");
-            return;
-        }
+    countEl.textContent = users.length;
 
-        noUsers.style.display = "none";
-        const tableContainer = document.querySelector("#section-users .table-container");
-        if (tableContainer) tableContainer.style.display = "";
-
-        tbody.innerHTML = users.map(u => {
-            const statusClass = u.connected ? "connected" : "offline";
-            const statusText = u.connected ? t("connected") : t("offline");
-            const hasPassword = u.type === "ssh" && u.password;
-            const passwordValue = hasPassword ? String(u.password) : "";
-            const passwordAttr = hasPassword ? escapeHtml(passwordValue) : "";
-            const maskedPassword = hasPassword ? maskPassword(passwordValue) : "-";
-            const passwordCell = u.type === "ssh"
-                ? `<div class="password-cell">
-                        <span class="password-text" data-password="${passwordAttr}" data-visible="false">${escapeHtml(maskedPassword)}</span>
-                        <button class="icon-btn" type="button" onclick="togglePasswordVisibility(this)" ${hasPassword ? "" : "disabled"} title="${t("show_password")}" aria-label="${t("show_password")}">
-                            ${eyeIcon(false)}
-                        </button>
-                   </div>`
-                : "-";
-            const configBtn = u.type === "v2ray"
-                ? `<button class="btn btn-sm btn-secondary" onclick="showConfig('${u.username}')">${t("config")}</button>`
-                : "";
-            const changePwBtn = u.type === "ssh"
-                ? `<button class="btn btn-sm btn-secondary" onclick="showChangePasswordModal('${u.username}')">${t("change_password")}</button>`
-                : "";
-
-            return `<tr>
-                <td><strong>${escapeHtml(u.username)}</strong></td>
-                <td>${u.type || "ssh"}</td>
-                <td><span class="status-badge ${statusClass}">${statusText}</span></td>
-                <td>${u.created || "-"}</td>
-                <td>${passwordCell}</td>
-                <td>
-                    <div class="user-actions">
-                        ${configBtn}
-                        ${changePwBtn}
-                        <button class="btn btn-sm btn-danger" onclick="showDeleteModal('${escapeHtml(u.username)}')">${t("delete")}</button>
-                    </div>
-                </td>
-            </tr>`;
-        }).join("");
-    } catch (err) {
-        console.error("Failed to load users:", err);
+    if (users.length === 0) {
+        tbody.innerHTML = "";
+        noUsers.style.display = "block";
+        document.querySelector(".table-container")?.style && (document.querySelector("#section-users .table-container").style.display = "none");
+        return;
     }
+
+    noUsers.style.display = "none";
+    const tableContainer = document.querySelector("#section-users .table-container");
+    if (tableContainer) tableContainer.style.display = "";
+
+    tbody.innerHTML = users.map(u => {
+        const statusClass = u.connected ? "connected" : "offline";
+        const statusText = u.connected ? t("connected") + (u.sessions > 1 ? ` (${u.sessions})` : "") : t("offline");
+        const statusTitle = u.connected_since ? `${t("connected_since")} ${new Date(u.connected_since * 1000).toLocaleString()}` : "";
+        const hasPassword = u.type === "ssh" && u.password;
+        const passwordValue = hasPassword ? String(u.password) : "";
+        const passwordAttr = hasPassword ? escapeHtml(passwordValue) : "";
+        const maskedPassword = hasPassword ? maskPassword(passwordValue) : "-";
+        const passwordCell = u.type === "ssh"
+            ? `<div class="password-cell">
+                    <span class="password-text" data-password="${passwordAttr}" data-visible="false">${escapeHtml(maskedPassword)}</span>
+                    <button class="icon-btn" type="button" onclick="togglePasswordVisibility(this)" ${hasPassword ? "" : "disabled"} title="${t("show_password")}" aria-label="${t("show_password")}">
+                        ${eyeIcon(false)}
+                    </button>
+               </div>`
+            : "-";
+        const configBtn = u.type === "v2ray"
+            ? `<button class="btn btn-sm btn-secondary" onclick="showConfig('${u.username}')">${t("config")}</button>`
+            : "";
+        const changePwBtn = u.type === "ssh"
+            ? `<button class="btn btn-sm btn-secondary" onclick="showChangePasswordModal('${u.username}')">${t("change_password")}</button>`
+            : "";
+
+        return `<tr>
+            <td><strong>${escapeHtml(u.username)}</strong></td>
+            <td>${u.type || "ssh"}</td>
+            <td><span class="status-badge ${statusClass}" title="${statusTitle}">${statusText}</span></td>
+            <td>${u.created || "-"}</td>
+            <td>${passwordCell}</td>
+            <td>
+                <div class="user-actions">
+                    ${configBtn}
+                    ${changePwBtn}
+                    <button class="btn btn-sm btn-danger" onclick="showDeleteModal('${escapeHtml(u.username)}')">${t("delete")}</button>
+                </div>
+            </td>
+        </tr>`;
+    }).join("");
 }
 
 function showAddUserModal() {
@@ -685,6 +828,27 @@ function formatBytes(bytes) {
     return val.toFixed(1) + " " + units[i];
 }
 
+function formatDuration(seconds) {
+    const d = Math.floor(seconds / 86400);
+    const h = Math.floor((seconds % 86400) / 3600);
+    const m = Math.floor((seconds % 3600) / 60);
+    if (d > 0) return `${d}d ${h}h`;
+    if (h > 0) return `${h}h ${m}m`;
+    return `${m}m`;
+}
+
+function formatBitrate(bps) {
+    if (!bps) return "0 bps";
+    const units = ["bps", "Kbps", "Mbps", "Gbps"];
+    let i = 0;
+    let val = bps;
+    while (val >= 1000 && i < units.length - 1) {
+        val /= 1000;
+        i++;
+    }
+    return val.toFixed(1) + " " + units[i];
+}
+
 function setBandwidthPeriod(period, btn) {
     currentBandwidthPeriod = period;
     document.querySelectorAll(".period-btn").forEach(b => b.classList.remove("active"));
@@ -708,7 +872,7 @@ function renderUserBandwidth(users) {
     const entries = Object.entries(users);
 
     if (entries.length === 0) {
-        tbody.innerHTML = `<tr><td colspan="4" style="text-align:center;color:var(--text-dim)">No data</td></tr>`;
+        tbody.innerHTML = `<tr><td colspan="5" style="text-align:center;color:var(--text-dim)">No data</td></tr>`;
         chartContainer.innerHTML = `<p style="text-align:center;color:var(--text-dim)">No per-user data available</p>`;
         return;
     }
@@ -720,6 +884,7 @@ function renderUserBandwidth(users) {
             <td>${formatBytes(up)}</td>
             <td>${formatBytes(down)}</td>
             <td>${formatBytes(up + down)}</td>
+            <td title="peak \u2191${formatBitrate(data.peak_uplink_bps)} \u2193${formatBitrate(data.peak_downlink_bps)}">\u2191${formatBitrate(data.uplink_bps)} \u2193${formatBitrate(data.downlink_bps)}</td>
         </tr>`;
     }).join("");
 
@@ -732,20 +897,18 @@ async function loadBandwidth() {
     const refreshBtn = document.getElementById("bandwidthRefreshBtn");
     if (refreshBtn) refreshBtn.disabled = true;
     try {
-        const [sysResp, userResp] = await Promise.all([
+        const [sysResp, userResp, ifaceResp] = await Promise.all([
             api("/api/bandwidth/system"),
-            api("/api/bandwidth/users")
+            api("/api/bandwidth/users"),
+            api("/api/bandwidth/interfaces")
         ]);
 
+        if (ifaceResp) {
+            renderInterfaceOptions(await ifaceResp.json());
+        }
+
         if (sysResp) {
-            const sys = await sysResp.json();
-            const todayTotal = (sys.today?.rx || 0) + (sys.today?.tx || 0);
-            const monthTotal = (sys.month?.rx || 0) + (sys.month?.tx || 0);
-            const allTotal = (sys.total?.rx || 0) + (sys.total?.tx || 0);
-
-            document.getElementById("bw-today").textContent = formatBytes(todayTotal);
-            document.getElementById("bw-month").textContent = formatBytes(monthTotal);
-            document.getElementById("bw-total").textContent = formatBytes(allTotal);
+            renderSystemBandwidth(await sysResp.json());
         }
 
         if (userResp) {
@@ -760,6 +923,42 @@ async function loadBandwidth() {
     }
 }
 
+function renderSystemBandwidth(sys) {
+    const todayTotal = (sys.today?.rx || 0) + (sys.today?.tx || 0);
+    const monthTotal = (sys.month?.rx || 0) + (sys.month?.tx || 0);
+    const allTotal = (sys.total?.rx || 0) + (sys.total?.tx || 0);
+
+    document.getElementById("bw-today").textContent = formatBytes(todayTotal);
+    document.getElementById("bw-month").textContent = formatBytes(monthTotal);
+    document.getElementById("bw-total").textContent = formatBytes(allTotal);
+}
+
+function renderInterfaceOptions(data) {
+    const select = document.getElementById("bwInterface");
+    const auto = select.options[0];
+    auto.textContent = data.detected ? `${t("auto_detect")} (${data.detected})` : t("auto_detect");
+    fillFilterOptions("bwInterface", data.interfaces);
+    select.value = data.selected;
+}
+
+async function setBandwidthInterface(iface) {
+    try {
+        const resp = await api("/api/bandwidth/interface", {
+            method: "POST",
+            body: JSON.stringify({ interface: iface })
+        });
+        const data = await resp.json();
+        if (data.success) {
+            showToast(t("interface_changed"), "success");
+            loadBandwidth();
+        } else {
+            showToast(data.error || "Failed to set interface", "error");
+        }
+    } catch (err) {
+        showToast("Network error", "error");
+    }
+}
+
 async function refreshBandwidth() {
     await loadBandwidth();
 }
@@ -856,28 +1055,130 @@ function renderBandwidthChart(container, entries) {
 
 async function loadConnections() {
     try {
-        const resp = await api("/api/connections");
+        const resp = await api("/api/connections/summary");
         if (!resp) return;
-        const connections = await resp.json();
-        const tbody = document.getElementById("connections-tbody");
-        const countEl = document.getElementById("conn-count");
+        renderConnectionSummary(await resp.json());
+    } catch (err) {
+        console.error("Failed to load connection summary:", err);
+    }
+    await loadConnectionPage();
+}
 
-        countEl.textContent = `${t("active_connections")}: ${connections.length}`;
+async function loadConnectionPage() {
+    const params = new URLSearchParams({
+        page: connectionFilter.page,
+        per_page: CONNECTIONS_PER_PAGE
+    });
+    if (connectionFilter.q) params.set("q", connectionFilter.q);
+    if (connectionFilter.state) params.set("state", connectionFilter.state);
+    if (connectionFilter.user) params.set("user", connectionFilter.user);
+    try {
+        const resp = await api("/api/connections?" + params.toString());
+        if (!resp) return;
+        renderConnections(await resp.json());
+    } catch (err) {
+        console.error("Failed to load connections:", err);
+    }
+}
 
-        if (connections.length === 0) {
-            tbody.innerHTML = `<tr><td colspan="4" style="text-align:center;color:var(--text-dim)">No active connections</td></tr>`;
-            return;
-        }
+function fillFilterOptions(selectId, values) {
+    const select = document.getElementById(selectId);
+    const current = select.value;
+    const first = select.options[0];
+    select.innerHTML = "";
+    select.appendChild(first);
+    values.forEach(v => {
+        const opt = document.createElement("option");
+        opt.value = v;
+        opt.textContent = v;
+        select.appendChild(opt);
+    });
+    // Keep the selection even if the value dropped out of the current summary
+    if (current && !values.includes(current)) {
+        const opt = document.createElement("option");
+        opt.value = current;
+        opt.textContent = current;
+        select.appendChild(opt);
+    }
+    select.value = current;
+}
 
-        tbody.innerHTML = connections.map(c => `<tr>
-            <td>${escapeHtml(c.remote)}</td>
-            <td>${escapeHtml(c.local)}</td>
-            <td>${escapeHtml(c.state)}</td>
-            <td>${escapeHtml(c.process || "-")}</td>
+function renderConnectionSummary(summary) {
+    document.getElementById("conn-total").textContent = summary.total;
+    document.getElementById("conn-unique").textContent = summary.unique_remotes;
+    document.getElementById("conn-established").textContent = summary.by_state.ESTAB || 0;
+
+    document.getElementById("conn-states").innerHTML = Object.entries(summary.by_state).map(([state, count]) =>
+        `<div class="service-badge"><span>${escapeHtml(state)}: ${count}</span></div>`
+    ).join("");
+
+    const topTbody = document.getElementById("conn-top-tbody");
+    topTbody.innerHTML = summary.top_remotes.length === 0
+        ? `<tr><td colspan="3" style="text-align:center;color:var(--text-dim)">-</td></tr>`
+        : summary.top_remotes.map(r => `<tr>
+            <td>${escapeHtml(r.ip)}</td>
+            <td>${r.count}</td>
+            <td>${escapeHtml(r.users.join(", ") || "-")}</td>
         </tr>`).join("");
-    } catch (err) {
-        console.error("Failed to load connections:", err);
+
+    const userEntries = Object.entries(summary.by_user);
+    const usersTbody = document.getElementById("conn-users-tbody");
+    usersTbody.innerHTML = userEntries.length === 0
+        ? `<tr><td colspan="2" style="text-align:center;color:var(--text-dim)">-</td></tr>`
+        : userEntries.map(([user, count]) => `<tr>
+            <td><strong>${escapeHtml(user)}</strong></td>
+            <td>${count}</td>
+        </tr>`).join("");
+
+    fillFilterOptions("connFilterState", Object.keys(summary.by_state));
+    fillFilterOptions("connFilterUser", userEntries.map(([user]) => user));
+}
+
+function renderConnections(data) {
+    const tbody = document.getElementById("connections-tbody");
+    const countEl = document.getElementById("conn-count");
+
+    // Filters can shrink the result below the current page; step back to the last one
+    if (data.page > data.pages && connectionFilter.page > 1) {
+        connectionFilter.page = data.pages;
+        loadConnectionPage();
+        return;
     }
+
+    countEl.textContent = `${t("active_connections")}: ${data.filtered} / ${data.total} · ${t("page_label")} ${data.page}/${data.pages}`;
+    document.getElementById("connPrevBtn").disabled = data.page <= 1;
+    document.getElementById("connNextBtn").disabled = data.page >= data.pages;
+
+    if (data.connections.length === 0) {
+        tbody.innerHTML = `<tr><td colspan="5" style="text-align:center;color:var(--text-dim)">No active connections</td></tr>`;
+        return;
+    }
+
+    tbody.innerHTML = data.connections.map(c => `<tr>
+        <td>${escapeHtml(c.remote)}</td>
+        <td>${escapeHtml(c.local)}</td>
+        <td>${escapeHtml(c.state)}</td>
+        <td>${escapeHtml(c.user || "-")}</td>
+        <td>${escapeHtml(c.process || "-")}</td>
+    </tr>`).join("");
+}
+
+function setConnectionFilter(key, value) {
+    connectionFilter[key] = value;
+    connectionFilter.page = 1;
+    loadConnectionPage();
+}
+
+function onConnectionFilterInput() {
+    clearTimeout(connectionFilterTimer);
+    connectionFilterTimer = setTimeout(() => {
+        setConnectionFilter("q", document.getElementById("connFilterQuery").value.trim());
+    }, 300);
+}
+
+function changeConnectionPage(delta) {
+    connectionFilter.page = Math.max(1, connectionFilter.page + delta);
+    loadConnectionPage();
 }
 
 /* ─── Service Control ───────────────────────────────────────────────────── */
@@ -903,21 +1204,89 @@ async function restartService() {
     }
 }
 
+function logQuery(cursor) {
+    const params = new URLSearchParams();
+    const grep = document.getElementById("logGrep").value.trim();
+    const level = document.getElementById("logLevel").value;
+    if (grep) params.set("grep", grep);
+    if (level) params.set("level", level);
+    if (cursor) params.set("cursor", cursor);
+    return "/api/service/logs?" + params.toString();
+}
+
 async function loadLogs() {
     const viewer = document.getElementById("log-viewer");
     viewer.textContent = "Loading...";
+    logCursor = null;
 
     try {
-        const resp = await api("/api/service/logs");
+        const resp = await api(logQuery(null));
         if (!resp) return;
         const data = await resp.json();
+        if (!resp.ok) {
+            viewer.textContent = data.error || "Failed to load logs";
+            return;
+        }
         viewer.textContent = data.logs || "No logs available";
         viewer.scrollTop = viewer.scrollHeight;
+        logCursor = data.cursor;
     } catch (err) {
         viewer.textContent = "Failed to load logs";
     }
 }
 
+async function pollLogs() {
+    if (!logCursor) {
+        await loadLogs();
+        return;
+    }
+    try {
+        const resp = await api(logQuery(logCursor));
+        if (!resp || !resp.ok) return;
+        const data = await resp.json();
+        logCursor = data.cursor || logCursor;
+        if (!data.entries.length) return;
+
+        // Only new lines arrive; append them and keep the viewer bounded
+        const viewer = document.getElementById("log-viewer");
+        const atBottom = viewer.scrollTop + viewer.clientHeight >= viewer.scrollHeight - 20;
+        const lines = (viewer.textContent + "\n" + data.logs).split("\n");
+        viewer.textContent = lines.slice(-LOG_MAX_LINES).join("\n");
+        if (atBottom) viewer.scrollTop = viewer.scrollHeight;
+    } catch (err) {
+        // transient; the next poll resumes from the same cursor
+    }
+}
+
+function toggleLogFollow() {
+    if (logFollowInterval) {
+        stopLogFollow();
+        return;
+    }
+    pollLogs();
+    logFollowInterval = setInterval(pollLogs, LOG_FOLLOW_MS);
+    const btn = document.getElementById("logFollowBtn");
+    btn.textContent = t("stop_following");
+    btn.classList.add("active");
+}
+
+function stopLogFollow() {
+    if (logFollowInterval) {
+        clearInterval(logFollowInterval);
+        logFollowInterval = null;
+    }
+    const btn = document.getElementById("logFollowBtn");
+    if (btn) {
+        btn.textContent = t("follow_logs");
+        btn.classList.remove("active");
+    }
+}
+
+function onLogFilterChange() {
+    clearTimeout(logFilterTimer);
+    logFilterTimer = setTimeout(loadLogs, 300);
+}
+
 /* ─── Layer Switching ───────────────────────────────────────────────────── */
 
 async function loadLayers() {
@@ -1058,6 +1427,8 @@ function showSwitchProgress() {
 
 function startSwitchPolling() {
     if (switchPollInterval) clearInterval(switchPollInterval);
+    // The settings event stream already pushes switch status
+    if (eventSource) return;
     switchPollInterval = setInterval(pollSwitchStatus, 2000);
 }
 
@@ -1078,6 +1449,14 @@ async function pollSwitchStatus() {
     }
 }
 
+function handleSwitchEvent(data) {
+    if (!data.in_progress && data.phase !== "done" && data.phase !== "error") return;
+    if (document.getElementById("layerSwitchStatus").style.display !== "block") {
+        showSwitchProgress();
+    }
+    updateSwitchUI(data);
+}
+
 async function checkSwitchStatus() {
     try {
         const resp = await api("/api/layer/switch/status");
@@ -1234,8 +1613,8 @@ async function handleLogout() {
 
 document.addEventListener("DOMContentLoaded", () => {
     applyLang(currentLang);
-    loadOverview();
-    startSectionAutoRefresh("overview");
+    // Stream updates once the first render is in, without a second snapshot
+    loadDashboard().then(since => subscribeSection("overview", since));
 });
 
 // Close modal on backdrop click
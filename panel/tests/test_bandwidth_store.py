@@ -0,0 +1,92 @@
+"""Tests for the SQLite bandwidth store: hourly/daily rollups and retention.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+# 2026-10-15 10:20 local time
+NOW = datetime(2026, 10, 15, 10, 20).timestamp()
+HOUR = 3600
+DAY = 86400
+
+
+def traffic(up, down):
+    return {"uplink": up, "downlink": down}
+
+
+class BandwidthStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.store = panel.BandwidthStore(Path(self._tmp.name) / "bandwidth.db")
+
+    def tearDown(self):
+        self.store._conn().close()
+        self._tmp.cleanup()
+
+    def test_hourly_and_daily_rollup(self):
+        self.store.record({"alice": traffic(100, 1000)}, {"alice": traffic(100, 1000)}, ts=NOW)
+        self.store.record({"alice": traffic(50, 500), "bob": traffic(0, 0)},
+                          {"alice": traffic(150, 1500), "bob": traffic(0, 0)}, ts=NOW + 60)
+        self.store.record({"alice": traffic(7, 70)}, {"alice": traffic(157, 1570)}, ts=NOW + HOUR)
+
+        bucket = int(NOW // HOUR * HOUR)
+        self.assertEqual(self.store.get_hourly("alice", NOW - DAY), [
+            {"ts": bucket, "uplink": 150, "downlink": 1500},
+            {"ts": bucket + HOUR, "uplink": 7, "downlink": 70},
+        ])
+        self.assertEqual(self.store.get_daily("2026-10-01"),
+                         {"alice": {"2026-10-15": {"uplink": 157, "downlink": 1570}}})
+        self.assertEqual(self.store.get_totals(), {"alice": {"uplink_acc": 157, "downlink_acc": 1570}})
+        # Zero deltas add no rows, but the session counters are still replaced
+        self.assertEqual(self.store.get_hourly("bob", 0), [])
+        self.assertEqual(self.store.get_prev_session(), {"alice": traffic(157, 1570)})
+        self.assertEqual(self.store.last_update, NOW + HOUR)
+
+    def test_period_totals(self):
+        self.store.record({"alice": traffic(1, 10)}, {}, ts=NOW - 10 * DAY)
+        self.store.record({"alice": traffic(2, 20)}, {}, ts=NOW - 3 * DAY)
+        self.store.record({"alice": traffic(8, 80)}, {}, ts=NOW - 20 * DAY)  # last month
+        self.store.record({"alice": traffic(4, 40)}, {}, ts=NOW)
+        totals = self.store.get_period_totals("2026-10-15", "2026-10-12", "2026-10-01")
+        self.assertEqual(totals["alice"], {
+            "today_uplink": 4, "today_downlink": 40,
+            "week_uplink": 6, "week_downlink": 60,
+            "month_uplink": 7, "month_downlink": 70,
+        })
+
+    def test_retention(self):
+        old_hour = NOW - (panel.BandwidthStore.HOURLY_RETENTION_DAYS + 1) * DAY
+        old_day = NOW - (panel.BandwidthStore.DAILY_RETENTION_DAYS + 1) * DAY
+        self.store.record({"alice": traffic(1, 1)}, {}, ts=old_day)
+        self.store.record({"alice": traffic(2, 2)}, {}, ts=old_hour)
+        self.store.record({"alice": traffic(3, 3)}, {}, ts=NOW)
+
+        # Hourly buckets go after a month, days after the daily retention
+        self.assertEqual([h["uplink"] for h in self.store.get_hourly("alice", 0)], [3])
+        days = self.store.get_daily("2000-01-01")["alice"]
+        self.assertEqual([d["uplink"] for d in days.values()], [2, 3])
+        # Pruning never touches the running totals
+        self.assertEqual(self.store.get_totals()["alice"]["uplink_acc"], 6)
+
+    def test_prunes_once_per_day(self):
+        self.store.record({"alice": traffic(1, 1)}, {}, ts=NOW)
+        self.store._conn().execute(
+            "INSERT INTO hourly (username, bucket, uplink, downlink) VALUES ('alice', 0, 9, 9)")
+        self.store.record({"alice": traffic(1, 1)}, {}, ts=NOW + 60)
+        self.assertEqual(self.store.get_hourly("alice", 0)[0]["uplink"], 9)
+        self.store.record({"alice": traffic(1, 1)}, {}, ts=NOW + DAY)
+        self.assertNotEqual(self.store.get_hourly("alice", 0)[0]["ts"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Tests for the /proc/net/tcp connection scanner and its summaries.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import tempfile
+import unittest
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+HEADER = ("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt"
+          "   uid  timeout inode\n")
+
+PROC_NET_TCP = HEADER + """\
+   0: 00000000:01BB 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 11111 1 0000000000000000 100 0 0 10 0
+   1: 0A00000A:01BB 0F02000A:D431 01 00000000:00000000 02:000A7D6B 00000000  1001        0 22222 1 0000000000000000 20 4 30 10 -1
+   2: 0A00000A:01BB 0F02000A:D432 06 00000000:00000000 03:00001770 00000000     0        0 0 3 0000000000000000
+   3: 0A00000A:0016 0F02000A:D433 01 00000000:00000000 02:000A7D6B 00000000     0        0 33333 1 0000000000000000 20 4 30 10 -1
+   4: 0A00000A:11BB 0F02000A:D434 01 00000000:00000000 02:000A7D6B 00000000     0        0 44444 1 0000000000000000 20 4 30 10 -1
+"""
+
+PROC_NET_TCP6 = HEADER + """\
+   0: 00000000000000000000000000000000:01BB 00000000000000000000000000000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 55555 1 0000000000000000 100 0 0 10 0
+   1: 0000000000000000FFFF00000A00000A:01BB 0000000000000000FFFF00000F02000A:E000 01 00000000:00000000 02:000A7D6B 00000000  1001        0 66666 1 0000000000000000 20 4 30 10 -1
+   2: B80D0120000000000000000001000000:01BB B80D0120000000000000000002000000:E001 08 00000000:00000000 00:00000000 00000000  1001        0 77777 1 0000000000000000 20 4 30 10 -1
+"""
+
+
+class DecodeProcAddrTest(unittest.TestCase):
+
+    def test_ipv4(self):
+        self.assertEqual(panel._decode_proc_addr("0100007F:01BB"), ("127.0.0.1", 443))
+        self.assertEqual(panel._decode_proc_addr("0F02000A:D431"), ("10.0.2.15", 54321))
+
+    def test_ipv6(self):
+        self.assertEqual(panel._decode_proc_addr("B80D0120000000000000000001000000:0016"),
+                         ("2001:db8::1", 22))
+        self.assertEqual(panel._decode_proc_addr("00000000000000000000000001000000:0050"), ("::1", 80))
+
+    def test_ipv4_mapped_ipv6(self):
+        self.assertEqual(panel._decode_proc_addr("0000000000000000FFFF00000100007F:01BB"),
+                         ("127.0.0.1", 443))
+
+    def test_format_endpoint(self):
+        self.assertEqual(panel._format_endpoint("10.0.0.1", 443), "10.0.0.1:443")
+        self.assertEqual(panel._format_endpoint("2001:db8::1", 443), "[2001:db8::1]:443")
+        self.assertEqual(panel._endpoint_ip("[2001:db8::1]:443"), "2001:db8::1")
+
+
+class ReadSocketsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self._tmp.name)
+        (tmp / "tcp").write_text(PROC_NET_TCP)
+        (tmp / "tcp6").write_text(PROC_NET_TCP6)
+        self.paths = (str(tmp / "tcp"), str(tmp / "tcp6"))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_filters_on_local_port_and_skips_listeners(self):
+        sockets = panel.ConnectionScanner._read_sockets([443], self.paths)
+        self.assertEqual([s[3] for s in sockets], ["22222", "0", "66666", "77777"])
+        self.assertEqual(sockets[0], ("01", "0A00000A:01BB", "0F02000A:D431", "22222"))
+
+    def test_port_match_is_exact(self):
+        # 0x11BB ends in "1BB" too; only the full four hex digits count
+        sockets = panel.ConnectionScanner._read_sockets([4539], self.paths)
+        self.assertEqual([s[3] for s in sockets], ["44444"])
+        self.assertEqual(panel.ConnectionScanner._read_sockets([22, 8443], self.paths)[0][3], "33333")
+
+    def test_missing_or_empty_files(self):
+        empty = Path(self._tmp.name) / "empty"
+        empty.write_text("")
+        self.assertEqual(panel.ConnectionScanner._read_sockets([443], (str(empty), "/nonexistent/tcp")), [])
+
+
+class SummaryTest(unittest.TestCase):
+
+    CONNECTIONS = [
+        {"state": "ESTAB", "local": "10.0.0.10:443", "remote": "10.0.2.15:54321",
+         "process": "sshd", "pid": 10, "user": "alice"},
+        {"state": "ESTAB", "local": "10.0.0.10:443", "remote": "10.0.2.15:54322",
+         "process": "sshd", "pid": 11, "user": "bob"},
+        {"state": "TIME-WAIT", "local": "10.0.0.10:443", "remote": "[2001:db8::2]:57345",
+         "process": "", "pid": None, "user": ""},
+    ]
+
+    def test_summarize(self):
+        summary = panel.summarize_connections(self.CONNECTIONS)
+        self.assertEqual(summary["total"], 3)
+        self.assertEqual(summary["unique_remotes"], 2)
+        self.assertEqual(summary["by_state"], {"ESTAB": 2, "TIME-WAIT": 1})
+        self.assertEqual(summary["by_user"], {"alice": 1, "bob": 1, "-": 1})
+        self.assertEqual(summary["top_remotes"][0], {"ip": "10.0.2.15", "count": 2, "users": ["alice", "bob"]})
+
+    def test_filter(self):
+        self.assertEqual(len(panel.filter_connections(self.CONNECTIONS, state="ESTAB")), 2)
+        self.assertEqual(len(panel.filter_connections(self.CONNECTIONS, user="-")), 1)
+        self.assertEqual(len(panel.filter_connections(self.CONNECTIONS, query="2001:db8")), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
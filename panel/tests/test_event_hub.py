@@ -0,0 +1,84 @@
+"""Tests for the SSE EventHub: subscriptions, cached snapshots and slow subscribers.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import queue
+import time
+import unittest
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+
+class EventHubTest(unittest.TestCase):
+
+    def setUp(self):
+        # The hub thread is never started; tests drive _publish directly
+        self.hub = panel.EventHub({"overview": (5, lambda: {"cpu": 1}),
+                                   "users": (30, lambda: {"count": 2})})
+
+    def test_subscribe_and_unsubscribe(self):
+        a = self.hub.subscribe(["overview"])
+        b = self.hub.subscribe(["overview", "users"])
+        self.assertEqual(self.hub.subscriber_count(), 2)
+        self.assertEqual(self.hub._due, {"overview", "users"})
+
+        self.hub._publish("users", {"count": 2})
+        self.assertTrue(a.empty())
+        self.assertEqual(b.get_nowait(), b'event: users\ndata: {"count":2}\n\n')
+
+        self.hub.unsubscribe(b)
+        self.hub.unsubscribe(b)  # a second unsubscribe is harmless
+        self.hub._publish("overview", {"cpu": 1})
+        self.assertEqual(self.hub.subscriber_count(), 1)
+        self.assertTrue(b.empty())
+        self.assertFalse(a.empty())
+
+    def test_fresh_snapshot_queued_on_subscribe(self):
+        self.hub._publish("overview", {"cpu": 1})
+        self.hub._due.clear()
+        q = self.hub.subscribe(["overview"])
+        self.assertEqual(q.get_nowait(), b'event: overview\ndata: {"cpu":1}\n\n')
+        self.assertEqual(self.hub._due, set())
+
+    def test_since_skips_snapshot_within_interval(self):
+        self.hub._publish("overview", {"cpu": 1})
+        q = self.hub.subscribe(["overview", "users"], since=time.time())
+        # The client already has both; nothing is queued or scheduled
+        self.assertTrue(q.empty())
+        self.assertEqual(self.hub._due, set())
+        self.assertIsNone(self.hub._latest["users"][1])
+
+        stale = self.hub.subscribe(["users"], since=time.time() - 60)
+        self.assertTrue(stale.empty())
+        self.assertEqual(self.hub._due, {"users"})
+
+    def test_slow_subscriber_drops_events(self):
+        slow = self.hub.subscribe(["overview"])
+        fast = self.hub.subscribe(["overview"], queue.Queue())
+        for i in range(panel.EventHub.QUEUE_SIZE + 10):
+            self.hub._publish("overview", {"cpu": i})
+        self.assertEqual(slow.qsize(), panel.EventHub.QUEUE_SIZE)
+        self.assertEqual(fast.qsize(), panel.EventHub.QUEUE_SIZE + 10)
+        # The backlog keeps the oldest events; newer ones were dropped, not raised
+        self.assertIn(b'"cpu":0', slow.get_nowait())
+
+    def test_custom_subscriber_object(self):
+        class Sink:
+            def __init__(self):
+                self.items = []
+
+            def put_nowait(self, item):
+                self.items.append(item)
+
+        sink = self.hub.subscribe(["users"], Sink())
+        self.hub._publish("users", {"count": 3})
+        self.assertEqual(len(sink.items), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
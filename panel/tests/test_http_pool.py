@@ -0,0 +1,70 @@
+"""Tests for the pooled HTTP server's keep-alive limits, over loopback without TLS.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import http.client
+import importlib.util
+import threading
+import time
+import unittest
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+
+class PooledKeepAliveTest(unittest.TestCase):
+
+    def setUp(self):
+        panel._config = panel.Config()
+        panel._sessions = panel.SessionManager(b"test-secret")
+        self.addCleanup(setattr, panel.PanelHandler, "keepalive_timeout", panel.PanelHandler.keepalive_timeout)
+        panel.PanelHandler.keepalive_timeout = 5
+        self.server = panel.PooledHTTPServer(("127.0.0.1", 0), panel.PanelHandler, workers=4, queue_size=8)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, client=None):
+        if client is None:
+            client = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=5)
+            self.clients.append(client)
+        client.request("GET", "/api/users")
+        response = client.getresponse()
+        response.read()
+        return client, response
+
+    def test_keep_alive_capped_below_worker_count(self):
+        self.assertEqual(self.server.keepalive_limit, 3)
+        kept = [self.get()[1] for _ in range(2)]
+        self.assertTrue(all(r.getheader("Connection") is None for r in kept))
+        # The third connection would leave one worker free; it is closed instead
+        _, third = self.get()
+        self.assertEqual(third.getheader("Connection"), "close")
+        self.assertTrue(self.wait_busy(2))
+
+    def wait_busy(self, count):
+        deadline = time.monotonic() + 3
+        while self.server.busy != count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return self.server.busy == count
+
+    def test_idle_connection_frees_its_worker(self):
+        panel.PanelHandler.keepalive_timeout = 0.3
+        client, first = self.get()
+        self.assertIsNone(first.getheader("Connection"))
+        _, second = self.get(client)  # reused within the keep-alive window
+        self.assertEqual(second.status, 401)
+        self.assertTrue(self.wait_busy(0))
+        self.assertEqual(client.sock.recv(1), b"")  # closed by the server
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Tests for reading SSH accounting counters out of `iptables-save -c` output.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import unittest
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+MANGLE = """\
+# Generated by iptables-save v1.8.7 on Sat Oct 17 12:00:00 2026
+*mangle
+:PREROUTING ACCEPT [1200:98000]
+:INPUT ACCEPT [1100:90000]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [900:120000]
+:POSTROUTING ACCEPT [900:120000]
+:PROXY_USER_alice_IN - [0:0]
+:PROXY_USER_alice_OUT - [0:0]
+:PROXY_USER_bob_IN - [0:0]
+:PROXY_USER_bob_OUT - [0:0]
+[55:4096] -A OUTPUT -m owner --uid-owner 1001 -j PROXY_USER_alice_OUT
+[0:0] -A INPUT -j PROXY_USER_bob_IN
+[55:4096] -A PROXY_USER_alice_OUT -j RETURN
+[80:5000000000] -A PROXY_USER_alice_IN -m connmark --mark 0x3e9 -j RETURN
+[3:180] -A PROXY_USER_alice_IN -j RETURN
+COMMIT
+# Completed on Sat Oct 17 12:00:00 2026
+"""
+
+
+class IptablesSaveTest(unittest.TestCase):
+
+    def test_rule_counters_per_chain(self):
+        chains = panel.BandwidthMonitor._parse_iptables_save(MANGLE)
+        self.assertEqual(chains["PROXY_USER_alice_OUT"], [4096])
+        # Rules keep their order, so [0] is the first rule of the chain
+        self.assertEqual(chains["PROXY_USER_alice_IN"], [5000000000, 180])
+        self.assertEqual(chains["OUTPUT"], [4096])
+
+    def test_declared_chains_without_rules(self):
+        chains = panel.BandwidthMonitor._parse_iptables_save(MANGLE)
+        # Present but empty, unlike a chain that does not exist at all
+        self.assertEqual(chains["PROXY_USER_bob_OUT"], [])
+        self.assertEqual(chains["FORWARD"], [])
+        self.assertNotIn("PROXY_USER_carol_OUT", chains)
+
+    def test_malformed_lines_skipped(self):
+        chains = panel.BandwidthMonitor._parse_iptables_save(
+            ":PROXY_USER_x_IN - [0:0]\n"
+            "[12] -A PROXY_USER_x_IN -j RETURN\n"
+            "[1:oops] -A PROXY_USER_x_IN -j RETURN\n"
+            "[1:2] -I PROXY_USER_x_IN -j RETURN\n"
+            "[4:64] -A PROXY_USER_x_IN -j RETURN\n")
+        self.assertEqual(chains, {"PROXY_USER_x_IN": [64]})
+
+    def test_empty_dump(self):
+        self.assertEqual(panel.BandwidthMonitor._parse_iptables_save(""), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests for parsing `journalctl -o json` output and its cursors.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import json
+import unittest
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+CURSOR_1 = ("s=6f0e1c2d3b4a59687766554433221100;i=1a2b;b=00112233445566778899aabbccddeeff;"
+            "m=2b9e1f0;t=640a1b2c3d4e5;x=9f8e7d6c5b4a3921")
+CURSOR_2 = CURSOR_1.replace("i=1a2b", "i=1a2c")
+
+
+def record(cursor, message, priority="6", **fields):
+    entry = {"__CURSOR": cursor, "__REALTIME_TIMESTAMP": "1792056000123456", "PRIORITY": priority,
+             "SYSLOG_IDENTIFIER": "xray", "_PID": "812", "MESSAGE": message}
+    entry.update(fields)
+    return json.dumps(entry)
+
+
+class JournalTest(unittest.TestCase):
+
+    def test_entries_and_last_cursor(self):
+        text = "\n".join([
+            record(CURSOR_1, "2026/10/15 10:20:00 [Warning] core: something odd"),
+            record(CURSOR_2, "Started Xray Service.", priority="5", SYSLOG_IDENTIFIER="systemd", _PID="1"),
+        ])
+        entries, cursor = panel.SystemInfo.parse_journal(text, "xray")
+        self.assertEqual(cursor, CURSOR_2)
+        self.assertEqual(entries[0], {
+            "ts": 1792056000.123456, "level": "warning", "ident": "xray", "pid": "812",
+            "message": "2026/10/15 10:20:00 [Warning] core: something odd",
+        })
+        self.assertEqual((entries[1]["ident"], entries[1]["level"]), ("systemd", "info"))
+
+    def test_cursor_kept_without_new_entries(self):
+        self.assertEqual(panel.SystemInfo.parse_journal("", "xray", CURSOR_1), ([], CURSOR_1))
+        self.assertEqual(panel.SystemInfo.parse_journal("", "xray"), ([], None))
+
+    def test_malformed_lines_skipped(self):
+        text = "-- No entries --\n" + record(CURSOR_1, "ok") + "\n{\"truncated\": "
+        entries, cursor = panel.SystemInfo.parse_journal(text, "xray", "older")
+        self.assertEqual([e["message"] for e in entries], ["ok"])
+        self.assertEqual(cursor, CURSOR_1)
+
+    def test_record_without_cursor_keeps_previous(self):
+        text = record(CURSOR_1, "a") + "\n" + json.dumps({"MESSAGE": "b"})
+        entries, cursor = panel.SystemInfo.parse_journal(text, "ssh")
+        self.assertEqual(cursor, CURSOR_1)
+        self.assertEqual(entries[1]["ident"], "ssh")
+
+    def test_message_encodings_and_levels(self):
+        text = "\n".join([
+            record(CURSOR_1, list(b"caf\xc3\xa9 \xff")),
+            record(CURSOR_1, None, priority="2"),
+            record(CURSOR_1, "plain", priority="7"),
+            record(CURSOR_1, "[Error] tag beats priority", priority="6"),
+        ])
+        entries, _ = panel.SystemInfo.parse_journal(text, "xray")
+        self.assertEqual(entries[0]["message"], "café �")
+        self.assertEqual((entries[1]["message"], entries[1]["level"]), ("", "error"))
+        self.assertEqual(entries[2]["level"], "debug")
+        self.assertEqual(entries[3]["level"], "error")
+
+    def test_cursor_validation(self):
+        self.assertTrue(panel.JOURNAL_CURSOR_RE.match(CURSOR_1))
+        for bad in ("", "s=1;i=2 --since=today", "s=1\n", "x" * 257, "s=1;$(id)"):
+            self.assertIsNone(panel.JOURNAL_CURSOR_RE.match(bad), bad)
+
+
+if __name__ == "__main__":
+    unittest.main()
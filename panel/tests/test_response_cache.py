@@ -0,0 +1,99 @@
+"""Tests for ResponseCache: TTLs, single-flight computation and error propagation.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import threading
+import time
+import unittest
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+WAITERS = 8
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = panel.ResponseCache({"users": 60, "connections": 0})
+        self.release = threading.Event()
+        self.computes = 0
+
+    def slow_compute(self, result):
+        def compute():
+            self.computes += 1
+            self.release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return compute
+
+    def run_concurrently(self, key, compute):
+        """Start WAITERS callers, let the leader finish once the rest are waiting."""
+        results = [None] * WAITERS
+
+        def call(i):
+            try:
+                results[i] = self.cache.get(key, compute)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(WAITERS)]
+        for t in threads:
+            t.start()
+        deadline = time.monotonic() + 5
+        while self.cache.stats["coalesced"] < WAITERS - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.release.set()
+        for t in threads:
+            t.join(5)
+        return results
+
+    def test_concurrent_callers_share_one_compute(self):
+        value = {"users": ["alice"]}
+        results = self.run_concurrently("users", self.slow_compute(value))
+        self.assertEqual(self.computes, 1)
+        self.assertTrue(all(r is value for r in results))
+        self.assertEqual(self.cache.stats, {"misses": 1, "coalesced": WAITERS - 1})
+        # Cached afterwards
+        self.assertIs(self.cache.get("users", self.slow_compute(None)), value)
+        self.assertEqual(self.cache.stats["hits"], 1)
+
+    def test_error_reaches_every_waiter(self):
+        error = RuntimeError("xray down")
+        results = self.run_concurrently("users", self.slow_compute(error))
+        self.assertEqual(self.computes, 1)
+        self.assertTrue(all(r is error for r in results))
+        # Failures are not cached; the next caller computes again
+        self.assertEqual(self.cache.get("users", lambda: "ok"), "ok")
+
+    def test_ttl_per_name_and_tuple_keys(self):
+        self.cache.get(("connections", (443,)), lambda: "a")
+        self.assertEqual(self.cache.get(("connections", (443,)), lambda: "b"), "b")
+        self.cache.get(("users", 1), lambda: "page 1")
+        self.assertEqual(self.cache.get(("users", 1), lambda: "again"), "page 1")
+        self.assertEqual(self.cache.get(("users", 2), lambda: "page 2"), "page 2")
+
+    def test_invalidate(self):
+        self.cache.get("users", lambda: "old")
+        self.cache.get(("users", 2), lambda: "old page")
+        self.cache.invalidate("connections")
+        self.assertEqual(self.cache.get("users", lambda: "new"), "old")
+        self.cache.invalidate("users")
+        self.assertEqual(self.cache.get("users", lambda: "new"), "new")
+        self.assertEqual(self.cache.get(("users", 2), lambda: "new page"), "new page")
+
+    def test_invalidated_while_computing_is_not_cached(self):
+        def compute():
+            self.cache.invalidate("users")
+            return "stale"
+        self.assertEqual(self.cache.get("users", compute), "stale")
+        self.assertEqual(self.cache.get("users", lambda: "fresh"), "fresh")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Tests for the route table: matching, path parameters, 404/405 and Allow.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+Route = panel.Route
+
+
+class RouterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.router = panel.Router([
+            Route("GET", "/api/users", "_get_users"),
+            Route("POST", "/api/users", "_handle_add_user", csrf=True),
+            Route("GET", "/api/users/<username>/config", "_get_user_config"),
+            Route("DELETE", "/api/users/<username>", "_handle_delete_user", csrf=True),
+            Route("POST", "/api/users/<username>/password", "_handle_update_password", csrf=True),
+        ])
+
+    def test_exact_match(self):
+        route, params = self.router.match("POST", "/api/users")
+        self.assertEqual((route.handler, params), ("_handle_add_user", {}))
+        self.assertTrue(route.csrf)
+
+    def test_params_are_unquoted(self):
+        route, params = self.router.match("GET", "/api/users/al%69ce/config")
+        self.assertEqual(route.name, "GET /api/users/<username>/config")
+        self.assertEqual(params, {"username": "alice"})
+
+    def test_params_do_not_span_segments(self):
+        self.assertEqual(self.router.match("DELETE", "/api/users/a/b"), (None, []))
+        self.assertEqual(self.router.match("GET", "/api/users//config"), (None, []))
+
+    def test_method_not_allowed_lists_methods(self):
+        self.assertEqual(self.router.match("DELETE", "/api/users"), (None, ["GET", "POST"]))
+        self.assertEqual(self.router.match("GET", "/api/users/bob"), (None, ["DELETE"]))
+        self.assertEqual(self.router.match("PUT", "/api/users/bob/password"), (None, ["POST"]))
+
+    def test_not_found(self):
+        self.assertEqual(self.router.match("GET", "/api/nope"), (None, []))
+        # Paths are matched whole, without a trailing slash
+        self.assertEqual(self.router.match("GET", "/api/users/"), (None, []))
+
+    def test_route_table_handlers_exist(self):
+        for route in panel.ROUTER.routes:
+            self.assertTrue(callable(getattr(panel.PanelHandler, route.handler, None)), route.name)
+        names = [route.name for route in panel.ROUTER.routes]
+        self.assertEqual(len(names), len(set(names)))
+
+
+class DispatchTest(unittest.TestCase):
+    """The 404/405/401 answers PanelHandler builds from a failed match."""
+
+    def setUp(self):
+        panel._config = panel.Config()
+        panel._sessions = panel.SessionManager(b"test-secret")
+        self.server = SimpleNamespace(max_streams=None, saturated=lambda: False)
+
+    def request(self, method, path, cookie=None):
+        raw = f"{method} {path} HTTP/1.1\r\nHost: panel\r\n"
+        if cookie:
+            raw += f"Cookie: {cookie}\r\n"
+        handler = panel.BufferedPanelHandler((raw + "\r\n").encode(), ("127.0.0.1", 40000), self.server)
+        head = handler.wfile.getvalue().split(b"\r\n\r\n", 1)[0].decode()
+        status = int(head.split()[1])
+        headers = dict(line.split(": ", 1) for line in head.split("\r\n")[1:])
+        return status, headers
+
+    def test_405_with_allow(self):
+        status, headers = self.request("POST", "/dashboard")
+        self.assertEqual(status, 405)
+        self.assertEqual(headers["Allow"], "GET")
+
+    def test_404(self):
+        self.assertEqual(self.request("GET", "/nope")[0], 404)
+
+    def test_unmatched_api_path_needs_session(self):
+        self.assertEqual(self.request("GET", "/api/nope")[0], 401)
+        self.assertEqual(self.request("PUT", "/api/users")[0], 401)
+
+        cookie = "session=" + panel._sessions.create_token("admin")
+        self.assertEqual(self.request("GET", "/api/nope", cookie)[0], 404)
+        status, headers = self.request("PUT", "/api/users", cookie)
+        self.assertEqual(status, 405)
+        self.assertEqual(headers["Allow"], "GET, POST")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Tests for recognising SSH sessions from sshd process titles.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import unittest
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+parse_title = panel.SshSessionTracker.parse_title
+
+
+class SshdTitleTest(unittest.TestCase):
+
+    def test_user_child(self):
+        self.assertEqual(parse_title("sshd: alice@pts/0"), ("alice", False))
+        self.assertEqual(parse_title("sshd: alice@pts/12"), ("alice", False))
+        self.assertEqual(parse_title("sshd: proxy_user-01@notty"), ("proxy_user-01", False))
+        self.assertEqual(parse_title("sshd-session: alice"), ("alice", False))
+
+    def test_privileged_monitor(self):
+        self.assertEqual(parse_title("sshd: alice [priv]"), ("alice", True))
+        self.assertEqual(parse_title("sshd-session: Bob_2 [priv]"), ("Bob_2", True))
+
+    def test_names_accepted_by_add_user(self):
+        # add-user.sh: ^[a-zA-Z0-9_-]+$, 3 to 32 characters
+        self.assertEqual(parse_title("sshd: abc@pts/1"), ("abc", False))
+        self.assertEqual(parse_title(f"sshd: {'a' * 32} [priv]"), ("a" * 32, True))
+        self.assertIsNone(parse_title("sshd: ab@pts/1"))
+        self.assertIsNone(parse_title(f"sshd: {'a' * 33}@pts/1"))
+
+    def test_name_must_be_whole(self):
+        # Not a panel user, and must not be counted as "alice"
+        self.assertIsNone(parse_title("sshd: alice.smith@pts/0"))
+        self.assertIsNone(parse_title("sshd: alice$ [priv]"))
+
+    def test_not_logged_in(self):
+        self.assertIsNone(parse_title("sshd: unknown [net]"))
+        self.assertIsNone(parse_title("sshd: alice [preauth]"))
+        self.assertIsNone(parse_title("sshd: alice [net]"))
+        self.assertIsNone(parse_title("sshd: [accepted]"))
+        self.assertIsNone(parse_title("sshd: /usr/sbin/sshd -D [listener] 0 of 10-100 startups"))
+        self.assertIsNone(parse_title("/usr/sbin/sshd -D"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""Tests for the live throughput sampler reading through the shared xray snapshot.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from test_xray_api import Client, StubXray, panel, stat_message
+
+
+def traffic(uplink):
+    return ("ok", stat_message("user>>>alice@proxy>>>traffic>>>uplink", uplink))
+
+
+class ThroughputSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubXray({"QueryStats": traffic(1000)})
+        self.stats = panel.XrayStats(SimpleNamespace(xray_stats_port=self.stub.port),
+                                     client=Client(port=self.stub.port, timeout=2))
+        self.cli_calls = []
+        self.stats._query_cli = lambda: self.cli_calls.append(1)  # a failing CLI returns None
+        self.monitor = SimpleNamespace(
+            read_counters=lambda max_age=None: self.stats.get_user_stats(max_age),
+            counters_taken_at=lambda: self.stats.taken_at,
+            throughput=panel.ThroughputTracker(samples=10),
+        )
+
+    def tearDown(self):
+        self.stats.client.close()
+        self.stub.close()
+
+    def test_failed_query_does_not_fork_every_tick(self):
+        sampler = panel.ThroughputSampler(self.monitor, interval=0)
+        self.stub.replies["QueryStats"] = ("status", 14, "unavailable")
+        with mock.patch.object(panel, "log"):
+            for _ in range(10):
+                sampler.sample()
+        self.assertEqual(len(self.stub.calls), 1)
+        self.assertEqual(len(self.cli_calls), 1)
+
+    def test_reused_snapshot_is_not_sampled_twice(self):
+        sampler = panel.ThroughputSampler(self.monitor, interval=60)
+        sampler.sample()
+        sampler.sample()  # within the interval: the same snapshot, no new sample
+        self.assertEqual(len(self.stub.calls), 1)
+        self.assertEqual(self.monitor.throughput.get_history("alice"), [])
+
+        self.stats._taken_at -= 61
+        self.stub.replies["QueryStats"] = traffic(1500)
+        sampler.sample()
+        self.assertEqual(len(self.stub.calls), 2)
+        history = self.monitor.throughput.get_history("alice")
+        self.assertEqual(len(history), 1)
+        self.assertGreater(history[0]["uplink_bps"], 0)
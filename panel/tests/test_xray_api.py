@@ -0,0 +1,345 @@
+"""Tests for the built-in Xray gRPC client: HPACK, protobuf and a loopback h2 stub.
+
+Run with: python -m unittest discover -s panel/tests
+"""
+
+import importlib.util
+import socket
+import struct
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+_spec = importlib.util.spec_from_file_location("proxy_panel", Path(__file__).resolve().parents[1] / "proxy-panel.py")
+panel = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(panel)
+
+Client = panel.XrayApiClient
+
+# RFC 7541 Appendix C.4: requests with Huffman coding
+RFC_C4 = [
+    ("828684418cf1e3c2e5f23a6ba0ab90f4ff",
+     [(":method", "GET"), (":scheme", "http"), (":path", "/"), (":authority", "www.example.com")], 57),
+    ("828684be5886a8eb10649cbf",
+     [(":method", "GET"), (":scheme", "http"), (":path", "/"), (":authority", "www.example.com"),
+      ("cache-control", "no-cache")], 110),
+    ("828785bf408825a849e95ba97d7f8925a849e95bb8e8b4bf",
+     [(":method", "GET"), (":scheme", "https"), (":path", "/index.html"), (":authority", "www.example.com"),
+      ("custom-key", "custom-value")], 164),
+]
+
+# RFC 7541 Appendix C.6: responses with Huffman coding and a 256-byte dynamic table
+RFC_C6 = [
+    ("488264025885aec3771a4b6196d07abe941054d444a8200595040b8166e082a62d1bff6e919d29ad171863c78f0b97c8e9"
+     "ae82ae43d3",
+     [(":status", "302"), ("cache-control", "private"), ("date", "Mon, 21 Oct 2013 20:13:21 GMT"),
+      ("location", "https://www.example.com")], 222),
+    ("4883640effc1c0bf",
+     [(":status", "307"), ("cache-control", "private"), ("date", "Mon, 21 Oct 2013 20:13:21 GMT"),
+      ("location", "https://www.example.com")], 222),
+    ("88c16196d07abe941054d444a8200595040b8166e084a62d1bffc05a839bd9ab77ad94e7821dd7f2e6c7b335dfdfcd5b39"
+     "60d5af27087f3672c1ab270fb5291f9587316065c003ed4ee5b1063d5007",
+     [(":status", "200"), ("cache-control", "private"), ("date", "Mon, 21 Oct 2013 20:13:22 GMT"),
+      ("location", "https://www.example.com"), ("content-encoding", "gzip"),
+      ("set-cookie", "foo=ASDJKHQKBZXOQWEOPIUAXQWEOIU; max-age=3600; version=1")], 215),
+]
+
+# "سرور در دسترس نیست" in UTF-8, Huffman coded by an independent encoder
+NON_ASCII_TEXT = "سرور در دسترس نیست"
+NON_ASCII_HUFFMAN = (
+    "ffff27fff8bfffc9fffe1ffff2ffffadfffe4ffff0a9fffe4ffffd9fffe4ffff0a9fffe4ffffd9fffe4ffff17fff93fffde"
+    "ffff27fff87fffc9fffe253fffcbfffeafffffd3ffff77fffc9fffe2ffff27fffbd"
+)
+
+def huffman_encode(data):
+    """Encode with the panel's own code table, padding with the EOS prefix."""
+    codes = {sym: key for key, sym in panel._HUFFMAN_DECODE.items()}
+    value, bits = 0, 0
+    for byte in data:
+        code, length = codes[byte]
+        value, bits = (value << length) | code, bits + length
+    pad = -bits % 8
+    value, bits = (value << pad) | ((1 << pad) - 1), bits + pad
+    return value.to_bytes(bits // 8, "big")
+
+
+class HpackTest(unittest.TestCase):
+
+    def test_rfc7541_requests(self):
+        decoder = panel.HpackDecoder()
+        for block, headers, table_size in RFC_C4:
+            self.assertEqual(decoder.decode(bytes.fromhex(block)), headers)
+            self.assertEqual(decoder.size, table_size)
+
+    def test_rfc7541_responses_with_eviction(self):
+        decoder = panel.HpackDecoder(max_size=256)
+        for block, headers, table_size in RFC_C6:
+            self.assertEqual(decoder.decode(bytes.fromhex(block)), headers)
+            self.assertEqual(decoder.size, table_size)
+
+    def test_non_ascii_huffman(self):
+        decoded = panel._huffman_decode(bytes.fromhex(NON_ASCII_HUFFMAN))
+        self.assertEqual(decoded.decode(), NON_ASCII_TEXT)
+
+    def test_every_symbol_round_trips(self):
+        data = bytes(range(256))
+        self.assertEqual(panel._huffman_decode(huffman_encode(data)), data)
+
+    def test_invalid_padding_rejected(self):
+        # "a" is 00011 (5 bits); zero padding and a full byte of padding are both invalid
+        with self.assertRaises(ValueError):
+            panel._huffman_decode(b"\x18")
+        with self.assertRaises(ValueError):
+            panel._huffman_decode(b"\x1f\xff")
+        with self.assertRaises(ValueError):
+            panel._huffman_decode(b"\xff\xff\xff\xff")  # EOS
+
+
+class ProtobufTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        message = panel._pb_message((1, "user>>>alice@proxy>>>traffic>>>uplink"), (2, True), (3, 0), (4, 300))
+        fields = panel._pb_decode(message)
+        self.assertEqual(fields[1], [b"user>>>alice@proxy>>>traffic>>>uplink"])
+        self.assertEqual(fields[2], [1])
+        self.assertNotIn(3, fields)  # proto3 default omitted
+        self.assertEqual(fields[4], [300])
+
+    def test_negative_int64(self):
+        value = panel._pb_decode(panel._pb_field(2, -5))[2][0]
+        self.assertEqual(panel._pb_int64(value), -5)
+
+
+class StubXray:
+    """Loopback HTTP/2 server answering gRPC calls with a canned reply per method.
+
+    A reply is ("ok", message), ("status", code, text), ("rst",) or ("close",).
+    """
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.calls = []
+        self.connections = 0
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        # shutdown() wakes the accept thread; close() alone would leave it accepting
+        try:
+            self._listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _recv_exact(conn, n):
+        data = b""
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    @staticmethod
+    def _literal(name, value, huffman=False):
+        # Literal with incremental indexing, so repeated trailers hit the dynamic table
+        value = value.encode()
+        if huffman:
+            value = huffman_encode(value)
+            return b"\x40" + panel._hpack_str_len(len(name)) + name.encode() + \
+                bytes([0x80 | len(value)]) + value
+        return b"\x40" + panel._hpack_str_len(len(name)) + name.encode() + panel._hpack_str_len(len(value)) + value
+
+    def _serve(self, conn):
+        decoder = panel.HpackDecoder()
+        frame = Client._frame
+        with conn:
+            try:
+                if self._recv_exact(conn, 24) != Client.H2_PREFACE:
+                    return
+                conn.sendall(frame(Client.FRAME_SETTINGS, 0, 0))
+                paths = {}
+                while True:
+                    header = self._recv_exact(conn, 9)
+                    length = int.from_bytes(header[:3], "big")
+                    ftype, flags, stream_id = struct.unpack(">BBI", header[3:])
+                    payload = self._recv_exact(conn, length)
+                    if ftype == Client.FRAME_HEADERS:
+                        paths[stream_id] = dict(decoder.decode(payload))[":path"]
+                    elif ftype == Client.FRAME_DATA and flags & Client.FLAG_END_STREAM:
+                        method = paths.pop(stream_id).rsplit("/", 1)[1]
+                        request = panel._pb_decode(payload[5:])
+                        self.calls.append((method, request))
+                        if not self._reply(conn, stream_id, self.replies[method]):
+                            return
+            except (ConnectionError, OSError):
+                return
+
+    def _reply(self, conn, stream_id, reply):
+        frame = Client._frame
+        if reply[0] == "close":
+            return False
+        if reply[0] == "rst":
+            conn.sendall(frame(Client.FRAME_RST_STREAM, 0, stream_id, struct.pack(">I", 8)))
+            return True
+        head = b"\x88" + self._literal("content-type", "application/grpc")
+        if reply[0] == "ok":
+            message = reply[1]
+            trailers = self._literal("grpc-status", "0")
+            conn.sendall(
+                frame(Client.FRAME_HEADERS, Client.FLAG_END_HEADERS, stream_id, head)
+                + frame(Client.FRAME_DATA, 0, stream_id, b"\x00" + struct.pack(">I", len(message)) + message)
+                + frame(Client.FRAME_HEADERS, Client.FLAG_END_HEADERS | Client.FLAG_END_STREAM, stream_id,
+                        trailers))
+        else:
+            # Trailers-only response; the message is percent-encoded UTF-8, Huffman coded on the wire
+            trailers = self._literal("grpc-status", str(reply[1])) + \
+                self._literal("grpc-message", reply[2], huffman=True)
+            conn.sendall(frame(Client.FRAME_HEADERS, Client.FLAG_END_HEADERS | Client.FLAG_END_STREAM,
+                               stream_id, head + trailers))
+        return True
+
+
+def stat_message(name, value):
+    return panel._pb_field(1, panel._pb_message((1, name), (2, value)))
+
+
+class XrayApiClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubXray({
+            "QueryStats": ("ok", stat_message("user>>>alice@proxy>>>traffic>>>downlink", 5_000_000_000)
+                           + stat_message("user>>>bob@proxy>>>traffic>>>uplink", 7)),
+            "GetStatsOnline": ("ok", panel._pb_field(1, panel._pb_message((1, "user>>>alice@proxy>>>online"),
+                                                                         (2, 3)))),
+            "GetStatsOnlineIpList": ("status", 5, "online%20map%20not%20found"),
+            "AlterInbound": ("ok", b""),
+            "GetAllOnlineUsers": ("rst",),
+        })
+        self.client = Client(port=self.stub.port, timeout=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.stub.close()
+
+    def test_query_stats(self):
+        stats = self.client.query_stats("user>>>", reset=True)
+        self.assertEqual(stats, {"user>>>alice@proxy>>>traffic>>>downlink": 5_000_000_000,
+                                 "user>>>bob@proxy>>>traffic>>>uplink": 7})
+        method, request = self.stub.calls[0]
+        self.assertEqual(method, "QueryStats")
+        self.assertEqual(request[1], [b"user>>>"])
+        self.assertEqual(request[2], [1])
+
+    def test_calls_share_one_connection(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get_stats_online("user>>>alice@proxy>>>online"), 3)
+        self.client.remove_user("vless-in", "alice@proxy")
+        self.assertEqual(self.stub.connections, 1)
+        method, request = self.stub.calls[-1]
+        self.assertEqual(method, "AlterInbound")
+        self.assertEqual(request[1], [b"vless-in"])
+
+    def test_add_user(self):
+        uuid = "0b3d5c1e-8f4a-4c2e-9d7b-1a2b3c4d5e6f"
+        for protocol, account_type in (("vless", b"xray.proxy.vless.Account"),
+                                       ("vmess", b"xray.proxy.vmess.Account")):
+            self.client.add_user("proxy", "carol@proxy", uuid, protocol, level=1)
+            method, request = self.stub.calls[-1]
+            self.assertEqual(method, "AlterInbound")
+            self.assertEqual(request[1], [b"proxy"])
+            operation = panel._pb_decode(request[2][0])
+            self.assertEqual(operation[1], [b"xray.app.proxyman.command.AddUserOperation"])
+            user = panel._pb_decode(panel._pb_decode(operation[2][0])[1][0])
+            self.assertEqual(user[1], [1])
+            self.assertEqual(user[2], [b"carol@proxy"])
+            account = panel._pb_decode(user[3][0])
+            self.assertEqual(account[1], [account_type])
+            self.assertEqual(panel._pb_decode(account[2][0])[1], [uuid.encode()])
+
+    def test_grpc_status_error(self):
+        with self.assertRaises(panel.XrayApiError) as ctx:
+            self.client.get_stats_online_ip_list("user>>>bob@proxy>>>online")
+        self.assertEqual(ctx.exception.status, 5)
+        self.assertIn("online map not found", str(ctx.exception))
+        # The connection stays usable after an application error
+        self.assertEqual(self.client.get_stats_online("user>>>alice@proxy>>>online"), 3)
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_reset_stream(self):
+        with self.assertRaises(panel.XrayApiError):
+            self.client.get_all_online_users()
+
+    def test_reconnects_after_dropped_connection(self):
+        self.assertEqual(self.client.get_stats_online("user>>>alice@proxy>>>online"), 3)
+        self.stub.replies["QueryStats"] = ("close",)
+        with self.assertRaises(panel.XrayApiError):
+            self.client.query_stats()
+        # One retry on the reused connection, then a fresh one that was also dropped
+        self.assertEqual(self.stub.connections, 2)
+        self.assertEqual(self.client.get_stats_online("user>>>alice@proxy>>>online"), 3)
+        self.assertEqual(self.stub.connections, 3)
+
+    def test_connection_refused(self):
+        # A port that was bound but never listened on refuses connections
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            client = Client(port=unused.getsockname()[1], timeout=1)
+            with self.assertRaises(panel.XrayApiError):
+                client.query_stats()
+
+
+class XrayStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubXray({
+            "QueryStats": ("ok", stat_message("user>>>alice@proxy>>>traffic>>>uplink", 42)),
+        })
+        self.stats = panel.XrayStats(SimpleNamespace(xray_stats_port=self.stub.port),
+                                     client=Client(port=self.stub.port, timeout=2))
+        self.cli_calls = []
+        self.stats._query_cli = lambda: self.cli_calls.append(1)  # a failing CLI returns None
+
+    def tearDown(self):
+        self.stats.client.close()
+        self.stub.close()
+
+    def test_backs_off_after_failure(self):
+        self.assertEqual(self.stats.get_user_stats(max_age=0), {"alice": {"uplink": 42, "downlink": 0}})
+        self.stub.replies["QueryStats"] = ("status", 14, "unavailable")
+        with mock.patch.object(panel, "log") as log:
+            for _ in range(5):
+                # The last counters are kept through the outage
+                self.assertEqual(self.stats.get_user_stats(max_age=0)["alice"]["uplink"], 42)
+            self.assertTrue(self.stats.backing_off)
+            self.assertEqual(len(self.stub.calls), 2)
+            self.assertEqual(len(self.cli_calls), 1)
+
+            # Still down when the window ends: one more attempt, no second warning
+            self.stats._retry_at = 0
+            self.stats.get_user_stats(max_age=0)
+            self.assertEqual(len(self.stub.calls), 3)
+            self.assertEqual(len(self.cli_calls), 2)
+            self.assertEqual([c.args[1] for c in log.call_args_list if len(c.args) > 1], ["WARN"])
+
+            self.stub.replies["QueryStats"] = ("ok", stat_message("user>>>alice@proxy>>>traffic>>>uplink", 50))
+            self.stats._retry_at = 0
+            self.assertEqual(self.stats.get_user_stats(max_age=0)["alice"]["uplink"], 50)
+            self.assertFalse(self.stats.backing_off)
+
+
+if __name__ == "__main__":
+    unittest.main()